@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post, Follow, Comment
 
 
@@ -9,6 +10,15 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ("text",)
     list_filter = ("pub_date", "text", "author")
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищем по полнотекстовому индексу вместо LIKE '%q%'"""
+        if not search_term or not search.available():
+            return super().get_search_results(request, queryset, search_term)
+        if not search.match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=search.matching_posts(search_term)), False
+
 
 admin.site.register(Group)
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,267 @@
+"""JSON API только для чтения: ленты постов, пост, комментарии, группы и
+подписки.
+
+Строки выбираются через `values()` одним запросом: автор и группа
+встраиваются из столбцов JOIN, модели не создаются. `?fields=` сужает и
+ответ, и список выбираемых столбцов. Страницы — курсорные, ETag
+считается по поколениям областей `fragments`, как у HTML-страниц.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.views.decorators.http import require_safe
+
+from . import fragments, timeline
+from .decorators import query_budget
+from .models import ApiToken, Comment, Follow, Group, Post, User
+from .paginators import CursorPaginator
+
+IMAGE_STORAGE = Post._meta.get_field('image').storage
+
+
+def _author(prefix):
+    def build(row):
+        return {'id': row[f'{prefix}_id'],
+                'username': row[f'{prefix}__username'],
+                'first_name': row[f'{prefix}__first_name'],
+                'last_name': row[f'{prefix}__last_name']}
+    columns = [f'{prefix}_id', f'{prefix}__username',
+               f'{prefix}__first_name', f'{prefix}__last_name']
+    return columns, build
+
+
+def _group(row):
+    if row['group_id'] is None:
+        return None
+    return {'id': row['group_id'], 'slug': row['group__slug'],
+            'title': row['group__title']}
+
+
+def _column(name):
+    return [name], lambda row: row[name]
+
+
+POST_FIELDS = {
+    'id': _column('id'),
+    'text': _column('text'),
+    'pub_date': _column('pub_date'),
+    'image': (['image'], lambda row: (IMAGE_STORAGE.url(row['image'])
+                                      if row['image'] else None)),
+    'image_width': _column('image_width'),
+    'image_height': _column('image_height'),
+    'comments_count': _column('comments_count'),
+    'last_comment_at': _column('last_comment_at'),
+    'author': _author('author'),
+    'group': (['group_id', 'group__slug', 'group__title'], _group),
+}
+COMMENT_FIELDS = {
+    'id': _column('id'),
+    'post': _column('post_id'),
+    'text': _column('text'),
+    'created': _column('created'),
+    'author': _author('author'),
+}
+GROUP_FIELDS = {
+    'id': _column('id'),
+    'slug': _column('slug'),
+    'title': _column('title'),
+    'description': _column('description'),
+    'posts_count': _column('posts_count'),
+}
+FOLLOW_FIELDS = {
+    'id': _column('id'),
+    'author': _author('author'),
+}
+
+
+class FieldsError(ValueError):
+    pass
+
+
+class Serializer:
+    """Собирает ответ из строк `values()`.
+
+    `fields` — словарь «поле ответа -> (столбцы, сборщик)»; `requested` —
+    поля из `?fields=` (по умолчанию все). Столбцы сортировки выбираются
+    всегда, чтобы по строке можно было построить курсор.
+    """
+
+    def __init__(self, fields, requested=None, ordering=()):
+        names = list(fields) if not requested else requested
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise FieldsError(f"Неизвестные поля: {', '.join(unknown)}")
+        self.builders = [(name, fields[name][1]) for name in names]
+        columns = dict.fromkeys(
+            column for name in names for column in fields[name][0])
+        columns.update(dict.fromkeys(
+            field.lstrip('-') for field in ordering))
+        self.columns = list(columns)
+
+    def rows(self, queryset):
+        return queryset.values(*self.columns)
+
+    def __call__(self, row):
+        return {name: build(row) for name, build in self.builders}
+
+
+def requested_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def error(message, status):
+    return JsonResponse({'detail': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def respond(request, data):
+    """JSON-ответ. ETag ставит `fragments.conditional`; у view без
+    областей (список групп) он считается по телу."""
+    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    if getattr(request, '_fragment_scopes', None) is None:
+        set_response_etag(response)
+        return get_conditional_response(
+            request, etag=response['ETag'], response=response)
+    return response
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', settings.POSTS_PER_PAGE))
+    except ValueError:
+        size = settings.POSTS_PER_PAGE
+    return max(1, min(size, settings.API_MAX_PAGE_SIZE))
+
+
+def paginated(request, queryset, fields, ordering=('-pub_date', '-id')):
+    try:
+        serializer = Serializer(fields, requested_fields(request), ordering)
+    except FieldsError as exc:
+        return error(str(exc), 400)
+    paginator = CursorPaginator(serializer.rows(queryset),
+                                page_size(request), ordering)
+    page = paginator.get_page(request.GET.get('cursor'))
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        query = request.GET.copy()
+        query['cursor'] = cursor
+        return request.build_absolute_uri(f'?{query.urlencode()}')
+
+    return respond(request, {
+        'results': [serializer(row) for row in page],
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+    })
+
+
+def api_view(view):
+    """GET-view API: пользователь из `Authorization: Token <ключ>` или
+    сессии; без него — 401."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        keyword, _, key = request.META.get(
+            'HTTP_AUTHORIZATION', '').partition(' ')
+        if keyword == 'Token':
+            user = ApiToken.objects.user_for(key.strip())
+            if user is None:
+                return _unauthorized('Неверный токен')
+            request.user = user
+        if not request.user.is_authenticated:
+            return _unauthorized('Нужна авторизация')
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _unauthorized(message):
+    response = error(message, 401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+@query_budget(2)
+@api_view
+@fragments.conditional(lambda request: ['global'])
+def posts(request):
+    return paginated(request, Post.objects.all(), POST_FIELDS)
+
+
+@query_budget(4)
+@api_view
+@fragments.conditional(fragments.group_scopes)
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return error('Группа не найдена', 404)
+    return paginated(request, Post.objects.filter(group_id=group_id),
+                     POST_FIELDS)
+
+
+@query_budget(4)
+@api_view
+@fragments.conditional(fragments.profile_scopes)
+def user_posts(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return error('Автор не найден', 404)
+    return paginated(request, Post.objects.filter(author_id=author_id),
+                     POST_FIELDS)
+
+
+@query_budget(3)
+@api_view
+@fragments.conditional(fragments.post_page_scopes)
+def post_detail(request, post_id):
+    try:
+        serializer = Serializer(POST_FIELDS, requested_fields(request))
+    except FieldsError as exc:
+        return error(str(exc), 400)
+    row = serializer.rows(Post.objects.filter(pk=post_id)).first()
+    if row is None:
+        return error('Пост не найден', 404)
+    return respond(request, serializer(row))
+
+
+@query_budget(3)
+@api_view
+@fragments.conditional(lambda request, post_id: [f'post:{post_id}'])
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return error('Пост не найден', 404)
+    return paginated(request, Comment.objects.filter(post_id=post_id),
+                     COMMENT_FIELDS, ordering=('created', 'id'))
+
+
+@query_budget(2)
+@api_view
+def groups(request):
+    return paginated(request, Group.objects.all(), GROUP_FIELDS,
+                     ordering=('id',))
+
+
+@query_budget(3)
+@api_view
+@fragments.conditional(
+    lambda request: ['global', f'follow:{request.user.pk}'])
+def follow_feed(request):
+    """Лента подписок, как `/follow/`."""
+    return paginated(request, timeline.feed(request.user), POST_FIELDS,
+                     ordering=timeline.FEED_ORDERING)
+
+
+@query_budget(2)
+@api_view
+@fragments.conditional(lambda request: [f'follow:{request.user.pk}'])
+def follows(request):
+    """Авторы, на которых подписан пользователь."""
+    return paginated(request, Follow.objects.filter(user=request.user),
+                     FOLLOW_FIELDS, ordering=('-id',))
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import api
+
+app_name = "api"
+
+urlpatterns = [
+    path("posts/", api.posts, name="posts"),
+    path("posts/<int:post_id>/", api.post_detail, name="post"),
+    path("posts/<int:post_id>/comments/", api.post_comments,
+         name="comments"),
+    path("groups/", api.groups, name="groups"),
+    path("groups/<slug:slug>/posts/", api.group_posts, name="group_posts"),
+    path("users/<str:username>/posts/", api.user_posts, name="user_posts"),
+    path("follow/", api.follow_feed, name="follow_feed"),
+    path("follows/", api.follows, name="follows"),
+]
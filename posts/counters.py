@@ -0,0 +1,157 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарными `UPDATE ... SET x = x + 1` из сигналов
+сохранения и удаления, поэтому страницы читают готовые числа вместо
+`COUNT(*)`. Расхождения исправляет `manage.py recount_counters`.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import (Count, DateTimeField, F, OuterRef, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import (Comment, Follow, Group, Post, StoredImage, User,
+                     UserCounters)
+
+
+def _count(model, field):
+    """Подзапрос «сколько строк `model` ссылается на текущую запись»."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    return Coalesce(
+        Subquery(rows.values(field).annotate(total=Count('pk')).values(
+            'total')),
+        Value(0),
+    )
+
+
+def _user_totals():
+    return {
+        'posts_count': _count(Post, 'author'),
+        'comments_count': _count(Comment, 'author'),
+        'followers_count': _count(Follow, 'author'),
+        'following_count': _count(Follow, 'user'),
+    }
+
+
+def _shift(model, lookup, **deltas):
+    # Greatest не даёт разошедшемуся счётчику уйти в минус и нарушить
+    # CHECK-ограничение PositiveIntegerField
+    return model.objects.filter(**lookup).update(
+        **{field: Greatest(F(field) + delta, Value(0))
+           for field, delta in deltas.items()})
+
+
+def shift_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя на `deltas`. Если строки ещё нет,
+    её создаст `for_user` сразу с пересчитанными значениями."""
+    _shift(UserCounters, {'user_id': user_id}, **deltas)
+
+
+def shift_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group, {'pk': group_id}, posts_count=delta)
+
+
+def _last_comment():
+    """Подзапрос «время последнего комментария к текущему посту»."""
+    return Subquery(Comment.objects.filter(post=OuterRef('pk')).order_by(
+        '-created').values('created')[:1])
+
+
+def shift_post(post_id, delta, commented_at=None):
+    """Сдвигает число комментариев поста. Новый комментарий передаёт
+    своё время; после удаления последнее время берётся подзапросом."""
+    if commented_at is None:
+        last = _last_comment()
+    else:
+        moment = Value(commented_at, output_field=DateTimeField())
+        # Greatest от NULL в SQLite даёт NULL, отсюда Coalesce
+        last = Coalesce(Greatest(F('last_comment_at'), moment), moment)
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, Value(0)),
+        last_comment_at=last)
+
+
+def shift_image(name, delta):
+    """Сдвигает число постов, ссылающихся на файл картинки."""
+    if not name:
+        return
+    if delta > 0:
+        StoredImage.objects.get_or_create(name=name)
+    _shift(StoredImage, {'pk': name}, references=delta)
+
+
+def recount_follows(user_id, author_ids):
+    """Точный пересчёт счётчиков подписок после пакетной подписки или
+    отписки, которая обходит сигналы."""
+    UserCounters.objects.filter(user_id=user_id).update(
+        following_count=_count(Follow, 'user'))
+    UserCounters.objects.filter(user_id__in=author_ids).update(
+        followers_count=_count(Follow, 'author'))
+
+
+def for_user(user):
+    """Счётчики пользователя, при необходимости создаются на лету."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            UserCounters.objects.create(user=user)
+    except IntegrityError:
+        pass
+    else:
+        UserCounters.objects.filter(user=user).update(**_user_totals())
+    user.counters = UserCounters.objects.get(user=user)
+    return user.counters
+
+
+def _only(queryset, field, ids):
+    """Весь `queryset` при `ids is None`, иначе только строки с `ids`."""
+    if ids is None:
+        return queryset
+    return queryset.filter(**{f'{field}__in': list(ids)})
+
+
+def recount_users(user_ids=None):
+    """Пересчитывает счётчики пользователей (всех, если `user_ids` не
+    заданы) и заводит недостающие строки."""
+    missing = _only(User.objects.filter(counters__isnull=True), 'pk',
+                    user_ids).values_list('pk', flat=True)
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=user_id) for user_id in missing.iterator()],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    _only(UserCounters.objects, 'user_id', user_ids).update(**_user_totals())
+
+
+def recount_groups(group_ids=None):
+    _only(Group.objects, 'pk', group_ids).update(
+        posts_count=_count(Post, 'group'))
+
+
+def recount_posts(post_ids=None):
+    """Пересчитывает комментарии постов и ссылки на их картинки."""
+    posts = _only(Post.objects, 'pk', post_ids)
+    posts.update(comments_count=_count(Comment, 'post'),
+                 last_comment_at=_last_comment())
+    images = posts.exclude(image='').exclude(image=None).values_list(
+        'image', flat=True).distinct().order_by()
+    names = list(images)
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=name) for name in names],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    stored = StoredImage.objects
+    if post_ids is not None:
+        stored = stored.filter(pk__in=names)
+    stored.update(references=_count(Post, 'image'))
+
+
+def recount():
+    """Полный пересчёт всех счётчиков набором UPDATE с подзапросами."""
+    recount_users()
+    recount_groups()
+    recount_posts()
@@ -0,0 +1,32 @@
+from functools import wraps
+
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .uploads import ImageUploadHandler
+
+
+def query_budget(limit):
+    """Объявляет максимальное число SQL-запросов, которое может сделать
+    страница; соблюдение бюджета проверяют тесты."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def image_uploads(view):
+    """Принимает файлы запроса через `ImageUploadHandler`.
+
+    Обработчики загрузки можно заменить только до первого обращения к
+    `request.POST`, а `CsrfViewMiddleware` читает его раньше view,
+    поэтому CSRF проверяется здесь, уже после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_errors = {}
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
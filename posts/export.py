@@ -0,0 +1,71 @@
+"""Потоковая выгрузка постов автора или группы вместе с комментариями.
+
+Посты и комментарии читаются двумя курсорами через `.iterator()` и
+сливаются по id поста, поэтому память не зависит от объёма выгрузки, а
+запросов всегда два. Каждая строка — отдельная запись: сначала пост,
+затем его комментарии в порядке (created, id).
+"""
+import csv
+import json
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+FIELDS = ['type', 'id', 'post', 'author', 'group', 'text', 'pub_date',
+          'created', 'image']
+
+
+def records(posts, images=False, image_url=None):
+    """Записи постов из `posts` и их комментариев.
+
+    `image_url` превращает имя файла в адрес; по умолчанию — адрес
+    хранилища картинок постов.
+    """
+    if image_url is None:
+        image_url = Post._meta.get_field('image').storage.url
+    post_rows = posts.order_by('pk').values_list(
+        'pk', 'author__username', 'group__slug', 'text', 'pub_date',
+        'image').iterator(chunk_size=CHUNK_SIZE)
+    comment_rows = Comment.objects.filter(
+        post__in=posts.values('pk')).order_by(
+        'post_id', 'created', 'pk').values_list(
+        'pk', 'post_id', 'author__username', 'text', 'created').iterator(
+        chunk_size=CHUNK_SIZE)
+    comment = next(comment_rows, None)
+    for pk, author, group, text, pub_date, image in post_rows:
+        record = {'type': 'post', 'id': pk, 'author': author,
+                  'group': group, 'text': text,
+                  'pub_date': pub_date.isoformat()}
+        if images:
+            record['image'] = image_url(image) if image else None
+        yield record
+        while comment is not None and comment[1] <= pk:
+            comment_pk, post_id, author, text, created = comment
+            if post_id == pk:
+                yield {'type': 'comment', 'id': comment_pk, 'post': post_id,
+                       'author': author, 'text': text,
+                       'created': created.isoformat()}
+            comment = next(comment_rows, None)
+
+
+class _Echo:
+    """Буфер для csv.writer, который отдаёт строку, а не копит её."""
+
+    def write(self, value):
+        return value
+
+
+def render(rows, data_format):
+    """Строки выгрузки в формате JSON Lines или CSV."""
+    if data_format == 'csv':
+        writer = csv.DictWriter(_Echo(), FIELDS)
+        yield writer.writerow(dict(zip(FIELDS, FIELDS)))
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
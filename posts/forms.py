@@ -1,7 +1,8 @@
 from django import forms
 from django.forms import ModelForm
 
-from .models import Comment, Post
+from . import images
+from .models import Comment, Group, Post, User
 
 
 class PostForm(ModelForm):
@@ -9,8 +10,48 @@ class PostForm(ModelForm):
         model = Post
         fields = ("group", "text", "image")
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # причины, по которым ImageUploadHandler отклонил файлы
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            if field in self.fields:
+                self.add_error(field, message)
+        return cleaned_data
+
+    def save(self, commit=True):
+        """Запоминает метаданные новой картинки, чтобы ленты выводили
+        размеры и заглушку из строки поста, не открывая файл."""
+        post = super().save(commit=False)
+        if "image" in self.changed_data:
+            upload = self.cleaned_data["image"]
+            if upload:
+                for field, value in images.describe(upload).items():
+                    setattr(post, field, value)
+            else:
+                images.clear_metadata(post)
+        if commit:
+            post.save()
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ("text",)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label="Найти", max_length=200)
+    group = forms.ModelChoiceField(queryset=Group.objects.all(),
+                                   to_field_name="slug",
+                                   required=False,
+                                   label="Группа")
+    author = forms.ModelChoiceField(queryset=User.objects.all(),
+                                    to_field_name="username",
+                                    required=False,
+                                    widget=forms.TextInput,
+                                    label="Автор")
@@ -0,0 +1,149 @@
+"""Версионированные ключи кэша фрагментов страниц-лент.
+
+Ключ фрагмента складывается из областей (вся лента, группа, автор, пост,
+лента подписок пользователя), их поколений и страницы. Сигналы записи
+постов, комментариев и подписок увеличивают поколение затронутых
+областей, поэтому фрагменты можно хранить часами: после изменения
+старые ключи просто перестают запрашиваться и вытесняются из кэша.
+"""
+import datetime as dt
+import hashlib
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import Group, Post, User
+
+GENERATION_KEY = 'fragments:generation:{}'
+CHANGED_KEY = 'fragments:changed:{}'
+
+
+def _seed():
+    # после вытеснения счётчика поколение начинается со случайного
+    # числа, а не с единицы, чтобы не совпасть с ключами старых фрагментов
+    return secrets.randbits(48)
+
+
+def generation(scope):
+    key = GENERATION_KEY.format(scope)
+    value = cache.get(key)
+    if value is None:
+        cache.add(CHANGED_KEY.format(scope), time.time(), None)
+        cache.add(key, _seed(), None)
+        value = cache.get(key)
+    return value
+
+
+def changed_at(scope):
+    """Время последнего изменения области (не раньше появления
+    счётчика поколения в кэше)."""
+    generation(scope)
+    timestamp = cache.get(CHANGED_KEY.format(scope)) or time.time()
+    return dt.datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
+
+
+def bump(*scopes):
+    """Делает устаревшими все фрагменты указанных областей."""
+    now = time.time()
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _seed(), None)
+        cache.set(CHANGED_KEY.format(scope), now, None)
+
+
+def post_scopes(author_id, group_id, post_id=None):
+    """Области, в которых показывается пост."""
+    scopes = ['global', f'author:{author_id}']
+    if group_id is not None:
+        scopes.append(f'group:{group_id}')
+    if post_id is not None:
+        scopes.append(f'post:{post_id}')
+    return scopes
+
+
+def group_scopes(request, slug):
+    """Области страницы группы (для `conditional`); None — нет группы."""
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return None if group_id is None else [f'group:{group_id}']
+
+
+def profile_scopes(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    return None if author_id is None else [f'author:{author_id}']
+
+
+def post_page_scopes(request, post_id, username=None):
+    """Области страницы поста; с `username` пост должен принадлежать
+    этому автору (как в URL страниц сайта)."""
+    posts = Post.objects.filter(id=post_id)
+    if username is not None:
+        posts = posts.filter(author__username=username)
+    author_id = posts.values_list('author_id', flat=True).first()
+    if author_id is None:
+        return None
+    return [f'post:{post_id}', f'author:{author_id}']
+
+
+def page_key(request):
+    return (request.GET.get('cursor')
+            or f"page:{request.GET.get('page') or 1}")
+
+
+def _versions(scopes):
+    return ':'.join(f'{scope}={generation(scope)}' for scope in scopes)
+
+
+def context(request, *scopes):
+    """Переменные шаблона для `{% cache cache_timeout ... cache_key %}`."""
+    return {
+        'cache_key': f'{_versions(scopes)}:{page_key(request)}',
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+
+def conditional(scopes_for, extra=None):
+    """Декоратор условного GET (ETag / Last-Modified) для страницы,
+    содержимое которой определяется областями `scopes_for(request, ...)`.
+
+    Валидаторы считаются по поколениям областей без рендеринга шаблона;
+    `scopes_for` возвращает None, если страницы нет (тогда её обработает
+    сама view). ETag учитывает пользователя и CSRF-cookie, потому что
+    они попадают в разметку, и строку `extra(request)` — для остального
+    содержимого, не описанного областями. Last-Modified отдаётся только
+    анонимам: по одной дате нельзя отличить страницу другого
+    пользователя.
+    """
+    def scopes(request, *args, **kwargs):
+        if not hasattr(request, '_fragment_scopes'):
+            request._fragment_scopes = scopes_for(request, *args, **kwargs)
+        return request._fragment_scopes
+
+    def etag(request, *args, **kwargs):
+        found = scopes(request, *args, **kwargs)
+        if found is None:
+            return None
+        validator = ':'.join([
+            _versions(found),
+            page_key(request),
+            str(request.user.pk),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            extra(request) if extra else '',
+        ])
+        return hashlib.md5(validator.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        found = scopes(request, *args, **kwargs)
+        if found is None or request.user.is_authenticated:
+            return None
+        return max(changed_at(scope) for scope in found)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,252 @@
+"""Адаптивные варианты картинок постов.
+
+Для каждой картинки Pillow кодирует набор ширин (`POST_IMAGE_WIDTHS`) в
+современных форматах (`POST_IMAGE_FORMATS`), обрезанных под пропорцию
+карточки. Шаблонный тег `post_picture` собирает из них `<picture>` со
+`srcset`, и браузер скачивает вариант под ширину экрана, а не 960 px
+для всех. Запасной `<img>` для браузеров без этих форматов — один JPEG
+шириной с карточку. Какие варианты построены, хранится в
+`Post.image_variants`, поэтому разметка собирается без обращений к
+хранилищу.
+"""
+import base64
+import hashlib
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'posts/variants'
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp'}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+SAVE_OPTIONS = {
+    'AVIF': {'quality': 60},
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+# формат запасного `<img>`: его понимает любой браузер, поэтому он не
+# попадает в `<source>`
+FALLBACK_FORMAT = 'JPEG'
+# ширина карточки поста: запасной `<img>` строится не шире её
+CARD_WIDTH = 960
+# ширина размытой заглушки (LQIP), которая показывается до загрузки
+PLACEHOLDER_WIDTH = 16
+# значения EXIF Orientation, при которых картинка повёрнута на 90°
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+EXIF_ORIENTATION = 0x0112
+
+
+def available_formats():
+    """Форматы из настроек, которые умеет кодировать установленный
+    Pillow (AVIF есть не во всех сборках)."""
+    Image.init()
+    return [name for name in settings.POST_IMAGE_FORMATS
+            if name in Image.SAVE]
+
+
+def target_widths(source_width):
+    """Ширины вариантов без увеличения картинки; самая узкая строится
+    всегда."""
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    return [width for width in widths if width <= source_width] or widths[:1]
+
+
+def fallback_width(widths):
+    """Ширина запасного JPEG: самая широкая, что помещается в карточку."""
+    return max([width for width in widths if width <= CARD_WIDTH]
+               or widths[:1])
+
+
+def variant_stem(image_name):
+    # имя зависит от исходного файла: после замены картинки старые
+    # варианты не отдаются из кэшей браузера и CDN
+    return hashlib.md5(image_name.encode()).hexdigest()[:16]
+
+
+def variant_name(image_name, width, image_format):
+    return (f'{VARIANTS_DIR}/{variant_stem(image_name)}-{width}.'
+            f'{EXTENSIONS[image_format]}')
+
+
+def _open(field_file):
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if alpha else 'RGB')
+    return image
+
+
+def _flatten(image):
+    """JPEG без прозрачности: прозрачные места — белые, как фон
+    карточки."""
+    if image.mode != 'RGBA':
+        return image
+    flat = Image.new('RGB', image.size, 'white')
+    flat.paste(image, mask=image.getchannel('A'))
+    return flat
+
+
+def existing_variants(image_name, formats):
+    """Уже построенные варианты или `None`, если сборка не закончена.
+
+    Запасной JPEG пишется первым, остальные варианты — от широких к
+    узким, поэтому наличие JPEG и самого узкого варианта каждого формата
+    означает, что набор полный.
+    """
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    fallback = [width for width in widths if default_storage.exists(
+        variant_name(image_name, width, FALLBACK_FORMAT))]
+    if not fallback:
+        return None
+    variants = {FALLBACK_FORMAT: fallback}
+    for image_format in formats:
+        if not default_storage.exists(
+                variant_name(image_name, widths[0], image_format)):
+            return None
+        variants[image_format] = [
+            width for width in widths
+            if default_storage.exists(
+                variant_name(image_name, width, image_format))]
+    return variants
+
+
+def build_variants(field_file, force=False):
+    """Кодирует и сохраняет варианты картинки поста; готовые варианты
+    пересобираются только с `force`.
+
+    Возвращает `{формат: [ширины]}` для `Post.image_variants`; запасной
+    JPEG записан под ключом `FALLBACK_FORMAT`.
+    """
+    formats = available_formats()
+    if not force:
+        variants = existing_variants(field_file.name, formats)
+        if variants is not None:
+            return variants
+    source = _open(field_file)
+    widths = target_widths(source.width)
+    largest = widths[-1]
+    # картинка декодируется и обрезается один раз, дальше только
+    # уменьшается
+    cropped = ImageOps.fit(
+        source, (largest, round(largest * settings.POST_IMAGE_RATIO)),
+        Image.LANCZOS)
+    fallback = fallback_width(widths)
+    variants = {}
+    for width in reversed(widths):
+        resized = cropped.resize(
+            (width, round(width * settings.POST_IMAGE_RATIO)), Image.LANCZOS)
+        encodings = [(image_format, resized) for image_format in formats]
+        if width == fallback:
+            encodings.insert(0, (FALLBACK_FORMAT, _flatten(resized)))
+        for image_format, image in encodings:
+            buffer = BytesIO()
+            image.save(buffer, image_format, **SAVE_OPTIONS[image_format])
+            name = variant_name(field_file.name, width, image_format)
+            default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants.setdefault(image_format, []).insert(0, width)
+    return variants
+
+
+def dump_variants(variants):
+    return json.dumps(variants, sort_keys=True) if variants else ''
+
+
+def sources(post):
+    """`<source>` для `<picture>`: MIME-тип и srcset каждого формата."""
+    if not post.image or not post.image_variants:
+        return []
+    variants = json.loads(post.image_variants)
+    result = []
+    for image_format in settings.POST_IMAGE_FORMATS:
+        if image_format not in variants:
+            continue
+        srcset = ', '.join(
+            '{} {}w'.format(default_storage.url(
+                variant_name(post.image.name, width, image_format)), width)
+            for width in variants[image_format])
+        result.append({'type': MIME_TYPES[image_format], 'srcset': srcset})
+    return result
+
+
+def fallback(post):
+    """Запасной `<img>`: адрес и размеры JPEG-варианта без обращений к
+    хранилищу; `None`, если он ещё не построен."""
+    if not post.image or not post.image_variants:
+        return None
+    widths = json.loads(post.image_variants).get(FALLBACK_FORMAT)
+    if not widths:
+        return None
+    width = fallback_width(widths)
+    return {
+        'src': default_storage.url(
+            variant_name(post.image.name, width, FALLBACK_FORMAT)),
+        'width': width,
+        'height': round(width * settings.POST_IMAGE_RATIO),
+    }
+
+
+def _placeholder(image):
+    """Крошечная JPEG-заглушка в виде data URI (несколько сотен байт)."""
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def build_placeholder(field_file, variants):
+    """Заглушка для картинок, у которых её не построил `describe()`: из
+    самого узкого готового варианта, а без вариантов — из оригинала.
+    Вызывается из фоновой задачи превью."""
+    for image_format, widths in sorted(variants.items()):
+        name = variant_name(field_file.name, min(widths), image_format)
+        with default_storage.open(name, 'rb') as variant:
+            return _placeholder(Image.open(variant))
+    return _placeholder(_open(field_file))
+
+
+def describe(upload):
+    """Метаданные загруженной картинки для полей `Post.image_*`.
+
+    Хэш считается по чанкам, размеры и формат берутся из заголовка.
+    Заглушка строится сразу только для JPEG: `draft()` декодирует его
+    уменьшенным до 1/8. PNG, GIF и WebP так уменьшить нельзя, их
+    заглушку строит фоновая задача превью из готового варианта.
+    """
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    metadata = {
+        'image_width': width,
+        'image_height': height,
+        'image_format': image.format or '',
+        'image_size': upload.size,
+        'image_hash': digest.hexdigest(),
+        'image_placeholder': '',
+    }
+    if image.format in ('JPEG', 'MPO'):
+        image.draft('RGB', (PLACEHOLDER_WIDTH * 4, PLACEHOLDER_WIDTH * 4))
+        metadata['image_placeholder'] = _placeholder(image)
+    upload.seek(0)
+    return metadata
+
+
+def clear_metadata(post):
+    post.image_width = post.image_height = post.image_size = None
+    post.image_format = post.image_hash = post.image_placeholder = ''
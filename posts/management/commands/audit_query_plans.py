@@ -0,0 +1,134 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import NEXT, CursorPaginator
+
+User = get_user_model()
+
+# признаки плана, при которых запрос читает всю таблицу или сортирует
+# результат во временном B-дереве вместо чтения по индексу
+BAD_PLAN_MARKERS = ('USE TEMP B-TREE',)
+NO_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+def scanned_table(detail, tables):
+    """Таблица, которую шаг плана читает подряд: `SCAN table` (SQLite
+    3.36+) или `SCAN TABLE table` (старые версии); иначе `None`. Проход
+    по материализованному подзапросу таблицей не считается."""
+    words = detail.split()
+    if words[:1] != ['SCAN']:
+        return None
+    words = words[1:]
+    if words[:1] == ['TABLE']:
+        words = words[1:]
+    return words[0] if words and words[0] in tables else None
+
+
+def is_full_scan(detail, tables):
+    """`SCAN table` без индекса — полный проход по таблице."""
+    return (scanned_table(detail, tables) is not None
+            and ' USING ' not in detail)
+
+
+def is_unbounded_scan(sql, detail, tables):
+    """Проход по индексу без условия поиска (иначе это был бы `SEARCH`)
+    и без LIMIT читает весь индекс, как `COUNT(*)` по ленте."""
+    return (scanned_table(detail, tables) is not None
+            and ' INDEX ' in detail and ' LIMIT ' not in sql)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN QUERY PLAN для запросов, которые делают '
+            'страницы-ленты posts.views, и падает, если какой-то из них '
+            'читает таблицу или индекс целиком или сортирует во временном '
+            'B-дереве')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Печатать план каждого запроса')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Аудит поддерживает только SQLite')
+        with transaction.atomic():
+            queries = self.capture_listing_queries()
+            problems = self.audit(queries, options['verbose_plans'])
+            transaction.set_rollback(True)
+        if problems:
+            for sql, detail in problems:
+                self.stderr.write(f'{detail}\n    {sql}')
+            raise CommandError(
+                f'Запросов с неудачным планом: {len(problems)}')
+        self.stdout.write(f'Проверено запросов: {len(queries)}, '
+                          f'полных сканирований и сортировок нет')
+
+    def listing_urls(self, reader, author, group, post):
+        cursor = CursorPaginator(Post.objects.all(), 1).encode_cursor(
+            post, NEXT)
+        return [
+            reverse('posts:index'),
+            reverse('posts:index') + f'?cursor={cursor}',
+            reverse('posts:group', args=[group.slug]),
+            reverse('posts:group', args=[group.slug]) + f'?cursor={cursor}',
+            reverse('posts:profile', args=[author.username]),
+            reverse('posts:profile', args=[author.username])
+            + f'?cursor={cursor}',
+            reverse('posts:follow_index'),
+            reverse('posts:follow_index') + f'?cursor={cursor}',
+            reverse('posts:post_view', args=[author.username, post.id]),
+        ]
+
+    def capture_listing_queries(self):
+        """Прогоняет страницы-ленты на временных данных и собирает
+        их SELECT-запросы к таблицам posts."""
+        reader = User.objects.create(username='__plan_audit_reader__')
+        author = User.objects.create(username='__plan_audit_author__')
+        group = Group.objects.create(title='Аудит', slug='__plan_audit__',
+                                     description='Аудит планов')
+        post = Post.objects.create(author=author, group=group, text='Аудит')
+        Comment.objects.create(post=post, author=reader, text='Аудит')
+        Follow.objects.create(user=reader, author=author)
+
+        client = Client()
+        client.force_login(reader)
+        queries = []
+        for url in self.listing_urls(reader, author, group, post):
+            # кэш фрагментов скрыл бы запросы, которые делает шаблон
+            with override_settings(CACHES=NO_CACHE), \
+                    CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url} ответил {response.status_code}')
+            queries.extend(
+                query['sql'] for query in captured.captured_queries
+                if query['sql'].startswith('SELECT')
+                and '"posts_' in query['sql'])
+        return queries
+
+    def audit(self, queries, verbose):
+        problems = []
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            for sql in dict.fromkeys(queries):
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                if verbose:
+                    self.stdout.write(sql)
+                    for detail in details:
+                        self.stdout.write(f'    {detail}')
+                problems.extend(
+                    (sql, detail) for detail in details
+                    if is_full_scan(detail, tables)
+                    or is_unbounded_scan(sql, detail, tables)
+                    or detail.startswith(BAD_PLAN_MARKERS))
+        return problems
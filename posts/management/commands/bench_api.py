@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from posts import api
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время ответа JSON API и HTML-страниц с теми же '
+            'данными и скорость сериализации строк API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый адрес')
+        parser.add_argument('--username',
+                            help='От чьего имени (по умолчанию — первый '
+                                 'активный пользователь)')
+        parser.add_argument('--rows', type=int, default=1000,
+                            help='Строк для замера сериализации')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('pk')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        post = Post.objects.order_by('-pk').select_related('author').first()
+        if user is None or post is None:
+            raise CommandError('Нужны пользователь и хотя бы один пост')
+        client = Client()
+        client.force_login(user)
+        group = Group.objects.order_by('pk').first()
+
+        pairs = [
+            ('лента', reverse('posts:index'), reverse('api:posts')),
+            ('профиль',
+             reverse('posts:profile', args=[post.author.username]),
+             reverse('api:user_posts', args=[post.author.username])),
+            ('пост',
+             reverse('posts:post_view', args=[post.author.username, post.pk]),
+             reverse('api:post', args=[post.pk])),
+            ('подписки', reverse('posts:follow_index'),
+             reverse('api:follow_feed')),
+        ]
+        if group is not None:
+            pairs.append(('группа', reverse('posts:group', args=[group.slug]),
+                          reverse('api:group_posts', args=[group.slug])))
+        for name, html_url, api_url in pairs:
+            html = self.measure(client, html_url, options['requests'])
+            json = self.measure(client, api_url, options['requests'])
+            self.stdout.write(f'{name:<10}html {html:7.2f} мс  '
+                              f'api {json:7.2f} мс')
+        self.serialization(options['rows'])
+
+    def measure(self, client, url, count):
+        """Медиана времени ответа в миллисекундах."""
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: {response.status_code}')
+        return statistics.median(timings) * 1000
+
+    def serialization(self, limit):
+        """Горячий путь API без запросов: строки `values()` -> словари."""
+        serializer = api.Serializer(api.POST_FIELDS)
+        rows = list(serializer.rows(Post.objects.order_by('-pk'))[:limit])
+        started = time.perf_counter()
+        for row in rows:
+            serializer(row)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'сериализация: {len(rows)} постов, '
+                          f'{len(rows) / elapsed:,.0f} строк/с')
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import (
+    Command as CreateCacheTable)
+from django.db import DEFAULT_DB_ALIAS, connection
+
+from yatube.cache import SQLiteCache
+
+BENCH_TABLE = 'bench_cache_table'
+OPTIONS = {'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+
+
+def _incr_worker(location, key, count):
+    cache = SQLiteCache(location, OPTIONS)
+    for _ in range(count):
+        cache.incr(key)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость общего кэша SQLite с LocMemCache и '
+            'кэшем в базе данных и проверяет атомарность incr между '
+            'процессами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=2000)
+        parser.add_argument('--processes', type=int,
+                            default=min(os.cpu_count() or 1, 4))
+
+    def handle(self, *args, **options):
+        operations = options['operations']
+        with tempfile.TemporaryDirectory() as directory:
+            location = os.path.join(directory, 'bench.sqlite3')
+            create_table = CreateCacheTable()
+            create_table.verbosity = 0
+            create_table.create_table(DEFAULT_DB_ALIAS, BENCH_TABLE,
+                                      dry_run=False)
+            try:
+                backends = {
+                    'locmem': LocMemCache('bench', OPTIONS),
+                    'database': DatabaseCache(BENCH_TABLE, OPTIONS),
+                    'sqlite': SQLiteCache(location, OPTIONS),
+                }
+                for name, cache in backends.items():
+                    self.report(name, self.measure(cache, operations))
+            finally:
+                with connection.schema_editor() as editor:
+                    editor.execute(
+                        f'DROP TABLE {connection.ops.quote_name(BENCH_TABLE)}')
+            self.check_concurrency(location, options['processes'],
+                                   operations)
+
+    def measure(self, cache, operations):
+        value = {'html': 'x' * 2048}
+        results = {}
+        started = time.perf_counter()
+        for i in range(operations):
+            cache.set(f'key:{i}', value)
+        results['set'] = time.perf_counter() - started
+        started = time.perf_counter()
+        for i in range(operations):
+            cache.get(f'key:{i}')
+        results['get'] = time.perf_counter() - started
+        cache.set('counter', 0)
+        started = time.perf_counter()
+        for _ in range(operations):
+            cache.incr('counter')
+        results['incr'] = time.perf_counter() - started
+        cache.clear()
+        return {name: operations / elapsed
+                for name, elapsed in results.items()}
+
+    def report(self, name, rates):
+        line = '  '.join(f'{operation} {rate:>10,.0f}/с'
+                         for operation, rate in rates.items())
+        self.stdout.write(f'{name:<10}{line}')
+
+    def check_concurrency(self, location, processes, operations):
+        """incr из нескольких процессов не теряет обновлений."""
+        cache = SQLiteCache(location, OPTIONS)
+        cache.set('shared', 0)
+        per_process = max(operations // processes, 1)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_incr_worker,
+                            args=(location, 'shared', per_process))
+            for _ in range(processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        expected = per_process * processes
+        total = cache.get('shared')
+        self.stdout.write(
+            f'sqlite incr из {processes} процессов: {total}/{expected}, '
+            f'{expected / elapsed:,.0f}/с')
+        if total != expected:
+            self.stderr.write('Потеряны обновления счётчика!')
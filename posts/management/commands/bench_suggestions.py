@@ -0,0 +1,65 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = ('Замеряет построение графа подписок и время подсказок «кого '
+            'почитать» на синтетическом графе (без базы данных)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--edges', type=int, default=5_000_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--deltas', type=int, default=10000,
+                            help='Подписок и отписок поверх CSR перед '
+                                 'слиянием')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Граф: {options["users"]:,} пользователей, '
+                          f'{options["edges"]:,} подписок')
+        random.seed(options['seed'])
+        users, authors = self.edges(options['users'], options['edges'])
+
+        started = time.perf_counter()
+        graph = suggestions.FollowGraph(users, authors)
+        self.stdout.write(
+            f'построение: {time.perf_counter() - started:.2f} с')
+
+        sample = random.sample(range(1, options['users'] + 1),
+                               min(options['queries'], options['users']))
+        timings = []
+        for user_id in sample:
+            started = time.perf_counter()
+            graph.suggest(user_id, 10)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'подсказки: медиана {statistics.median(timings):.2f} мс, '
+            f'p99 {timings[int(len(timings) * 0.99)]:.2f} мс')
+
+        for _ in range(options['deltas']):
+            user_id = random.randint(1, options['users'])
+            author_id = random.randint(1, options['users'])
+            if random.random() < 0.5:
+                graph.add(user_id, author_id)
+            else:
+                graph.remove(user_id, author_id)
+        started = time.perf_counter()
+        graph.compacted()
+        self.stdout.write(f'слияние {options["deltas"]:,} дельт: '
+                          f'{time.perf_counter() - started:.2f} с')
+
+    def edges(self, users, edges):
+        """Подписчики равномерны, авторы — по степенному закону: у
+        немногих авторов много подписчиков, как в живом графе."""
+        generator = np.random.default_rng(random.randrange(2 ** 32))
+        followers = generator.integers(1, users + 1, edges, dtype=np.int32)
+        popular = (generator.pareto(1.2, edges) * 10).astype(np.int64)
+        return followers, (popular % users + 1).astype(np.int32)
@@ -0,0 +1,142 @@
+import statistics
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template import Engine, RequestContext, engines
+from django.template.loader_tags import IncludeNode
+from django.test import RequestFactory
+from django.utils import timezone
+
+from posts.forms import CommentForm
+from posts.models import Comment, Post, User, UserCounters
+
+TEMPLATES = ['posts/index.html', 'posts/profile.html', 'posts/post.html']
+FILESYSTEM = 'django.template.loaders.filesystem.Loader'
+APP_DIRECTORIES = 'django.template.loaders.app_directories.Loader'
+CACHED = 'django.template.loaders.cached.Loader'
+
+
+class IncludeTimer:
+    """Подменяет `IncludeNode.render` и суммирует время каждого
+    `{% include %}` (вместе с вложенными include)."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def __enter__(self):
+        original = self.original = IncludeNode.render
+        totals = self.totals
+
+        def render(node, context):
+            started = time.perf_counter()
+            try:
+                return original(node, context)
+            finally:
+                name = node.template.resolve(context)
+                totals[getattr(name, 'name', name)] += (
+                    time.perf_counter() - started)
+
+        IncludeNode.render = render
+        return self
+
+    def __exit__(self, *exc_info):
+        IncludeNode.render = self.original
+
+
+class Command(BaseCommand):
+    help = ('Замеряет рендеринг страниц ленты, профиля и поста на '
+            'синтетических данных (без базы данных): с кэширующим '
+            'загрузчиком шаблонов и без него, и стоимость каждого include')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, nargs='+', default=[10, 50],
+                            help='Постов (и комментариев) на странице')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Рендерингов каждого шаблона')
+
+    def handle(self, *args, **options):
+        plain = self.engine([FILESYSTEM, APP_DIRECTORIES])
+        cached = self.engine([(CACHED, [FILESYSTEM, APP_DIRECTORIES])])
+        request = RequestFactory().get('/')
+        repeat = options['repeat']
+        for count in options['posts']:
+            request.user, contexts = self.synthetic(count)
+            self.stdout.write(f'Постов на странице: {count}, '
+                              f'рендерингов: {repeat}')
+            for name in TEMPLATES:
+                without_cache = self.measure(plain, name, request,
+                                             contexts[name], repeat)
+                with IncludeTimer() as timer:
+                    with_cache = self.measure(cached, name, request,
+                                              contexts[name], repeat)
+                self.stdout.write(f'  {name:<22}без кэша '
+                                  f'{without_cache:7.2f} мс  с кэшем '
+                                  f'{with_cache:7.2f} мс')
+                for include, total in sorted(timer.totals.items(),
+                                             key=lambda item: -item[1]):
+                    per_page = total / repeat * 1000
+                    self.stdout.write(
+                        f'    {include:<32}{per_page:7.2f} мс '
+                        f'({per_page / with_cache:.0%})')
+
+    def engine(self, loaders):
+        """Движок с настройками проекта и заданными загрузчиками."""
+        base = engines['django'].engine
+        return Engine(
+            dirs=base.dirs,
+            app_dirs=False,
+            context_processors=base.context_processors,
+            loaders=loaders,
+            string_if_invalid=base.string_if_invalid,
+            file_charset=base.file_charset,
+            libraries=base.libraries,
+            builtins=base.builtins[len(Engine.default_builtins):],
+            autoescape=base.autoescape,
+        )
+
+    def measure(self, engine, name, request, context, repeat):
+        """Медиана загрузки и рендеринга шаблона в миллисекундах, как в
+        `render()` на каждый запрос."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            engine.get_template(name).render(
+                RequestContext(request, context))
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def synthetic(self, count):
+        """Читатель и контексты трёх страниц из несохранённых объектов;
+        связанные объекты заранее положены в кэши полей."""
+        now = timezone.now()
+        reader = User(pk=1, username='bench_reader')
+        author = User(pk=2, username='bench_author', first_name='Лев',
+                      last_name='Толстой')
+        author.counters = UserCounters(user=author, posts_count=count * 3,
+                                       followers_count=count,
+                                       following_count=count)
+        posts = [Post(pk=pk, author=author, pub_date=now,
+                      text='Синтетический пост для замера шаблонов. ' * 5,
+                      comments_count=pk % 7, last_comment_at=now)
+                 for pk in range(count * 3, 0, -1)]
+        comments = [Comment(pk=pk, post=posts[0], author=reader, created=now,
+                            text='Синтетический комментарий. ' * 3)
+                    for pk in range(count, 0, -1)]
+        paginator = Paginator(posts, count)
+        page = paginator.page(1)
+        page.page_links = paginator.page_range
+        page.next_cursor = 'bench'
+        # нулевой таймаут: фрагменты `{% cache %}` рендерятся каждый раз
+        listing = {'page': page, 'paginator': paginator,
+                   'cache_timeout': 0, 'cache_key': 'bench'}
+        return reader, {
+            'posts/index.html': {**listing, 'index': True},
+            'posts/profile.html': {**listing, 'author': author,
+                                   'suggestions': []},
+            'posts/post.html': {'post': posts[0], 'author': author,
+                                'count': len(posts), 'comments': comments,
+                                'comments_more': '?cursor=bench',
+                                'form': CommentForm()},
+        }
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = ('Строит граф подписок для подсказок «кого почитать» и '
+            'сохраняет его в SUGGESTIONS_GRAPH_PATH; запускается по cron')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        graph = suggestions.build()
+        self.stdout.write(f'Подписок в графе: {len(graph)} '
+                          f'({time.perf_counter() - started:.2f} с)')
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import images
+from posts.models import Post, StoredImage
+
+BATCH_SIZE = 1000
+
+
+class DiskSet:
+    """Множество строк во временной базе SQLite: память не зависит от
+    числа постов и файлов."""
+
+    def __init__(self, directory, name):
+        self.connection = sqlite3.connect(
+            os.path.join(directory, f'{name}.sqlite3'))
+        self.connection.execute(
+            'CREATE TABLE items (item TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    def update(self, items):
+        batch = []
+        for item in items:
+            batch.append((item,))
+            if len(batch) == BATCH_SIZE:
+                self._insert(batch)
+                batch = []
+        self._insert(batch)
+
+    def _insert(self, batch):
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO items VALUES (?)', batch)
+
+    def __contains__(self, item):
+        row = self.connection.execute(
+            'SELECT 1 FROM items WHERE item = ?', (item,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for (item,) in self.connection.execute('SELECT item FROM items'):
+            yield item
+
+    def starting_with(self, prefix):
+        rows = self.connection.execute(
+            'SELECT item FROM items WHERE substr(item, 1, ?) = ?',
+            (len(prefix), prefix))
+        return [item for (item,) in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+def walk(root, directory, exclude=None):
+    """Файлы каталога рекурсивно (кроме подкаталога `exclude`); в памяти
+    только текущий каталог."""
+    try:
+        entries = list(os.scandir(os.path.join(root, directory)))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        name = f'{directory}/{entry.name}'
+        if entry.is_dir(follow_symlinks=False):
+            if name != exclude:
+                yield from walk(root, name, exclude)
+        elif entry.is_file(follow_symlinks=False):
+            yield name, entry.stat(follow_symlinks=False)
+
+
+def kv_value(key, identity='image'):
+    """Значение из хранилища превью sorl-thumbnail (строка KVStore)."""
+    value = KVStore.objects.filter(key=add_prefix(key, identity)).values_list(
+        'value', flat=True).first()
+    return None if value is None else json.loads(value)
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки постов и их варианты, на '
+            'которые не ссылается ни один пост, а также оставшиеся превью '
+            'sorl-thumbnail вместе с записями их хранилища')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что было бы удалено')
+        parser.add_argument('--quarantine', metavar='DIR',
+                            help='Переносить файлы в каталог, а не удалять')
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Не трогать файлы моложе N часов '
+                                 '(пост с загрузкой мог ещё не сохраниться)')
+        parser.add_argument('--rate', type=float, default=50,
+                            help='Не больше N удалений в секунду; 0 — без '
+                                 'ограничения')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.cutoff = time.time() - options['min_age'] * 3600
+        self.removed = self.freed = self.purged = 0
+        self.last_removal = 0.0
+        with tempfile.TemporaryDirectory() as directory:
+            sets = {name: DiskSet(directory, name)
+                    for name in ('originals', 'stems', 'stale',
+                                 'orphans')}
+            try:
+                self.collect(**sets)
+            finally:
+                for disk_set in sets.values():
+                    disk_set.close()
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {self.removed} ({self.freed} байт), '
+            f'записей превью: {self.purged}')
+
+    def collect(self, originals, stems, stale, orphans):
+        originals.update(
+            Post.objects.exclude(image='').exclude(image=None).values_list(
+                'image', flat=True).iterator(chunk_size=BATCH_SIZE))
+        stems.update(images.variant_stem(name) for name in originals)
+        self.sweep_thumbnail_store(stale)
+
+        upload_dir = Post._meta.get_field('image').upload_to.rstrip('/')
+        for name, stat in walk(settings.MEDIA_ROOT, upload_dir,
+                               exclude=images.VARIANTS_DIR):
+            if name not in originals:
+                # «основа вариант имя»: по основе варианта находится
+                # исходный файл для повторной проверки ссылок
+                orphans.update([f'{images.variant_stem(name)} {name}'])
+                self.remove(name, stat, sources=[name])
+        for name, stat in walk(settings.MEDIA_ROOT, images.VARIANTS_DIR):
+            stem = name.rsplit('/', 1)[1].split('-')[0]
+            if stem not in stems:
+                sources = [item.split(' ', 1)[1] for item in
+                           orphans.starting_with(f'{stem} ')]
+                self.remove(name, stat, sources=sources)
+        # карточки собираются из вариантов: превью sorl-thumbnail,
+        # построенные раньше, не нужны ни одному посту
+        prefix = thumbnail_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for name, stat in walk(settings.MEDIA_ROOT, prefix):
+            self.remove(name, stat)
+
+    def sweep_thumbnail_store(self, stale):
+        """Удаляет записи хранилища превью sorl-thumbnail: превью больше
+        не строятся и не показываются."""
+        prefix = add_prefix('', 'thumbnails')
+        rows = KVStore.objects.filter(key__startswith=prefix).values_list(
+            'key', flat=True).iterator(chunk_size=BATCH_SIZE)
+        stale.update(key[len(prefix):] for key in rows)
+        # удаляем после прохода: курсор по той же таблице ещё был открыт
+        for source_key in stale:
+            self.purge(source_key)
+
+    def purge(self, source_key):
+        keys = [add_prefix(source_key, 'thumbnails'), add_prefix(source_key)]
+        keys.extend(add_prefix(key)
+                    for key in kv_value(source_key, 'thumbnails') or [])
+        self.purged += len(keys)
+        if not self.options['dry_run']:
+            # удаляет и строки KVStore, и их копии в кэше
+            default.kvstore._delete_raw(*keys)
+
+    def remove(self, name, stat, sources=()):
+        """Удаляет файл, если он по-прежнему не нужен.
+
+        Множества ссылок собраны в начале прохода, а хранилище отдаёт
+        новому посту уже существующий файл с теми же байтами, поэтому
+        прямо перед удалением ссылки на исходные файлы `sources`
+        проверяются заново, а время изменения берётся свежее (хранилище
+        обновляет его при повторной загрузке, превью и варианты — при
+        пересборке).
+        """
+        if stat.st_mtime > self.cutoff:
+            return
+        if self.options['dry_run']:
+            self.count(name, stat)
+            return
+        self.throttle()
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        with transaction.atomic():
+            # запись первой берёт блокировку базы: сохранение поста с
+            # этим файлом дождётся конца проверки
+            StoredImage.objects.filter(name=name, references=0).delete()
+            if sources and (
+                    Post.objects.filter(image__in=sources).exists()
+                    or StoredImage.objects.filter(
+                        name__in=sources, references__gt=0).exists()):
+                transaction.set_rollback(True)
+                return
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return
+            if stat.st_mtime > self.cutoff:
+                return
+            self.count(name, stat)
+            if self.options['quarantine']:
+                target = os.path.join(self.options['quarantine'], name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+
+    def count(self, name, stat):
+        self.removed += 1
+        self.freed += stat.st_size
+        if self.options['verbosity'] > 1:
+            self.stdout.write(name)
+
+    def throttle(self):
+        """Ограничивает темп удалений, чтобы не мешать живому трафику."""
+        if not self.options['rate']:
+            return
+        pause = 1 / self.options['rate'] - (time.monotonic()
+                                            - self.last_removal)
+        if pause > 0:
+            time.sleep(pause)
+        self.last_removal = time.monotonic()
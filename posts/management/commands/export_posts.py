@@ -0,0 +1,52 @@
+from urllib.parse import urljoin
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает посты автора или группы вместе с '
+            'комментариями в JSON Lines или CSV')
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--author', metavar='USERNAME')
+        source.add_argument('--group', metavar='SLUG')
+        parser.add_argument('--format', choices=export.FORMATS,
+                            default='jsonl')
+        parser.add_argument('--images', action='store_true',
+                            help='Добавить адреса картинок')
+        parser.add_argument('--base-url', default='',
+                            help='Префикс адресов картинок, например '
+                                 'https://yatube.example')
+        parser.add_argument('--output', metavar='PATH',
+                            help='Файл выгрузки (по умолчанию — stdout)')
+
+    def handle(self, *args, **options):
+        posts = self.select(options)
+        storage = Post._meta.get_field('image').storage
+        rows = export.records(
+            posts, images=options['images'],
+            image_url=lambda name: urljoin(options['base_url'],
+                                           storage.url(name)))
+        lines = export.render(rows, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def select(self, options):
+        if options['author']:
+            author = User.objects.filter(username=options['author']).first()
+            if author is None:
+                raise CommandError(f'Нет автора {options["author"]}')
+            return author.posts.all()
+        group = Group.objects.filter(slug=options['group']).first()
+        if group is None:
+            raise CommandError(f'Нет группы {options["group"]}')
+        return group.group.all()
@@ -0,0 +1,315 @@
+import csv
+import io
+import json
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, fragments, search, timeline
+from posts.models import Comment, Follow, Group, Post, UserCounters
+
+User = get_user_model()
+
+FORMATS = ('jsonl', 'csv')
+# при большем числе затронутых областей кэш фрагментов дешевле сбросить
+# целиком, чем увеличивать поколение каждой
+FRAGMENT_BUMP_LIMIT = 10000
+# id в одном запросе пересборки (SQLite ограничивает число параметров)
+REBUILD_BATCH = 500
+
+
+def read_records(path, data_format=None):
+    """Построчно читает JSON Lines или CSV (формат — по расширению);
+    `-` — стандартный ввод."""
+    if data_format is None:
+        data_format = 'csv' if path.endswith('.csv') else 'jsonl'
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+    with stream:
+        if data_format == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+
+@contextmanager
+def keep_dates(*fields):
+    """bulk_create вызывает pre_save, и auto_now_add затёр бы даты из
+    исходной платформы; на время импорта флаг снимается."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def lock_table(model):
+    """Блокирует запись в таблицу модели до конца транзакции."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        else:
+            # в SQLite любая пишущая команда, даже без затронутых строк,
+            # берёт блокировку записи на всю базу
+            cursor.execute(f'UPDATE {table} SET id = id WHERE 0 = 1')
+
+
+@contextmanager
+def deferred_indexes(models, enabled):
+    """Снимает вторичные индексы моделей на время вставки и строит их
+    заново одним проходом в конце."""
+    if not enabled:
+        yield
+        return
+    indexes = [(model, index) for model in models
+               for index in model._meta.indexes]
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+
+
+class Command(BaseCommand):
+    help = ('Массово загружает посты, комментарии и подписки из JSON Lines '
+            'или CSV; счётчики, ленты подписок и поисковый индекс '
+            'загруженных записей обновляются один раз в конце')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', metavar='PATH',
+                            help='Поля: id, author, text, pub_date, group, '
+                                 'image')
+        parser.add_argument('--comments', metavar='PATH',
+                            help='Поля: post (id из --posts), author, text, '
+                                 'created')
+        parser.add_argument('--follows', metavar='PATH',
+                            help='Поля: user, author')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат всех файлов (по умолчанию — по '
+                                 'расширению)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Заводить неизвестных авторов (без пароля)')
+        parser.add_argument('--drop-indexes', action='store_true',
+                            help='Снять вторичные индексы на время загрузки '
+                                 '(быстрее для больших объёмов)')
+
+    def handle(self, *args, **options):
+        if not any(options[kind] for kind in ('posts', 'comments',
+                                              'follows')):
+            raise CommandError('Укажите --posts, --comments или --follows')
+        self.options = options
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        # id поста в исходной платформе -> pk у нас
+        self.post_ids = {}
+        # что затронул импорт: это и пересчитывается в конце
+        self.imported_posts = []
+        self.user_ids = set()
+        self.group_ids = set()
+        self.follows = defaultdict(set)
+        self.scopes = {'global'}
+        started = time.perf_counter()
+        total = 0
+        try:
+            with keep_dates(Post._meta.get_field('pub_date'),
+                            Comment._meta.get_field('created')), \
+                    deferred_indexes((Post, Comment, Follow),
+                                     options['drop_indexes']):
+                for kind in ('posts', 'comments', 'follows'):
+                    if options[kind]:
+                        total += self.load(kind, options[kind])
+        finally:
+            # и после ошибки: загруженные пачки уже зафиксированы
+            self.finish()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Импортировано строк: {total} за {elapsed:.1f} с '
+                          f'({total / elapsed:,.0f} строк/с с пересборкой)')
+
+    def finish(self):
+        """Однократное обновление того, что при вставке через bulk_create
+        (без сигналов) не обновлялось: только для загруженных постов и
+        подписок и затронутых ими пользователей и групп."""
+        self.stdout.write('Пересчитываем счётчики, ленты и поиск...')
+        for user_ids in chunks(self.user_ids, REBUILD_BATCH):
+            counters.recount_users(user_ids)
+        counters.recount_groups(self.group_ids)
+        for post_ids in chunks(self.imported_posts, REBUILD_BATCH):
+            counters.recount_posts(post_ids)
+            timeline.fan_out_many(post_ids)
+            search.index_posts(post_ids)
+        for user_id, author_ids in self.follows.items():
+            timeline.backfill_many(user_id, author_ids)
+        followed = set().union(*self.follows.values())
+        if any(UserCounters.objects.filter(
+                user_id__in=author_ids,
+                followers_count__gt=settings.TIMELINE_FANOUT_LIMIT).exists()
+               for author_ids in chunks(followed, REBUILD_BATCH)):
+            # списки знаменитостей у читателей могли устареть
+            fragments.bump(timeline.CELEBRITIES_SCOPE)
+        if len(self.scopes) > FRAGMENT_BUMP_LIMIT:
+            cache.clear()
+        else:
+            fragments.bump(*self.scopes)
+
+    def load(self, kind, path):
+        build = getattr(self, f'build_{kind}')
+        model = {'posts': Post, 'comments': Comment, 'follows': Follow}[kind]
+        records = read_records(path, self.options['format'])
+        loaded = 0
+        started = time.perf_counter()
+        for line, chunk in enumerate(chunks(records,
+                                            self.options['chunk_size'])):
+            try:
+                self.resolve_users(chunk)
+                objects = build(chunk)
+            except (KeyError, ValueError) as error:
+                raise CommandError(
+                    f'{path}, пачка {line + 1}: {error!r}') from error
+            with transaction.atomic():
+                if model is Post:
+                    self.allocate_ids(objects)
+                model.objects.bulk_create(
+                    objects, ignore_conflicts=model is Follow)
+            if model is Post:
+                self.remember_posts(chunk, objects)
+            loaded += len(chunk)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{kind}: {loaded} строк, '
+                              f'{loaded / elapsed:,.0f} строк/с')
+        return loaded
+
+    def resolve_users(self, records):
+        """Неизвестных авторов пачки заводит одним bulk_create."""
+        if not self.options['create_users']:
+            return
+        missing = {record[field] for record in records
+                   for field in ('author', 'user') if field in record}
+        missing.difference_update(self.users)
+        if not missing:
+            return
+        password = make_password(None)
+        with transaction.atomic():
+            User.objects.bulk_create(
+                [User(username=name, password=password) for name in missing],
+                ignore_conflicts=True)
+        self.users.update(User.objects.filter(
+            username__in=missing).values_list('username', 'pk'))
+
+    def user_id(self, username):
+        try:
+            return self.users[username]
+        except KeyError:
+            raise KeyError(f'нет пользователя {username}') from None
+
+    def allocate_ids(self, posts):
+        """pk постов пачки, чтобы связать с ними комментарии.
+
+        Где bulk_create возвращает id (PostgreSQL), их выдаёт
+        последовательность. Иначе id назначаются после последнего, и
+        таблица заблокирована до конца транзакции вставки, чтобы
+        параллельная запись не заняла те же id.
+        """
+        if connection.features.can_return_ids_from_bulk_insert:
+            return
+        lock_table(Post)
+        next_id = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        for offset, post in enumerate(posts):
+            post.pk = next_id + offset
+
+    def remember_posts(self, records, posts):
+        for record, post in zip(records, posts):
+            if record.get('id') not in (None, ''):
+                self.post_ids[str(record['id'])] = post.pk
+            self.imported_posts.append(post.pk)
+
+    def build_posts(self, records):
+        posts = []
+        for record in records:
+            group = record.get('group') or None
+            post = Post(
+                author_id=self.user_id(record['author']),
+                group_id=self.groups[group] if group else None,
+                text=record['text'],
+                pub_date=parse_date(record.get('pub_date')),
+                image=record.get('image') or None,
+            )
+            self.user_ids.add(post.author_id)
+            self.scopes.add(f'author:{post.author_id}')
+            if post.group_id:
+                self.group_ids.add(post.group_id)
+                self.scopes.add(f'group:{post.group_id}')
+            posts.append(post)
+        return posts
+
+    def build_comments(self, records):
+        comments = []
+        for record in records:
+            post_id = self.post_ids[str(record['post'])]
+            comment = Comment(
+                post_id=post_id,
+                author_id=self.user_id(record['author']),
+                text=record['text'],
+                created=parse_date(record.get('created')),
+            )
+            self.user_ids.add(comment.author_id)
+            comments.append(comment)
+            self.scopes.add(f'post:{post_id}')
+        return comments
+
+    def build_follows(self, records):
+        follows = []
+        for record in records:
+            user_id = self.user_id(record['user'])
+            author_id = self.user_id(record['author'])
+            if user_id != author_id:
+                follows.append(Follow(user_id=user_id, author_id=author_id))
+                self.follows[user_id].add(author_id)
+                self.user_ids.update((user_id, author_id))
+            self.scopes.update((f'follow:{user_id}', f'author:{author_id}',
+                                f'author:{user_id}'))
+        return follows
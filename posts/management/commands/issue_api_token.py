@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import ApiToken, User
+
+
+class Command(BaseCommand):
+    help = ('Выпускает токен JSON API для пользователя; ключ показывается '
+            'один раз')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f'Нет пользователя {options["username"]}')
+        self.stdout.write(ApiToken.objects.issue(user))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет полнотекстовый индекс постов и комментариев'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite')
+        search.rebuild()
+        self.stdout.write('Поисковый индекс пересобран')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает материализованные ленты подписок из Follow'
+
+    def handle(self, *args, **options):
+        total = timeline.rebuild()
+        self.stdout.write(f'Обработано подписок: {total}')
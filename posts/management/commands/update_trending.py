@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность постов за окно TRENDING_WINDOW и '
+            'вливает накопленные просмотры; запускается по cron')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = trending.recompute()
+        self.stdout.write(f'Постов в популярном: {total} '
+                          f'({time.perf_counter() - started:.2f} с)')
@@ -0,0 +1,138 @@
+import datetime as dt
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from posts import images, thumbnails
+from posts.models import Post
+
+CHECKPOINT_KEY = 'warm_thumbnails:checkpoint:{}'
+
+
+def _generate(post_id, force):
+    try:
+        thumbnails.generate(post_id, force=force)
+    except Exception as error:
+        return f'{post_id}: {error!r}'
+    return None
+
+
+def _warm(post_id, force):
+    """Выполняется в дочернем процессе пула."""
+    try:
+        return _generate(post_id, force)
+    finally:
+        connections.close_all()
+
+
+class InlinePool:
+    """`--workers 0`: всё в текущем процессе (для отладки и тестов)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+
+class Command(BaseCommand):
+    help = ('Строит недостающие адаптивные варианты картинок постов в '
+            'пуле процессов; прерванный запуск продолжается с места '
+            'остановки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=os.cpu_count() or 1,
+                            help='Размер пула процессов; 0 — без пула')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--days', type=int,
+                            help='Только посты за последние N дней')
+        parser.add_argument('--group', action='append', default=[],
+                            dest='groups', metavar='SLUG',
+                            help='Только посты группы (можно повторять)')
+        parser.add_argument('--force', action='store_true',
+                            help='Обработать и посты, отмеченные готовыми, '
+                                 'и перекодировать варианты (после смены '
+                                 'геометрий или форматов)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать сначала, забыв сохранённую позицию')
+
+    def handle(self, *args, **options):
+        posts = self.select(options)
+        checkpoint = CHECKPOINT_KEY.format(self.fingerprint(options))
+        if options['restart']:
+            cache.delete(checkpoint)
+        last_pk = cache.get(checkpoint, 0)
+        if last_pk:
+            self.stdout.write(f'Продолжаем после поста {last_pk}')
+        total = posts.filter(pk__gt=last_pk).count()
+        done = failed = 0
+        started = time.perf_counter()
+        with self.pool(options['workers']) as pool:
+            while True:
+                batch = list(posts.filter(pk__gt=last_pk).order_by(
+                    'pk').values_list('pk', flat=True)[
+                    :options['batch_size']])
+                if not batch:
+                    break
+                if options['workers']:
+                    # новые процессы пула не должны унаследовать
+                    # открытое соединение родителя
+                    connections.close_all()
+                # в своём процессе соединения не закрываются: они общие
+                # с командой
+                task = _warm if options['workers'] else _generate
+                errors = pool.map(task, batch,
+                                  [options['force']] * len(batch))
+                for error in errors:
+                    if error:
+                        failed += 1
+                        self.stderr.write(error)
+                done += len(batch)
+                last_pk = batch[-1]
+                cache.set(checkpoint, last_pk, None)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{done}/{total} постов, {done / elapsed:.1f} в секунду, '
+                    f'ошибок: {failed}')
+        cache.delete(checkpoint)
+        self.stdout.write(f'Готово: {done} постов, ошибок: {failed}')
+
+    def pool(self, workers):
+        if not workers:
+            return InlinePool()
+        connections.close_all()
+        return ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=get_context('fork'))
+
+    def select(self, options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['force']:
+            # у постов до адаптивных вариантов флаг мог остаться от
+            # sorl, а у построенных раньше вариантов нет запасного JPEG
+            posts = posts.filter(
+                Q(thumbnails_ready=False) | ~Q(
+                    image_variants__contains=f'"{images.FALLBACK_FORMAT}"'))
+        if options['days'] is not None:
+            posts = posts.filter(pub_date__gte=timezone.now()
+                                 - dt.timedelta(days=options['days']))
+        if options['groups']:
+            posts = posts.filter(group__slug__in=options['groups'])
+        return posts
+
+    def fingerprint(self, options):
+        """У запусков с разными фильтрами — разные позиции."""
+        key = repr((options['days'], sorted(options['groups']),
+                    options['force']))
+        return hashlib.md5(key.encode()).hexdigest()[:12]
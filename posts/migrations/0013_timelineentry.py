@@ -0,0 +1,60 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Ленты для уже существующих подписок, как после `backfill`:
+    последние посты каждого автора, кроме знаменитостей."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    authors = Follow.objects.order_by().values('author_id').annotate(
+        followers=Count('pk')).filter(
+        followers__lte=settings.TIMELINE_FANOUT_LIMIT).values_list(
+        'author_id', flat=True)
+    for author_id in list(authors):
+        posts = list(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date').values_list('id', 'pub_date')[
+            :settings.TIMELINE_BACKFILL_LIMIT])
+        follower_ids = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        for user_id in follower_ids.iterator():
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(user_id=user_id, post_id=post_id,
+                               pub_date=pub_date)
+                 for post_id, pub_date in posts],
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_auto_20220120_1855'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
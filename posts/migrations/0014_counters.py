@@ -0,0 +1,72 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def _count(model, field):
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    return Coalesce(
+        Subquery(rows.values(field).annotate(total=Count('pk')).values(
+            'total')),
+        Value(0),
+    )
+
+
+def recount(apps, schema_editor):
+    """Счётчики для уже существующих данных (как `counters.recount`,
+    но на моделях этой миграции)."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=pk) for pk in
+         User.objects.values_list('pk', flat=True).iterator()],
+        batch_size=500,
+    )
+    UserCounters.objects.update(
+        posts_count=_count(Post, 'author'),
+        comments_count=_count(Comment, 'author'),
+        followers_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'),
+    )
+    Group.objects.update(posts_count=_count(Post, 'group'))
+    Post.objects.update(comments_count=_count(Comment, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Комментариев')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:14
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # превью старых постов по-прежнему строятся при первом показе
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').exclude(image=None).update(
+        thumbnails_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью готовы'),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_thumbnails_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.TextField(blank=True, editable=False, help_text='JSON: формат -> ширины', verbose_name='Варианты картинки'),
+        ),
+    ]
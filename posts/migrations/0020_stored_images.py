@@ -0,0 +1,47 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:21
+
+from django.db import migrations, models
+import posts.storage
+
+
+def register_existing_images(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredImage = apps.get_model('posts', 'StoredImage')
+    references = (
+        Post.objects.exclude(image='').exclude(image=None)
+        .values('image').annotate(total=models.Count('pk')).order_by()
+    )
+    StoredImage.objects.bulk_create(
+        [StoredImage(name=row['image'], references=row['total'])
+         for row in references.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Путь в хранилище')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок из постов')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Загрузите картинку', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['image'], name='post_image_idx'),
+        ),
+        migrations.RunPython(register_existing_images,
+                             migrations.RunPython.noop),
+    ]
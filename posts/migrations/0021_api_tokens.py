@@ -0,0 +1,24 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_stored_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('key_hash', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256 ключа')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата выпуска')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_api_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTrend',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('comments_key', models.FloatField(null=True, verbose_name='Вклад комментариев')),
+                ('views_key', models.FloatField(null=True, verbose_name='Вклад просмотров')),
+                ('score', models.FloatField(verbose_name='Счёт')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='posttrend',
+            index=models.Index(fields=['-score'], name='post_trend_score_idx'),
+        ),
+    ]
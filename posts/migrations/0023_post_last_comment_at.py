@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_last_comment_at(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(last_comment_at=Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by(
+            '-created').values('created')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_trends'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последний комментарий'),
+        ),
+        migrations.RunPython(fill_last_comment_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def reset_thumbnails_ready(apps, schema_editor):
+    # 0017 отметила старые картинки готовыми в расчёте на sorl-thumbnail,
+    # но карточки теперь собираются из вариантов: без них пост снова
+    # ждёт warm_thumbnails
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').exclude(image=None).filter(
+        image_variants='').update(thumbnails_ready=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_post_last_comment_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_thumbnails_ready,
+                             migrations.RunPython.noop),
+    ]
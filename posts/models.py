@@ -1,10 +1,35 @@
+import hashlib
+import secrets
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models, transaction
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersMixin:
+    """Не перезаписывает счётчики при сохранении загруженного объекта.
+
+    Счётчики меняются только атомарными UPDATE, поэтому `save()`
+    существующей записи (например, из формы редактирования) не должен
+    затирать их устаревшими значениями из памяти.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersMixin, models.Model):
     title = models.CharField("Заголовок",
                              max_length=200,
                              help_text="Назовите как-то кгруппу")
@@ -16,12 +41,24 @@ class Group(models.Model):
                                    max_length=1000,
                                    help_text="расскажите, что происходит "
                                              "в вашей группе )")
+    posts_count = models.PositiveIntegerField("Количество постов",
+                                              default=0,
+                                              editable=False)
+
+    counter_fields = ("posts_count",)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def listing(self):
+        """Посты для лент: автор и группа подтягиваются одним JOIN,
+        число комментариев и время последнего хранятся в самом посте."""
+        return self.select_related("author", "group")
+
+
+class Post(CountersMixin, models.Model):
     text = models.TextField(verbose_name="Текст",
                             help_text="основное содержание поста")
     pub_date = models.DateTimeField("Дата",
@@ -39,9 +76,55 @@ class Post(models.Model):
                               help_text="Название группы")
     image = models.ImageField("Картинка",
                               upload_to="posts/",
+                              storage=ContentAddressedStorage(),
                               blank=True,
                               null=True,
                               help_text="Загрузите картинку")
+    comments_count = models.PositiveIntegerField("Количество комментариев",
+                                                 default=0,
+                                                 editable=False)
+    last_comment_at = models.DateTimeField("Последний комментарий",
+                                           blank=True, null=True,
+                                           editable=False)
+    thumbnails_ready = models.BooleanField("Превью готовы",
+                                           default=False,
+                                           editable=False)
+    image_variants = models.TextField("Варианты картинки",
+                                      blank=True,
+                                      editable=False,
+                                      help_text="JSON: формат -> ширины")
+    image_width = models.PositiveIntegerField("Ширина картинки",
+                                              blank=True, null=True,
+                                              editable=False)
+    image_height = models.PositiveIntegerField("Высота картинки",
+                                               blank=True, null=True,
+                                               editable=False)
+    image_format = models.CharField("Формат картинки", max_length=10,
+                                    blank=True, editable=False)
+    image_size = models.PositiveIntegerField("Размер картинки, байт",
+                                             blank=True, null=True,
+                                             editable=False)
+    image_hash = models.CharField("SHA-256 картинки", max_length=64,
+                                  blank=True, editable=False)
+    image_placeholder = models.TextField("Заглушка картинки (data URI)",
+                                         blank=True, editable=False)
+
+    counter_fields = ("comments_count", "last_comment_at")
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"],
+                         name="post_date_idx"),
+            models.Index(fields=["author", "-pub_date", "-id"],
+                         name="post_author_date_idx"),
+            models.Index(fields=["group", "-pub_date", "-id"],
+                         name="post_group_date_idx"),
+            # посты с одним и тем же файлом в контентно-адресуемом
+            # хранилище
+            models.Index(fields=["image"], name="post_image_idx"),
+        ]
 
     def __str__(self):
         return (self.text)
@@ -63,6 +146,77 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["post", "-created", "-id"],
+                         name="comment_post_created_idx"),
+        ]
+
+
+class FollowManager(models.Manager):
+    """Пакетные подписка и отписка.
+
+    `bulk_create` и удаление без сборщика не вызывают сигналов, поэтому
+    счётчики, ленты и фрагменты обновляются здесь один раз на пачку.
+    """
+
+    def follow_many(self, user, usernames):
+        """Подписывает на авторов из `usernames`; возвращает id тех, на
+        кого подписки ещё не было."""
+        from . import counters, fragments, suggestions, timeline
+
+        author_ids = list(User.objects.filter(
+            username__in=set(usernames)).exclude(pk=user.pk).exclude(
+            following__user=user).order_by("pk").values_list(
+            "pk", flat=True))
+        if not author_ids:
+            return []
+        with transaction.atomic():
+            # конфликт с unique_follow значит, что параллельный запрос
+            # успел подписать раньше; счётчики всё равно пересчитываются
+            self.bulk_create(
+                [self.model(user=user, author_id=author_id)
+                 for author_id in author_ids],
+                ignore_conflicts=True)
+            counters.recount_follows(user.pk, author_ids)
+            timeline.backfill_many(user.pk, author_ids)
+            timeline.followers_changed(author_ids, True)
+        suggestions.record(user.pk, author_ids, True)
+        fragments.bump(*_follow_scopes(user.pk, author_ids))
+        return author_ids
+
+    def unfollow_many(self, user, usernames):
+        """Отписывает от авторов из `usernames`; возвращает id тех, от
+        кого отписка произошла."""
+        from . import counters, fragments, suggestions, timeline
+
+        follows = self.filter(user=user,
+                              author__username__in=set(usernames))
+        author_ids = list(follows.order_by("author_id").values_list(
+            "author_id", flat=True))
+        if not author_ids:
+            return []
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        placeholders = ", ".join(["%s"] * len(author_ids))
+        with transaction.atomic(using=self.db):
+            # одним DELETE, без загрузки строк и сигналов post_delete,
+            # которые `QuerySet.delete()` вызвал бы для каждой подписки
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE user_id = %s "
+                    f"AND author_id IN ({placeholders})",
+                    [user.pk, *author_ids])
+            counters.recount_follows(user.pk, author_ids)
+            timeline.prune(user.pk, *author_ids)
+            timeline.followers_changed(author_ids, False)
+        suggestions.record(user.pk, author_ids, False)
+        fragments.bump(*_follow_scopes(user.pk, author_ids))
+        return author_ids
+
+
+def _follow_scopes(user_id, author_ids):
+    return [f"follow:{user_id}", f"author:{user_id}",
+            *(f"author:{author_id}" for author_id in author_ids)]
 
 
 class Follow(models.Model):
@@ -73,6 +227,8 @@ class Follow(models.Model):
                                on_delete=models.CASCADE,
                                related_name="following")
 
+    objects = FollowManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -80,3 +236,128 @@ class Follow(models.Model):
                 name="unique_follow"
             )
         ]
+        indexes = [
+            models.Index(fields=["author", "user"],
+                         name="follow_author_user_idx"),
+        ]
+
+
+class UserCounters(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Обновляются F()-выражениями при записи постов, комментариев и
+    подписок; `manage.py recount_counters` пересчитывает их целиком.
+    """
+    user = models.OneToOneField(User, verbose_name="Пользователь",
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="counters")
+    posts_count = models.PositiveIntegerField("Постов", default=0)
+    comments_count = models.PositiveIntegerField("Комментариев", default=0)
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0)
+    following_count = models.PositiveIntegerField("Подписок", default=0)
+
+    def __str__(self):
+        return f"Счётчики {self.user}"
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому лента
+    `/follow/` читается одним диапазоном по индексу (user, -pub_date)
+    без соединения через `Follow`.
+    """
+    user = models.ForeignKey(User, verbose_name="Читатель",
+                             on_delete=models.CASCADE,
+                             related_name="timeline")
+    post = models.ForeignKey(Post, verbose_name="Пост",
+                             on_delete=models.CASCADE,
+                             related_name="timeline_entries")
+    pub_date = models.DateTimeField("Дата публикации поста")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"],
+                         name="timeline_user_date_post_idx"),
+        ]
+
+
+class PostTrend(models.Model):
+    """Популярность поста для ленты `/trending/`.
+
+    Ключи хранятся в логарифмической шкале: `ln Σ w·e^(λ·t)` по событиям
+    (комментариям или просмотрам) с весом `w` во время `t`. Затухание
+    одинаково для всех постов, поэтому сортировка по `score` верна в
+    любой момент и ключи не нужно пересчитывать со временем.
+    """
+    post = models.OneToOneField(Post, verbose_name="Пост",
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="trend")
+    comments_key = models.FloatField("Вклад комментариев", null=True)
+    views_key = models.FloatField("Вклад просмотров", null=True)
+    score = models.FloatField("Счёт")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score"], name="post_trend_score_idx"),
+        ]
+
+
+class StoredImage(models.Model):
+    """Файл картинки в контентно-адресуемом хранилище.
+
+    `references` — сколько постов ссылается на файл; меняется сигналами
+    сохранения и удаления постов, пересчитывается
+    `manage.py recount_counters`.
+    """
+    name = models.CharField("Путь в хранилище",
+                            max_length=255,
+                            primary_key=True)
+    references = models.PositiveIntegerField("Ссылок из постов",
+                                             default=0)
+    created = models.DateTimeField("Дата загрузки", auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ApiTokenManager(models.Manager):
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def issue(self, user):
+        """Создаёт токен и возвращает ключ; в базе хранится только его
+        хэш, поэтому показать ключ повторно нельзя."""
+        key = secrets.token_hex(20)
+        self.create(key_hash=self.digest(key), user=user)
+        return key
+
+    def user_for(self, key):
+        token = self.select_related("user").filter(
+            key_hash=self.digest(key), user__is_active=True).first()
+        return None if token is None else token.user
+
+
+class ApiToken(models.Model):
+    """Токен доступа к JSON API (заголовок `Authorization: Token <ключ>`)."""
+    key_hash = models.CharField("SHA-256 ключа",
+                                max_length=64,
+                                primary_key=True)
+    user = models.ForeignKey(User, verbose_name="Пользователь",
+                             on_delete=models.CASCADE,
+                             related_name="api_tokens")
+    created = models.DateTimeField("Дата выпуска", auto_now_add=True)
+
+    objects = ApiTokenManager()
+
+    def __str__(self):
+        return f"Токен {self.user}"
@@ -0,0 +1,217 @@
+"""Курсорная (keyset) пагинация лент постов.
+
+Классический `Paginator` превращает `?page=N` в `OFFSET N * per_page` и
+на каждый запрос считает `COUNT(*)`, поэтому дальние страницы больших
+таблиц открываются секундами. Курсорная страница выбирает записи строго
+после (или до) ключа сортировки последней показанной записи и не считает
+общее количество.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject, lazy
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorPage:
+    """Страница курсорной пагинации, совместимая с `paginator.html`."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинатор по ключу сортировки `ordering` (по умолчанию
+    `(-pub_date, -id)`), отдающий непрозрачные токены соседних страниц."""
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    def encode_cursor(self, obj, direction):
+        values = [direction]
+        for field in self.ordering:
+            name = field.lstrip('-')
+            # строки `values()` приходят словарями
+            if isinstance(obj, dict):
+                value = obj[name]
+            else:
+                value = getattr(obj, name)
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value)
+        data = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def key_fields(self):
+        """Поля модели (или аннотации) ключа сортировки: по ним значения
+        из курсора приводятся к нужным типам."""
+        query = self.object_list.query
+        fields = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if name in query.annotations:
+                fields.append(query.annotations[name].output_field)
+            else:
+                fields.append(self.object_list.model._meta.get_field(name))
+        return fields
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения ключа) или None для
+        испорченного токена."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            return None
+        if (not isinstance(values, list)
+                or len(values) != len(self.ordering) + 1
+                or values[0] not in (NEXT, PREVIOUS)):
+            return None
+        # токен приходит от клиента: значение неверного типа должно дать
+        # первую страницу, а не ошибку в запросе
+        try:
+            key = [field.to_python(value) for field, value in
+                   zip(self.key_fields(), values[1:])]
+        except (ValidationError, ValueError, TypeError):
+            return None
+        if None in key:
+            return None
+        return values[0], key
+
+    def _keyset(self, values, backwards):
+        """Условие «строго после ключа» в порядке `ordering` (или «строго
+        до ключа» при `backwards`)."""
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backwards
+            lookups = {
+                prefix.lstrip('-'): value for prefix, value in
+                zip(self.ordering[:position], values[:position])
+            }
+            lookups[f"{name}__{'lt' if descending else 'gt'}"] = values[
+                position]
+            condition |= Q(**lookups)
+        return condition
+
+    def _reversed_ordering(self):
+        return [field.lstrip('-') if field.startswith('-') else f'-{field}'
+                for field in self.ordering]
+
+    def get_page(self, cursor=None):
+        """Страница после/до курсора; без курсора или с испорченным
+        курсором — первая страница."""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        queryset = self.object_list
+        if decoded is None:
+            direction = NEXT
+            items = list(queryset.order_by(*self.ordering)[
+                :self.per_page + 1])
+        else:
+            direction, values = decoded
+            backwards = direction == PREVIOUS
+            ordering = (self._reversed_ordering() if backwards
+                        else self.ordering)
+            items = list(queryset.filter(
+                self._keyset(values, backwards)).order_by(*ordering)[
+                :self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == PREVIOUS:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+        return CursorPage(
+            items, self,
+            next_cursor=(self.encode_cursor(items[-1], NEXT)
+                         if has_next and items else None),
+            previous_cursor=(self.encode_cursor(items[0], PREVIOUS)
+                             if has_previous and items else None),
+        )
+
+
+def paginate(request, queryset, ordering=('-pub_date', '-id'), count=None):
+    """Возвращает (paginator, page) для ленты постов.
+
+    `?cursor=` — курсорная страница. Ленты с известным заранее `count`
+    (из счётчиков) без курсора отдают классическую страницу `Paginator`:
+    номера страниц (`?page=N`) работают только для первых
+    `PAGINATOR_MAX_PAGE` страниц, а ссылка «Следующая» всегда ведёт на
+    курсор, поэтому глубокие страницы читаются без OFFSET. `count`
+    влияет только на номера страниц, но не на то, какие посты на них.
+
+    Без `count` номера страниц стоили бы `COUNT(*)` по всей ленте на
+    каждый запрос, поэтому такие ленты листаются курсором, а
+    классическая страница отдаётся только по явному `?page=N`.
+    """
+    queryset = queryset.order_by(*ordering)
+    cursor_paginator = CursorPaginator(queryset, settings.POSTS_PER_PAGE,
+                                       ordering)
+    cursor = request.GET.get('cursor')
+    if cursor or (count is None and 'page' not in request.GET):
+        # страница выбирается при первом обращении: при попадании в кэш
+        # фрагментов запроса за постами нет
+        return cursor_paginator, SimpleLazyObject(
+            lambda: cursor_paginator.get_page(cursor))
+    paginator = Paginator(queryset, settings.POSTS_PER_PAGE)
+    page_number = request.GET.get('page')
+    try:
+        page_number = min(int(page_number), settings.PAGINATOR_MAX_PAGE)
+    except (TypeError, ValueError):
+        page_number = 1
+    if count is None:
+        page = paginator.get_page(page_number)
+    else:
+        # счётчик задаёт только номера страниц: строки берутся срезом
+        # самого запроса, поэтому разошедшийся счётчик не обрезает
+        # страницу
+        paginator.count = count
+        number = max(1, min(page_number, paginator.num_pages))
+        bottom = (number - 1) * paginator.per_page
+        page = Page(queryset[bottom:bottom + paginator.per_page], number,
+                    paginator)
+    page.page_links = range(
+        1, min(paginator.num_pages, settings.PAGINATOR_MAX_PAGE) + 1)
+    page.next_cursor = None
+    if page.has_next():
+        # курсор вычисляется только при выводе ссылки, чтобы страница из
+        # кэша фрагментов не выполняла запрос за постами
+        page.next_cursor = lazy(
+            lambda: cursor_paginator.encode_cursor(
+                page.object_list[len(page) - 1], NEXT), str)()
+    return paginator, page
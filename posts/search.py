@@ -0,0 +1,203 @@
+"""Полнотекстовый поиск по постам и комментариям (SQLite FTS5).
+
+Тексты постов и комментариев лежат в виртуальной таблице `posts_search`,
+которую синхронизируют сигналы записи и удаления. Документ поста имеет
+rowid `2 * id`, документ комментария — `2 * id + 1`, колонка `post_id`
+указывает на пост, к которому относится документ. Результаты
+ранжируются по BM25 и листаются курсором по (score, rowid).
+"""
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import NEXT, PREVIOUS, CursorPage, CursorPaginator
+
+TABLE = 'posts_search'
+# границы подсветки в snippet(); в тексте постов их не бывает,
+# поэтому после экранирования их можно заменить на <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 16
+TOKEN_RE = re.compile(r'\w+')
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def post_rowid(post_id):
+    return 2 * post_id
+
+
+def comment_rowid(comment_id):
+    return 2 * comment_id + 1
+
+
+def _replace(rowid, post_id, text):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, body, post_id) VALUES (%s, %s, %s)',
+            [rowid, text, post_id])
+
+
+def _delete(rowid):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+
+
+def index_post(post):
+    _replace(post_rowid(post.pk), post.pk, post.text)
+
+
+def unindex_post(post):
+    _delete(post_rowid(post.pk))
+
+
+def index_comment(comment):
+    _replace(comment_rowid(comment.pk), comment.post_id, comment.text)
+
+
+def unindex_comment(comment):
+    _delete(comment_rowid(comment.pk))
+
+
+def rebuild():
+    """Заново заполняет индекс из таблиц постов и комментариев."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, body, post_id) '
+            f'SELECT 2 * id, text, id FROM posts_post')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, body, post_id) '
+            f'SELECT 2 * id + 1, text, post_id FROM posts_comment')
+
+
+def index_posts(post_ids):
+    """Добавляет в индекс посты с `post_ids` и их комментарии, вставленные
+    без сигналов (импорт)."""
+    if not available() or not post_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, body, post_id) '
+            f'SELECT 2 * id, text, id FROM posts_post '
+            f'WHERE id IN ({placeholders})', list(post_ids))
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, body, post_id) '
+            f'SELECT 2 * id + 1, text, post_id FROM posts_comment '
+            f'WHERE post_id IN ({placeholders})', list(post_ids))
+
+
+def match_expression(query):
+    """Переводит строку пользователя в выражение MATCH: каждое слово —
+    отдельная фраза в кавычках, поэтому синтаксис FTS5 во вводе не
+    интерпретируется."""
+    words = TOKEN_RE.findall(query or '')
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def matching_posts(query):
+    """Условие `pk__in` для постов, у которых совпал текст поста или
+    комментария (используется в админке вместо LIKE)."""
+    return RawSQL(
+        f'SELECT post_id FROM {TABLE} WHERE {TABLE} MATCH %s',
+        [match_expression(query)])
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(
+        MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SearchHit:
+    """Найденный документ: пост или комментарий к нему."""
+
+    def __init__(self, rowid, score, snippet, post):
+        self.rowid = rowid
+        self.score = score
+        self.snippet = highlight(snippet)
+        self.post = post
+        self.is_comment = rowid % 2 == 1
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация по рангу BM25 (меньше — релевантнее)."""
+
+    def __init__(self, query, per_page, group=None, author=None):
+        super().__init__(None, per_page, ordering=('score', 'rowid'))
+        self.expression = match_expression(query)
+        self.group = group
+        self.author = author
+
+    def key_fields(self):
+        return [models.FloatField(), models.IntegerField()]
+
+    def _fetch(self, values, backwards):
+        conditions, params = [], [self.expression]
+        if self.group is not None:
+            conditions.append('post.group_id = %s')
+            params.append(self.group.pk)
+        if self.author is not None:
+            conditions.append('post.author_id = %s')
+            params.append(self.author.pk)
+        if values is not None:
+            sign = '<' if backwards else '>'
+            conditions.append(
+                f'(hit.score {sign} %s OR '
+                f'(hit.score = %s AND hit.rowid {sign} %s))')
+            params.extend([values[0], values[0], values[1]])
+        order = 'DESC' if backwards else 'ASC'
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        sql = (
+            f'SELECT hit.rowid, hit.score, hit.snippet, hit.post_id FROM ('
+            f'SELECT rowid, post_id, bm25({TABLE}) AS score, '
+            f"snippet({TABLE}, 0, char(2), char(3), '…', "
+            f'{SNIPPET_TOKENS}) AS snippet '
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s) AS hit '
+            f'INNER JOIN posts_post AS post ON post.id = hit.post_id '
+            f'{where} ORDER BY hit.score {order}, hit.rowid {order} '
+            f'LIMIT %s'
+        )
+        params.append(self.per_page + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def get_page(self, cursor=None):
+        if not self.expression or not available():
+            return CursorPage([], self)
+        decoded = self.decode_cursor(cursor) if cursor else None
+        direction, values = decoded or (NEXT, None)
+        rows = self._fetch(values, direction == PREVIOUS)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+        posts = Post.objects.listing().in_bulk(
+            {post_id for *_, post_id in rows})
+        hits = [SearchHit(rowid, score, snippet, posts[post_id])
+                for rowid, score, snippet, post_id in rows
+                if post_id in posts]
+        return CursorPage(
+            hits, self,
+            next_cursor=(self.encode_cursor(hits[-1], NEXT)
+                         if has_next and hits else None),
+            previous_cursor=(self.encode_cursor(hits[0], PREVIOUS)
+                             if has_previous and hits else None),
+        )
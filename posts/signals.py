@@ -0,0 +1,191 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import counters, fragments, search, suggestions, timeline, trending
+from .models import Comment, Follow, Post, User, UserCounters
+
+
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, raw=False, **kwargs):
+    """Новому пользователю сразу заводим строку счётчиков"""
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_loaded(sender, instance, **kwargs):
+    """Запоминаем группу и файл картинки, чтобы при редактировании
+    поправить счётчики"""
+    instance._loaded_group_id = instance.group_id
+    # сырое значение поля, без создания FieldFile; у нового файла это
+    # ещё не имя в хранилище
+    image = instance.__dict__.get('image')
+    instance._loaded_image = image if isinstance(image, str) else None
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладываем новый пост по лентам подписчиков"""
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.shift_user(instance.author_id, posts_count=1)
+        counters.shift_group(instance.group_id, 1)
+    elif instance.group_id != instance._loaded_group_id:
+        counters.shift_group(instance._loaded_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, posts_count=-1)
+    counters.shift_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._loaded_image
+    new = instance.image.name
+    if new != old:
+        counters.shift_image(old, -1)
+        counters.shift_image(new, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_image(sender, instance, **kwargs):
+    counters.shift_image(instance.image.name, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.shift_user(instance.author_id, comments_count=1)
+        counters.shift_post(instance.post_id, 1, instance.created)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, comments_count=-1)
+    counters.shift_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """После подписки дозаполняем ленту постами автора"""
+    if created:
+        counters.shift_user(instance.author_id, followers_count=1)
+        counters.shift_user(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        timeline.followers_changed([instance.author_id], True)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """После отписки убираем посты автора из ленты"""
+    counters.shift_user(instance.author_id, followers_count=-1)
+    counters.shift_user(instance.user_id, following_count=-1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.followers_changed([instance.author_id], False)
+
+
+@receiver(post_save, sender=Follow)
+def record_follow(sender, instance, created, **kwargs):
+    if created:
+        suggestions.record(instance.user_id, [instance.author_id], True)
+
+
+@receiver(post_delete, sender=Follow)
+def record_unfollow(sender, instance, **kwargs):
+    suggestions.record(instance.user_id, [instance.author_id], False)
+
+
+@receiver(post_save, sender=Comment)
+def trend_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        trending.record_comment(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def mark_deleting_post(sender, instance, **kwargs):
+    """Комментарии удаляемого поста удаляются каскадом раньше него: их
+    пересчитывать незачем, счёт поста уйдёт вместе с ним"""
+    trending.deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def untrend_comment(sender, instance, **kwargs):
+    if instance.post_id not in trending.deleting_posts():
+        trending.recount_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Post)
+def untrend_post(sender, instance, **kwargs):
+    trending.deleting_posts().discard(instance.pk)
+    trending.forget(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    search.index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.unindex_comment(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def expire_post_fragments(sender, instance, **kwargs):
+    """Сбрасываем кэш фрагментов лент, где виден пост"""
+    scopes = fragments.post_scopes(instance.author_id, instance.group_id,
+                                   instance.pk)
+    if instance._loaded_group_id not in (None, instance.group_id):
+        scopes.append(f'group:{instance._loaded_group_id}')
+    fragments.bump(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_comment_fragments(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'group_id').first()
+    if post is None:
+        fragments.bump(f'post:{instance.post_id}')
+    else:
+        fragments.bump(*fragments.post_scopes(
+            post['author_id'], post['group_id'], instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def expire_follow_fragments(sender, instance, **kwargs):
+    """Меняются лента подписок и счётчики в карточке автора"""
+    fragments.bump(f'follow:{instance.user_id}',
+                   f'author:{instance.author_id}',
+                   f'author:{instance.user_id}')
+
+
+# должен быть зарегистрирован последним: обработчики выше сравнивают
+# старые группу и картинку поста с новыми
+@receiver(post_save, sender=Post)
+def remember_saved(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = instance.image.name
@@ -0,0 +1,48 @@
+"""Контентно-адресуемое хранилище картинок постов.
+
+Файл называется по SHA-256 содержимого (`posts/ab/ab12….jpg`), поэтому
+одинаковые загрузки хранятся один раз, а адаптивные варианты, ключом
+которых служит имя файла, общие у всех постов с этой картинкой. Содержимое по адресу никогда не меняется:
+веб-сервер может отдавать `/media/posts/` с
+`Cache-Control: public, max-age=31536000, immutable`.
+
+Сколько постов ссылается на файл, хранит `StoredImage.references`;
+файлы без ссылок удаляет сборщик мусора, а не сохранение поста.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_name(name, content):
+    """Имя файла по содержимому; каталог и расширение берутся из
+    исходного имени."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    digest = digest.hexdigest()
+    directory = posixpath.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        if self.exists(name):
+            # такие байты уже сохранены: новый пост ссылается на тот же
+            # файл и те же превью; свежее время изменения не даёт
+            # сборщику мусора удалить файл, пока пост сохраняется
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
@@ -0,0 +1,347 @@
+"""Подсказки «кого почитать»: авторы, на которых подписаны мои авторы.
+
+Граф подписок держится в памяти процесса в формате CSR: пользователи
+пронумерованы плотными индексами по возрастанию id (`ids`), подписки
+пользователя `i` — срез `targets[offsets[i]:offsets[i + 1]]` с индексами
+авторов. Кандидаты ранжируются по числу моих авторов, подписанных на
+них, при равенстве — по числу подписчиков.
+
+Полный проход по `Follow` делает не запрос, а команда
+`manage.py build_suggestions` (по cron): она сохраняет массивы в файл
+`SUGGESTIONS_GRAPH_PATH`, и процессы подхватывают свежий файл без
+обращения к базе. Пока файла нет, подсказок нет. Новые подписки догружаются по возрастанию `Follow.id`
+не чаще `SUGGESTIONS_REFRESH_INTERVAL`, подписки и отписки текущего
+процесса применяются сразу как дельты поверх CSR; отписки в других
+процессах видны после следующего запуска команды. Массивы — int32
+`ndarray`, второй шаг считается векторно.
+"""
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from . import fragments
+from .models import Follow, User
+
+CACHE_KEY = 'suggestions:{}:{}'
+
+logger = logging.getLogger(__name__)
+
+
+class FollowGraph:
+    """Граф подписок в CSR с дельтами поверх него."""
+
+    def __init__(self, users, authors, last_follow_id=0):
+        self._build_arrays(np.asarray(users, dtype=np.int32),
+                           np.asarray(authors, dtype=np.int32))
+        self._init_deltas(last_follow_id)
+
+    def _init_deltas(self, last_follow_id):
+        self.last_follow_id = last_follow_id
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.built_at = self.refreshed_at = time.monotonic()
+
+    def _build_arrays(self, users, authors):
+        order = np.lexsort((authors, users))
+        users, authors = users[order], authors[order]
+        unique = np.ones(len(users), dtype=bool)
+        unique[1:] = (users[1:] != users[:-1]) | (authors[1:] != authors[:-1])
+        users, authors = users[unique], authors[unique]
+        self.ids = np.union1d(users, authors).astype(np.int32)
+        self.targets = np.searchsorted(self.ids, authors).astype(np.int32)
+        self.offsets = np.zeros(len(self.ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(np.searchsorted(self.ids, users),
+                              minlength=len(self.ids)),
+                  out=self.offsets[1:])
+        self.followers = np.bincount(
+            self.targets, minlength=len(self.ids)).astype(np.int32)
+
+    @classmethod
+    def load(cls):
+        """Граф из таблицы подписок; память — два int32 на подписку."""
+        users, authors = array('i'), array('i')
+        last_follow_id = 0
+        rows = Follow.objects.order_by().values_list(
+            'pk', 'user_id', 'author_id').iterator(chunk_size=10000)
+        for pk, user_id, author_id in rows:
+            users.append(user_id)
+            authors.append(author_id)
+            last_follow_id = max(last_follow_id, pk)
+        return cls(users, authors, last_follow_id)
+
+    def save(self, path):
+        """Сохраняет CSR в файл `.npz`; запись атомарна (через
+        временный файл), читатели не видят недописанный граф."""
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, ids=self.ids, targets=self.targets,
+                     offsets=self.offsets, followers=self.followers,
+                     last_follow_id=np.int64(self.last_follow_id))
+        os.replace(temporary, path)
+
+    @classmethod
+    def open(cls, path):
+        """Граф из файла `save()`: без запросов к базе."""
+        graph = cls.__new__(cls)
+        with np.load(path) as arrays:
+            graph.ids = arrays['ids']
+            graph.targets = arrays['targets']
+            graph.offsets = arrays['offsets']
+            graph.followers = arrays['followers']
+            graph._init_deltas(int(arrays['last_follow_id']))
+        return graph
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _has_edge(self, user_id, author_id):
+        row = self._row(user_id)
+        if row is None:
+            return False
+        targets = self.targets[self.offsets[row]:self.offsets[row + 1]]
+        return author_id in self.ids[targets]
+
+    def add(self, user_id, author_id):
+        # дельта только сверх CSR: иначе подписка посчиталась бы дважды
+        self.removed[user_id].discard(author_id)
+        if not self._has_edge(user_id, author_id):
+            self.added[user_id].add(author_id)
+
+    def remove(self, user_id, author_id):
+        self.added[user_id].discard(author_id)
+        if self._has_edge(user_id, author_id):
+            self.removed[user_id].add(author_id)
+
+    def pending(self):
+        """Число дельт поверх CSR."""
+        return (sum(map(len, self.added.values()))
+                + sum(map(len, self.removed.values())))
+
+    def refresh(self):
+        """Догружает подписки, появившиеся после построения графа."""
+        rows = Follow.objects.filter(pk__gt=self.last_follow_id).order_by(
+            'pk').values_list('pk', 'user_id', 'author_id')
+        for pk, user_id, author_id in rows.iterator():
+            self.add(user_id, author_id)
+            self.last_follow_id = pk
+        self.refreshed_at = time.monotonic()
+
+    def compacted(self):
+        """Новый граф, в котором дельты влиты в CSR."""
+        users, authors = [], []
+        for user_id, author_ids in self.added.items():
+            users.extend([user_id] * len(author_ids))
+            authors.extend(author_ids)
+        removed = [(user_id, author_id)
+                   for user_id, author_ids in self.removed.items()
+                   for author_id in author_ids]
+        rows = np.repeat(self.ids, np.diff(self.offsets))
+        columns = self.ids[self.targets]
+        if removed:
+            codes = rows.astype(np.int64) << 32 | columns
+            dropped = np.array([user_id << 32 | author_id
+                                for user_id, author_id in removed],
+                               dtype=np.int64)
+            kept = ~np.isin(codes, dropped)
+            rows, columns = rows[kept], columns[kept]
+        users = np.concatenate([rows, np.array(users, dtype=np.int32)])
+        authors = np.concatenate(
+            [columns, np.array(authors, dtype=np.int32)])
+        graph = FollowGraph(users, authors, self.last_follow_id)
+        graph.built_at = self.built_at
+        return graph
+
+    def _row(self, user_id):
+        position = bisect_left(self.ids, user_id)
+        if position < len(self.ids) and self.ids[position] == user_id:
+            return position
+        return None
+
+    def followees(self, user_id):
+        """Множество id авторов, на которых подписан пользователь."""
+        row = self._row(user_id)
+        authors = set()
+        if row is not None:
+            authors.update(
+                self.ids[target] for target in
+                self.targets[self.offsets[row]:self.offsets[row + 1]])
+        authors |= self.added.get(user_id, set())
+        authors -= self.removed.get(user_id, set())
+        return {int(author_id) for author_id in authors}
+
+    def suggest(self, user_id, limit):
+        """До `limit` пар (id автора, число общих подписок)."""
+        first = self.followees(user_id)
+        if not first:
+            return []
+        extra = [author_id for followee in first
+                 for author_id in self.added.get(followee, ())]
+        missing = [author_id for followee in first
+                   for author_id in self.removed.get(followee, ())]
+        excluded = first | {user_id}
+        return self._suggest_arrays(first, extra, missing, excluded, limit)
+
+    def _suggest_arrays(self, first, extra, missing, excluded, limit):
+        first = np.fromiter(first, dtype=np.int32, count=len(first))
+        rows = np.searchsorted(self.ids, first)
+        inside = rows < len(self.ids)
+        rows, first = rows[inside], first[inside]
+        rows = rows[self.ids[rows] == first]
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        # позиции всех срезов `targets` одним массивом, без цикла
+        positions = (np.repeat(starts - np.cumsum(lengths) + lengths,
+                               lengths)
+                     + np.arange(lengths.sum()))
+        candidates = self.ids[self.targets[positions]]
+        if extra:
+            candidates = np.concatenate(
+                [candidates, np.array(extra, dtype=np.int32)])
+        authors, overlap = np.unique(candidates, return_counts=True)
+        if missing:
+            gone, gone_counts = np.unique(np.array(missing, dtype=np.int32),
+                                          return_counts=True)
+            positions = np.searchsorted(authors, gone)
+            found = positions < len(authors)
+            found[found] = authors[positions[found]] == gone[found]
+            overlap[positions[found]] -= gone_counts[found]
+        keep = (overlap > 0) & ~np.isin(
+            authors, np.fromiter(excluded, dtype=np.int32))
+        authors, overlap = authors[keep], overlap[keep]
+        if not len(authors):
+            return []
+        followers = np.zeros(len(authors), dtype=np.int64)
+        if len(self.ids):
+            rows = np.minimum(np.searchsorted(self.ids, authors),
+                              len(self.ids) - 1)
+            followers = np.where(self.ids[rows] == authors,
+                                 self.followers[rows], 0)
+        score = overlap.astype(np.int64) << 32 | followers
+        top = np.arange(len(score))
+        if len(score) > limit:
+            top = np.argpartition(-score, limit)[:limit]
+        top = top[np.lexsort((authors[top], -score[top]))]
+        return [(int(authors[i]), int(overlap[i])) for i in top]
+
+
+_graph = None
+# время изменения файла, из которого загружен `_graph`
+_graph_mtime = None
+# предупреждение об отсутствии файла пишется в лог один раз
+_missing_reported = False
+# RLock: `for_user` держит блокировку вокруг `graph()` и `suggest()`
+_lock = threading.RLock()
+
+
+def _snapshot_mtime():
+    try:
+        return os.stat(settings.SUGGESTIONS_GRAPH_PATH).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def build(path=None):
+    """Строит граф по всей таблице подписок и сохраняет его для
+    процессов; возвращает граф. Вызывается командой
+    `build_suggestions`."""
+    graph = FollowGraph.load()
+    graph.save(path or settings.SUGGESTIONS_GRAPH_PATH)
+    return graph
+
+
+def graph():
+    """Граф процесса: загружается из файла `build_suggestions` (заново,
+    когда файл обновился) и догружается новыми подписками по интервалу.
+
+    Без файла (команда ещё не запускалась) возвращает `None`: полный
+    проход по `Follow` в запросе остановил бы страницу на миллионах
+    подписок.
+    """
+    global _graph, _graph_mtime, _missing_reported
+    with _lock:
+        now = time.monotonic()
+        if (_graph is None
+                or now - _graph.refreshed_at
+                > settings.SUGGESTIONS_REFRESH_INTERVAL):
+            mtime = _snapshot_mtime()
+            if mtime is not None and mtime != _graph_mtime:
+                fresh = FollowGraph.open(settings.SUGGESTIONS_GRAPH_PATH)
+                if _graph is not None:
+                    # свои отписки, которых в файле могло ещё не быть
+                    for user_id, author_ids in _graph.removed.items():
+                        for author_id in author_ids:
+                            fresh.remove(user_id, author_id)
+                _graph, _graph_mtime = fresh, mtime
+                _graph.refresh()
+            elif _graph is not None:
+                _graph.refresh()
+        if _graph is None:
+            if not _missing_reported:
+                _missing_reported = True
+                logger.warning(
+                    'Нет графа подписок %s: подсказки появятся после '
+                    'manage.py build_suggestions',
+                    settings.SUGGESTIONS_GRAPH_PATH)
+            return None
+        if _graph.pending() > settings.SUGGESTIONS_COMPACT_EDGES:
+            _graph = _graph.compacted()
+        return _graph
+
+
+def reset():
+    """Забывает граф процесса (следующее обращение загрузит его заново)."""
+    global _graph, _graph_mtime, _missing_reported
+    with _lock:
+        _graph = _graph_mtime = None
+        _missing_reported = False
+
+
+def record(user_id, author_ids, followed):
+    """Применяет подписку или отписку к уже построенному графу."""
+    with _lock:
+        if _graph is None:
+            return
+        for author_id in author_ids:
+            if followed:
+                _graph.add(user_id, author_id)
+            else:
+                _graph.remove(user_id, author_id)
+
+
+def signature(user):
+    """Строка, которая меняется вместе с подсказками пользователя (для
+    ETag страниц, где они показаны)."""
+    return ','.join(f"{found['username']}:{found['overlap']}"
+                    for found in for_user(user))
+
+
+def for_user(user):
+    """Подсказки для пользователя: [{'username': ..., 'overlap': ...}].
+
+    Результат кэшируется до следующей подписки или отписки
+    пользователя (ключ включает поколение его ленты). Пока граф не
+    построен командой, подсказок нет, и пустой список не кэшируется."""
+    key = CACHE_KEY.format(user.pk,
+                           fragments.generation(f'follow:{user.pk}'))
+    found = cache.get(key)
+    if found is None:
+        with _lock:
+            current = graph()
+            if current is None:
+                return []
+            ranked = current.suggest(user.pk, settings.SUGGESTIONS_LIMIT)
+        names = dict(User.objects.filter(
+            pk__in=[author_id for author_id, _ in ranked],
+            is_active=True).values_list('pk', 'username')) if ranked else {}
+        found = [{'username': names[author_id], 'overlap': overlap}
+                 for author_id, overlap in ranked if author_id in names]
+        cache.set(key, found, settings.SUGGESTIONS_CACHE_TIMEOUT)
+    return found
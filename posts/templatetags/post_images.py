@@ -0,0 +1,24 @@
+from django import template
+
+from posts import images
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post):
+    """`<picture>` с адаптивными вариантами картинки поста; запасной
+    `<img>` — один из вариантов или оригинал, пока варианты не готовы."""
+    style = 'height: auto'
+    if post.image_placeholder:
+        # размытая заглушка видна, пока картинка не загрузилась
+        style += (f'; background: url({post.image_placeholder}) '
+                  'center / cover')
+    return {
+        'post': post,
+        'sources': images.sources(post),
+        'fallback': images.fallback(post),
+        'sizes': f'(max-width: {images.CARD_WIDTH}px) 100vw, '
+                 f'{images.CARD_WIDTH}px',
+        'style': style,
+    }
@@ -0,0 +1,137 @@
+from io import StringIO
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts.models import ApiToken, Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='api_reader')
+        cls.author = User.objects.create(username='api_author',
+                                         first_name='Лев')
+        cls.group = Group.objects.create(title='API', slug='api',
+                                         description='Много букв')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}',
+                                group=cls.group if i % 2 else None)
+            for i in range(5)
+        ]
+        for i in range(3):
+            Comment.objects.create(post=cls.posts[-1], author=cls.reader,
+                                   text=f'Комментарий {i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.key = ApiToken.objects.issue(self.reader)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_requires_token(self):
+        url = reverse('api:posts')
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = Client(HTTP_AUTHORIZATION='Token wrong').get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_embedded_author_and_group(self):
+        data = self.get(reverse('api:posts'))
+        newest = data['results'][0]
+        self.assertEqual(newest['id'], self.posts[-1].pk)
+        self.assertEqual(newest['author']['username'], 'api_author')
+        self.assertEqual(newest['author']['first_name'], 'Лев')
+        self.assertIsNone(newest['group'])
+        self.assertEqual(data['results'][1]['group']['slug'], 'api')
+        self.assertEqual(newest['comments_count'], 3)
+
+    def test_sparse_fields(self):
+        data = self.get(reverse('api:posts'), fields='id,text')
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        response = self.client.get(reverse('api:posts'), {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        url = reverse('api:user_posts', args=[self.author.username])
+        first = self.get(url, limit=2, fields='id')
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([post['id'] for post in second['results']],
+                         [self.posts[2].pk, self.posts[1].pk])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_comments_group_and_follow(self):
+        comments = self.get(reverse('api:comments',
+                                    args=[self.posts[-1].pk]))
+        self.assertEqual([comment['text'] for comment in comments['results']],
+                         ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'])
+        group_posts = self.get(reverse('api:group_posts',
+                                       args=[self.group.slug]))
+        self.assertEqual(len(group_posts['results']), 2)
+        self.assertEqual(self.get(reverse('api:groups'))['results'][0][
+            'posts_count'], 2)
+        feed = self.get(reverse('api:follow_feed'))
+        self.assertEqual(len(feed['results']), 5)
+        follows = self.get(reverse('api:follows'))
+        self.assertEqual(follows['results'][0]['author']['id'],
+                         self.author.pk)
+        self.assertEqual(self.get(reverse(
+            'api:post', args=[self.posts[0].pk]))['text'], 'Пост 0')
+        self.assertEqual(self.client.get(
+            reverse('api:post', args=[10 ** 6])).status_code, 404)
+
+    def test_etag(self):
+        for url in [reverse('api:posts'), reverse('api:groups')]:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        url = reverse('api:posts')
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_query_budget(self):
+        """Число запросов не зависит от числа строк на странице."""
+        urls = [
+            reverse('api:posts'),
+            reverse('api:post', args=[self.posts[0].pk]),
+            reverse('api:comments', args=[self.posts[-1].pk]),
+            reverse('api:groups'),
+            reverse('api:group_posts', args=[self.group.slug]),
+            reverse('api:user_posts', args=[self.author.username]),
+            reverse('api:follow_feed'),
+            reverse('api:follows'),
+        ]
+        for url in urls:
+            budget = resolve(urlsplit(url).path).func.query_budget
+            with self.subTest(url=url), \
+                    CaptureQueriesContext(connection) as queries:
+                self.get(url)
+                self.assertLessEqual(len(queries), budget)
+
+    def test_commands(self):
+        out = StringIO()
+        call_command('issue_api_token', self.author.username, stdout=out)
+        self.assertEqual(ApiToken.objects.user_for(out.getvalue().strip()),
+                         self.author)
+        out = StringIO()
+        call_command('bench_api', '--requests', '1', stdout=out)
+        self.assertIn('лента', out.getvalue())
+        self.assertIn('сериализация: 5 постов', out.getvalue())
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from yatube.cache import SQLiteCache
+
+
+def _incr_many(location, count):
+    cache = SQLiteCache(location, {})
+    for _ in range(count):
+        cache.incr('shared')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, key_prefix='', **options):
+        return SQLiteCache(self.location, {'OPTIONS': options,
+                                           'KEY_PREFIX': key_prefix})
+
+    def test_values_are_shared_between_instances(self):
+        """Записанное одним экземпляром видит другой (другой процесс)."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.make_cache().get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.delete('key')
+        self.assertIsNone(self.make_cache().get('key'))
+
+    def test_expired_values_are_not_returned(self):
+        self.cache.set('key', 'value', timeout=1)
+        self.assertTrue(self.cache.has_key('key'))
+        self.cache.set('key', 'value', timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'again'))
+
+    def test_incr(self):
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_is_atomic_between_processes(self):
+        self.cache.set('shared', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_incr_many,
+                                   args=(self.location, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('shared'), 200)
+
+    def test_least_recently_read_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_EVERY=1,
+                                ACCESS_RESOLUTION=0)
+        cache.set('hot', 'value')
+        for i in range(20):
+            time.sleep(0.001)
+            cache.get('hot')
+            cache.set(f'cold:{i}', 'value')
+        self.assertEqual(cache.get('hot'), 'value')
+        self.assertIsNone(cache.get('cold:0'))
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=10000, CULL_EVERY=1)
+        for i in range(20):
+            cache.set(f'key:{i}', 'x' * 1000)
+        self.assertIsNone(cache.get('key:0'))
+        self.assertIsNotNone(cache.get('key:19'))
+
+    def test_namespace_versions(self):
+        key = self.cache.namespaced_key('feed', 'page:1')
+        self.cache.set(key, 'old')
+        self.assertEqual(self.cache.incr_namespace('feed'), 2)
+        self.assertIsNone(
+            self.cache.get(self.cache.namespaced_key('feed', 'page:1')))
+        self.assertEqual(self.make_cache().namespace_version('feed'), 2)
+
+    def test_clear_keeps_other_prefixes(self):
+        mine, other = self.make_cache('mine'), self.make_cache('other')
+        mine.set('key', 1)
+        other.set('key', 2)
+        mine.clear()
+        self.assertIsNone(mine.get('key'))
+        self.assertEqual(other.get('key'), 2)
+
+    def test_reads_do_not_write(self):
+        cache = self.make_cache(ACCESS_RESOLUTION=0)
+        cache.set('key', 'value')
+        changes = cache._connection.total_changes
+        for _ in range(10):
+            time.sleep(0.001)
+            cache.get('key')
+        self.assertEqual(cache._connection.total_changes, changes)
+        # накопленное время чтения записывается со следующей записью
+        cache.set('other', 'value')
+        self.assertGreater(cache._connection.total_changes, changes + 1)
+
+    def test_stats_follow_writes(self):
+        self.cache.set('a', 'x' * 100)
+        self.cache.set('a', 'x' * 10)
+        self.cache.set('b', 1)
+        self.cache.incr('b', 1000)
+        self.cache.add('c', 'value')
+        self.cache.delete('c')
+        connection = self.cache._connection
+        self.assertEqual(
+            self.cache._stats(),
+            connection.execute(
+                'SELECT COUNT(*), SUM(size) FROM cache').fetchone())
@@ -0,0 +1,75 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='talk_author')
+        cls.readers = [User.objects.create(username=f'talk_reader_{i}')
+                       for i in range(3)]
+        cls.post = Post.objects.create(author=cls.author, text='Обсуждаем')
+        cls.quiet = Post.objects.create(author=cls.author, text='Тишина')
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=cls.readers[i % 3],
+                                   text=f'Реплика {i}')
+            for i in range(8)]
+        Comment.objects.create(post=cls.quiet, author=cls.readers[0],
+                               text='Единственная')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def post_url(self, post):
+        return reverse('posts:post_view', args=[self.author.username, post.pk])
+
+    def texts(self, html):
+        return re.findall(r'Реплика \d+', html)
+
+    def more(self, html):
+        found = re.search(r'class="[^"]*comments-more[^"]*" href="([^"]+)"',
+                          html)
+        return found and found.group(1)
+
+    def test_first_batch_and_lazy_loading(self):
+        response = self.client.get(self.post_url(self.post))
+        self.assertIsInstance(response.context['comments'], QuerySet)
+        html = response.content.decode()
+        texts = self.texts(html)
+        self.assertEqual(texts, ['Реплика 7', 'Реплика 6', 'Реплика 5'])
+        url = self.more(html)
+        while url:
+            html = self.client.get(url).content.decode()
+            texts += self.texts(html)
+            url = self.more(html)
+        self.assertEqual(texts, [f'Реплика {i}' for i in range(7, -1, -1)])
+
+    def test_no_link_for_short_thread(self):
+        response = self.client.get(self.post_url(self.quiet))
+        self.assertContains(response, 'Единственная')
+        self.assertIsNone(self.more(response.content.decode()))
+
+    def test_queries_do_not_grow_with_comments(self):
+        def queries(post):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(self.post_url(post))
+            return len(captured)
+
+        self.assertEqual(queries(self.quiet), queries(self.post))
+
+    def test_fragment_of_missing_post(self):
+        url = reverse('posts:post_comments',
+                      args=[self.readers[0].username, self.post.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
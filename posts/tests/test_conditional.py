@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User
+
+INDEX_URL = reverse('posts:index')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='etag_user')
+        cls.group = Group.objects.create(
+            title='Test',
+            slug='etag',
+            description='Много букв'
+        )
+        cls.post = Post.objects.create(author=cls.user, group=cls.group,
+                                       text='Тестовый текст')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_unchanged_pages_answer_not_modified(self):
+        urls = [
+            INDEX_URL,
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_view', args=[self.user.username,
+                                             self.post.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                repeated = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(repeated.status_code, 304)
+                repeated = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(repeated.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        """Новый пост и комментарий меняют ETag затронутых страниц."""
+        post_url = reverse('posts:post_view',
+                           args=[self.user.username, self.post.id])
+        index_etag = self.guest_client.get(INDEX_URL)['ETag']
+        post_etag = self.guest_client.get(post_url)['ETag']
+        Post.objects.create(author=self.user, text='Новый пост')
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        response = self.guest_client.get(INDEX_URL,
+                                         HTTP_IF_NONE_MATCH=index_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.guest_client.get(post_url,
+                                         HTTP_IF_NONE_MATCH=post_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_validators_depend_on_user(self):
+        """Страница гостя не отдаётся как 304 авторизованному."""
+        response = self.guest_client.get(INDEX_URL)
+        repeated = self.authorized_client.get(
+            INDEX_URL,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeated.status_code, 200)
+        self.assertFalse(repeated.has_header('Last-Modified'))
+
+    def test_missing_pages_still_404(self):
+        response = self.guest_client.get(
+            reverse('posts:group', args=['no-such-group']))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,126 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User, UserCounters
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='counter_user')
+        cls.author = User.objects.create(username='counter_author')
+        cls.group = Group.objects.create(
+            title='Test',
+            slug='counters',
+            description='Много букв'
+        )
+        cls.group_2 = Group.objects.create(
+            title='Test 2',
+            slug='counters_2',
+            description='Много букв'
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев следуют за записью и удалением."""
+        post = Post.objects.create(author=self.author, text='Пост',
+                                   group=self.group)
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='Комментарий')
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.user).comments_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+
+        comment.delete()
+        post.group = self.group_2
+        post.save()
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.group_2.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.counters(self.user).comments_count, 0)
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 1)
+
+        post.delete()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.counters(self.author).posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 0)
+
+    def test_last_comment_at(self):
+        """Время последнего комментария сдвигается вперёд при записи и
+        откатывается к предыдущему после удаления."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        first = Comment.objects.create(post=post, author=self.user,
+                                       text='Первый')
+        second = Comment.objects.create(post=post, author=self.user,
+                                        text='Второй')
+        post.refresh_from_db()
+        self.assertEqual(post.last_comment_at, second.created)
+
+        second.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.last_comment_at, first.created)
+        first.delete()
+        post.refresh_from_db()
+        self.assertIsNone(post.last_comment_at)
+
+        Comment.objects.bulk_create([Comment(post=post, author=self.user,
+                                             text='Импорт')])
+        call_command('recount_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertIsNotNone(post.last_comment_at)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обеих сторон."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.author.username]))
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.user).following_count, 1)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username]))
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+        self.assertEqual(self.counters(self.user).following_count, 0)
+
+    def test_stale_counter_does_not_cut_page(self):
+        """Разошедшийся счётчик не прячет посты группы и автора."""
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Пост {i}',
+                                group=self.group)
+        Group.objects.update(posts_count=0)
+        UserCounters.objects.filter(user=self.author).update(posts_count=1)
+        for url in [reverse('posts:group', args=[self.group.slug]),
+                    reverse('posts:profile', args=[self.author.username])]:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertEqual(len(response.context['page']), 3)
+
+    def test_recount_repairs_drift(self):
+        """recount_counters исправляет разошедшиеся счётчики."""
+        Post.objects.create(author=self.author, text='Пост', group=self.group)
+        Follow.objects.create(user=self.user, author=self.author)
+        UserCounters.objects.update(posts_count=7, followers_count=0)
+        Group.objects.update(posts_count=0)
+        UserCounters.objects.filter(user=self.user).delete()
+
+        call_command('recount_counters', stdout=StringIO())
+
+        self.group.refresh_from_db()
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.user).following_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
@@ -0,0 +1,123 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import export
+from posts.models import Comment, Group, Post, User
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='export_author')
+        cls.other = User.objects.create(username='export_other')
+        cls.moderator = User.objects.create(username='export_moderator',
+                                            is_staff=True)
+        cls.group = Group.objects.create(title='Выгрузка', slug='export',
+                                         description='Много букв')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}',
+                                group=cls.group if i % 2 else None,
+                                image='posts/ab/picture.png' if i else None)
+            for i in range(3)
+        ]
+        Post.objects.create(author=cls.other, text='Чужой', group=cls.group)
+        # комментарии создаются не по порядку постов
+        for post in reversed(cls.posts):
+            for i in range(2):
+                Comment.objects.create(post=post, author=cls.other,
+                                       text=f'{post.text}, комментарий {i}')
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def download(self, client, url, **params):
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_records_in_keyset_order(self):
+        rows = list(export.records(self.author.posts.all()))
+        self.assertEqual([(row['type'], row['id']) for row in rows], [
+            item
+            for post in self.posts
+            for item in [('post', post.pk)] + [
+                ('comment', pk) for pk in post.comments.order_by(
+                    'created', 'pk').values_list('pk', flat=True)]
+        ])
+        self.assertNotIn('image', rows[0])
+
+    def test_two_queries_regardless_of_size(self):
+        with CaptureQueriesContext(connection) as small:
+            list(export.records(Post.objects.filter(pk=self.posts[0].pk)))
+        with CaptureQueriesContext(connection) as large:
+            list(export.records(Post.objects.all()))
+        self.assertEqual(len(small), 2)
+        self.assertEqual(len(large), 2)
+
+    def test_profile_export_jsonl(self):
+        content = self.download(
+            self.client_for(self.author),
+            reverse('posts:profile_export', args=[self.author.username]),
+            images=1)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 9)
+        self.assertIsNone(rows[0]['image'])
+        self.assertEqual(rows[3]['image'],
+                         'http://testserver/media/posts/ab/picture.png')
+        self.assertEqual(rows[3]['group'], self.group.slug)
+
+    def test_group_export_csv(self):
+        response = self.client_for(self.moderator).get(
+            reverse('posts:group_export', args=[self.group.slug]),
+            {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('export.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(
+            b''.join(response.streaming_content).decode().splitlines()))
+        posts = [row for row in rows if row['type'] == 'post']
+        self.assertEqual([row['text'] for row in posts],
+                         ['Пост 1', 'Чужой'])
+        self.assertEqual(len(rows), 4)
+
+    def test_export_permissions(self):
+        client = self.client_for(self.other)
+        profile_url = reverse('posts:profile_export',
+                              args=[self.author.username])
+        group_url = reverse('posts:group_export', args=[self.group.slug])
+        self.assertEqual(client.get(profile_url).status_code, 403)
+        self.assertEqual(client.get(group_url).status_code, 403)
+        self.assertEqual(Client().get(profile_url).status_code, 302)
+        self.assertEqual(self.client_for(self.moderator).get(
+            profile_url).status_code, 200)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_posts', '--group', self.group.slug, '--images',
+                     '--base-url', 'https://yatube.example', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(rows[0]['image'],
+                         'https://yatube.example/media/posts/ab/picture.png')
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'author.csv')
+        call_command('export_posts', '--author', self.author.username,
+                     '--format', 'csv', '--output', path)
+        with open(path, encoding='utf-8', newline='') as file:
+            self.assertEqual(len(list(csv.DictReader(file))), 9)
+
+        with self.assertRaisesMessage(CommandError, 'Нет группы'):
+            call_command('export_posts', '--group', 'missing')
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import fragments
+from posts.models import Follow, Post, TimelineEntry, User, UserCounters
+
+
+class FollowBatchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='batch_reader')
+        cls.authors = [User.objects.create(username=f'batch_author_{i}')
+                       for i in range(6)]
+        for author in cls.authors:
+            for i in range(3):
+                Post.objects.create(author=author, text=f'Пост {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def names(self, authors):
+        return [author.username for author in authors]
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_follow_many(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        generation = fragments.generation(f'author:{self.authors[1].pk}')
+        followed = Follow.objects.follow_many(
+            self.reader,
+            self.names(self.authors[:3]) + ['missing', 'batch_reader'])
+        self.assertCountEqual(followed,
+                              [self.authors[1].pk, self.authors[2].pk])
+        self.assertEqual(Follow.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(self.counters(self.reader).following_count, 3)
+        self.assertEqual(self.counters(self.authors[1]).followers_count, 1)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 9)
+        self.assertNotEqual(
+            fragments.generation(f'author:{self.authors[1].pk}'), generation)
+
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2)
+    def test_backfill_limit_per_author(self):
+        Follow.objects.follow_many(self.reader, self.names(self.authors[:2]))
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        self.assertEqual(entries.count(), 4)
+        newest = self.authors[0].posts.order_by('-pub_date', '-pk')[:2]
+        self.assertCountEqual(
+            entries.filter(post__author=self.authors[0]).values_list(
+                'post_id', flat=True),
+            [post.pk for post in newest])
+
+    def test_unfollow_many(self):
+        Follow.objects.follow_many(self.reader, self.names(self.authors))
+        unfollowed = Follow.objects.unfollow_many(
+            self.reader, self.names(self.authors[:4]) + ['missing'])
+        self.assertEqual(len(unfollowed), 4)
+        self.assertEqual(self.counters(self.reader).following_count, 2)
+        self.assertEqual(self.counters(self.authors[0]).followers_count, 0)
+        self.assertEqual(set(TimelineEntry.objects.filter(
+            user=self.reader).values_list('post__author', flat=True)),
+            {self.authors[4].pk, self.authors[5].pk})
+
+    def test_queries_do_not_grow_with_batch(self):
+        def queries(authors):
+            with CaptureQueriesContext(connection) as captured:
+                Follow.objects.follow_many(self.reader, self.names(authors))
+                Follow.objects.unfollow_many(self.reader,
+                                             self.names(authors))
+            return len(captured)
+
+        self.assertEqual(queries(self.authors[:1]), queries(self.authors))
+
+    def test_endpoint(self):
+        Follow.objects.create(user=self.reader, author=self.authors[5])
+        response = self.client.post(reverse('posts:follow_batch'), {
+            'follow': self.names(self.authors[:2]),
+            'unfollow': [self.authors[5].username],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'followed': [self.authors[0].pk, self.authors[1].pk],
+            'unfollowed': [self.authors[5].pk],
+        })
+        self.assertEqual(self.client.get(
+            reverse('posts:follow_batch')).status_code, 405)
+        with override_settings(FOLLOW_BATCH_LIMIT=1):
+            response = self.client.post(reverse('posts:follow_batch'), {
+                'follow': self.names(self.authors[:2])})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+INDEX_URL = reverse('posts:index')
+
+
+class FragmentCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='fragment_user')
+        cls.group = Group.objects.create(
+            title='Test',
+            slug='fragments',
+            description='Много букв'
+        )
+        for i in range(settings.POSTS_PER_PAGE + 1):
+            Post.objects.create(author=cls.user, text=f'Общий пост {i:02}')
+        cls.group_post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост группы')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_pages_are_cached_separately(self):
+        """Вторая страница не показывает закэшированную первую."""
+        first = self.client.get(INDEX_URL)
+        cursor = str(first.context['page'].next_cursor)
+        second = self.client.get(INDEX_URL, {'cursor': cursor})
+        self.assertContains(first, 'Пост группы')
+        self.assertNotContains(second, 'Пост группы')
+        self.assertContains(second, 'Общий пост 00')
+
+    def test_cache_hit_does_not_load_posts(self):
+        """Ссылка «Следующая» — внутри фрагмента: курсор из последнего
+        поста страницы вычисляется только при промахе кэша."""
+        for url in [INDEX_URL,
+                    reverse('posts:profile', args=[self.user.username])]:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    second = self.client.get(url)
+                self.assertFalse([
+                    query['sql'] for query in queries
+                    if '"posts_post"."text"' in query['sql']])
+                self.assertEqual(second.content, first.content)
+                self.assertContains(second, 'cursor=')
+
+    def test_group_page_does_not_reuse_index_fragment(self):
+        self.client.get(INDEX_URL)
+        response = self.client.get(
+            reverse('posts:group', args=[self.group.slug]))
+        self.assertContains(response, 'Пост группы')
+        self.assertNotContains(response, 'Общий пост')
+
+    def test_new_post_expires_cached_fragment(self):
+        """Новый пост виден сразу, несмотря на кэш."""
+        self.client.get(INDEX_URL)
+        Post.objects.create(author=self.user, text='Свежий пост')
+        self.assertContains(self.client.get(INDEX_URL), 'Свежий пост')
+
+    def test_edit_expires_old_group_fragment(self):
+        group_url = reverse('posts:group', args=[self.group.slug])
+        self.client.get(group_url)
+        self.group_post.group = None
+        self.group_post.save()
+        self.assertNotContains(self.client.get(group_url), 'Пост группы')
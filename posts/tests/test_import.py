@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from posts import search
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserCounters)
+
+
+class ImportMixin:
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.group = Group.objects.create(title='Импорт', slug='imported',
+                                          description='Много букв')
+        self.reader = User.objects.create(username='import_reader')
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(lines)
+        return path
+
+    def jsonl(self, name, records):
+        return self.write(name, ''.join(json.dumps(record) + '\n'
+                                        for record in records))
+
+    def sources(self):
+        posts = self.jsonl('posts.jsonl', [
+            {'id': 10, 'author': 'leo', 'text': 'Война и мир',
+             'pub_date': '2019-01-02T10:00:00', 'group': 'imported'},
+            {'id': 11, 'author': 'leo', 'text': 'Анна Каренина',
+             'pub_date': '2019-01-03T10:00:00+00:00'},
+            {'id': 12, 'author': 'fedor', 'text': 'Идиот'},
+        ])
+        comments = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            '10,fedor,Длинно,2019-01-04T10:00:00\n'
+            '12,import_reader,Сильно,\n')
+        follows = self.jsonl('follows.jsonl', [
+            {'user': 'import_reader', 'author': 'leo'},
+            {'user': 'import_reader', 'author': 'leo'},
+            {'user': 'fedor', 'author': 'leo'},
+        ])
+        return ['--posts', posts, '--comments', comments,
+                '--follows', follows, '--create-users', '--chunk-size', '2']
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_yatube', *args, stdout=out)
+        return out.getvalue()
+
+
+class ImportYatubeTest(ImportMixin, TestCase):
+    def test_imports_and_rebuilds(self):
+        output = self.run_import(*self.sources())
+        self.assertIn('posts: 2 строк', output)
+        self.assertIn('Импортировано строк: 8', output)
+
+        leo = User.objects.get(username='leo')
+        self.assertFalse(leo.has_usable_password())
+        war = Post.objects.get(text='Война и мир')
+        self.assertEqual(war.pub_date.isoformat(), '2019-01-02T10:00:00+00:00')
+        self.assertEqual(war.group, self.group)
+        self.assertEqual(war.comments_count, 1)
+        self.assertEqual(Comment.objects.get(text='Длинно').created.day, 4)
+        self.assertEqual(Follow.objects.count(), 2)
+
+        counters = UserCounters.objects.get(user=leo)
+        self.assertEqual((counters.posts_count, counters.followers_count),
+                         (2, 2))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 2)
+        if search.available():
+            found = Post.objects.filter(
+                pk__in=search.matching_posts('Каренина'))
+            self.assertEqual(list(found.values_list('text', flat=True)),
+                             ['Анна Каренина'])
+
+        post = Post.objects.create(author=leo, text='Новый пост')
+        self.assertGreater(post.pk, war.pk)
+
+    def test_leaves_unrelated_data_alone(self):
+        other = User.objects.create(username='import_other')
+        post = Post.objects.create(author=other, text='Живой пост')
+        Follow.objects.create(user=self.reader, author=other)
+        # намеренно разошедшиеся данные, которых импорт не касается
+        Post.objects.filter(pk=post.pk).update(comments_count=7)
+        UserCounters.objects.filter(user=other).update(posts_count=5)
+        TimelineEntry.objects.filter(user=self.reader).delete()
+        self.run_import(*self.sources())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 7)
+        self.assertEqual(UserCounters.objects.get(user=other).posts_count, 5)
+        self.assertEqual(set(TimelineEntry.objects.filter(
+            user=self.reader).values_list('post__text', flat=True)),
+            {'Война и мир', 'Анна Каренина'})
+
+    def test_unknown_author_is_reported(self):
+        posts = self.jsonl('posts.jsonl', [{'author': 'nobody', 'text': 'x'}])
+        with self.assertRaisesMessage(CommandError, 'пачка 1'):
+            self.run_import('--posts', posts)
+        self.assertFalse(Post.objects.exists())
+
+
+class DropIndexesTest(ImportMixin, TransactionTestCase):
+    def indexes(self):
+        with connection.cursor() as cursor:
+            return {
+                name for name, info in connection.introspection
+                .get_constraints(cursor, Post._meta.db_table).items()
+                if info['index']
+            }
+
+    def test_indexes_are_restored(self):
+        before = self.indexes()
+        self.run_import(*self.sources(), '--drop-indexes')
+        self.assertEqual(self.indexes(), before)
+        self.assertEqual(Post.objects.count(), 3)
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore
+
+from posts import images
+from posts.management.commands import collect_media_garbage
+from posts.models import Post, StoredImage, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color=color).save(buffer, 'png')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CollectMediaGarbageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        self.user = User.objects.create(username='gc_user')
+        self.live = self.create(png((1, 2, 3)))
+        self.orphan = self.create(png((200, 0, 0)))
+        self.orphan_name = self.orphan.image.name
+        self.orphan_thumbnail = self.thumbnail(self.orphan)
+        self.live_thumbnail = self.thumbnail(self.live)
+        self.orphan.delete()
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, content):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=SimpleUploadedFile('a.png', content))
+        name = images.variant_name(post.image.name, 320, 'WEBP')
+        default_storage.save(name, ContentFile(b'variant'))
+        return post
+
+    def thumbnail(self, post):
+        """Превью, зарегистрированное в хранилище sorl-thumbnail."""
+        source = ImageFile(post.image)
+        default.kvstore.get_or_set(source)
+        name = f'cache/{post.pk:02}/thumb.png'
+        default_storage.save(name, ContentFile(png((0, 0, 0))))
+        thumbnail = ImageFile(name, default_storage)
+        default.kvstore.set(thumbnail, source)
+        return name
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media_garbage', '--min-age', '0', '--rate',
+                     '0', *args, stdout=out)
+        return out.getvalue()
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(MEDIA_ROOT, name))
+
+    def orphan_files(self):
+        return [self.orphan_name, self.orphan_thumbnail,
+                images.variant_name(self.orphan_name, 320, 'WEBP')]
+
+    def live_files(self):
+        return [self.live.image.name,
+                images.variant_name(self.live.image.name, 320, 'WEBP')]
+
+    def test_dry_run_changes_nothing(self):
+        kv_rows = KVStore.objects.count()
+        output = self.collect('--dry-run')
+        self.assertIn('Будет удалено файлов: 4', output)
+        self.assertIn('записей превью: 6', output)
+        self.assertTrue(all(map(self.exists, self.orphan_files())))
+        self.assertEqual(KVStore.objects.count(), kv_rows)
+
+    def test_removes_only_unreferenced_files(self):
+        self.collect()
+        self.assertFalse(any(map(self.exists, self.orphan_files())))
+        self.assertTrue(all(map(self.exists, self.live_files())))
+        self.assertFalse(StoredImage.objects.filter(
+            name=self.orphan_name).exists())
+        self.assertIsNone(default.kvstore.get(
+            ImageFile(self.orphan_name, default_storage)))
+
+    def test_removes_sorl_thumbnails_of_live_posts(self):
+        """Превью sorl-thumbnail больше ничего не показывает."""
+        self.collect()
+        self.assertFalse(self.exists(self.live_thumbnail))
+        self.assertIsNone(default.kvstore.get(ImageFile(self.live.image)))
+        self.assertFalse(KVStore.objects.exists())
+
+    def test_quarantine_keeps_copies(self):
+        quarantine = os.path.join(MEDIA_ROOT, '..', 'quarantine-test')
+        self.addCleanup(shutil.rmtree, quarantine, True)
+        self.collect('--quarantine', quarantine)
+        for name in self.orphan_files():
+            self.assertFalse(self.exists(name))
+            self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+
+    def test_recent_files_are_kept(self):
+        call_command('collect_media_garbage', '--rate', '0',
+                     stdout=StringIO())
+        self.assertTrue(all(map(self.exists, self.orphan_files())))
+
+    def test_file_reused_during_run_is_kept(self):
+        """Пост, получивший тот же файл после снимка ссылок, не теряет
+        картинку и её варианты."""
+        sweep = collect_media_garbage.Command.sweep_thumbnail_store
+
+        def sweep_and_reuse(command, *args):
+            sweep(command, *args)
+            Post.objects.create(author=self.user, text='Тот же файл',
+                                image=self.orphan_name)
+
+        with mock.patch.object(collect_media_garbage.Command,
+                               'sweep_thumbnail_store', sweep_and_reuse):
+            self.collect()
+        self.assertTrue(self.exists(self.orphan_name))
+        self.assertTrue(self.exists(
+            images.variant_name(self.orphan_name, 320, 'WEBP')))
@@ -0,0 +1,124 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Прогоняет миграцию `migrate_to` на данных, созданных на
+    предыдущем состоянии схемы `migrate_from`."""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.latest = self.executor.loader.graph.leaf_nodes()
+        self.executor.migrate([self.migrate_from])
+        self.old_apps = self.executor.loader.project_state(
+            [self.migrate_from]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.latest)
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        return executor.loader.project_state([self.migrate_to]).apps
+
+
+class CountersMigrationTest(MigrationTestCase):
+    migrate_from = ('posts', '0013_timelineentry')
+    migrate_to = ('posts', '0014_counters')
+
+    def test_counters_are_filled(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Group = self.old_apps.get_model('posts', 'Group')
+        Post = self.old_apps.get_model('posts', 'Post')
+        Comment = self.old_apps.get_model('posts', 'Comment')
+        Follow = self.old_apps.get_model('posts', 'Follow')
+        author = User.objects.create(username='legacy_author')
+        reader = User.objects.create(username='legacy_reader')
+        group = Group.objects.create(title='Старое', slug='legacy',
+                                     description='Много букв')
+        posts = [Post.objects.create(author=author, group=group, text=str(i))
+                 for i in range(3)]
+        Comment.objects.create(post=posts[0], author=reader, text='Да')
+        Follow.objects.create(user=reader, author=author)
+
+        apps = self.migrate()
+        counters = apps.get_model('posts', 'UserCounters').objects
+        self.assertEqual(counters.get(user_id=author.pk).posts_count, 3)
+        self.assertEqual(counters.get(user_id=author.pk).followers_count, 1)
+        self.assertEqual(counters.get(user_id=reader.pk).comments_count, 1)
+        self.assertEqual(counters.get(user_id=reader.pk).following_count, 1)
+        self.assertEqual(
+            apps.get_model('posts', 'Group').objects.get().posts_count, 3)
+        self.assertEqual(apps.get_model('posts', 'Post').objects.get(
+            pk=posts[0].pk).comments_count, 1)
+
+
+class LastCommentMigrationTest(MigrationTestCase):
+    migrate_from = ('posts', '0022_post_trends')
+    migrate_to = ('posts', '0023_post_last_comment_at')
+
+    def test_last_comment_at_is_filled(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Post = self.old_apps.get_model('posts', 'Post')
+        Comment = self.old_apps.get_model('posts', 'Comment')
+        author = User.objects.create(username='legacy_author')
+        post, quiet = [Post.objects.create(author=author, text=text)
+                       for text in ['Обсуждают', 'Молчат']]
+        Comment.objects.create(post=post, author=author, text='Первый')
+        last = Comment.objects.create(post=post, author=author,
+                                      text='Второй')
+
+        posts = self.migrate().get_model('posts', 'Post').objects
+        self.assertEqual(posts.get(pk=post.pk).last_comment_at, last.created)
+        self.assertIsNone(posts.get(pk=quiet.pk).last_comment_at)
+
+
+class ThumbnailsReadyMigrationTest(MigrationTestCase):
+    migrate_from = ('posts', '0023_post_last_comment_at')
+    migrate_to = ('posts', '0024_reset_thumbnails_without_variants')
+
+    def test_posts_without_variants_are_reset(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Post = self.old_apps.get_model('posts', 'Post')
+        author = User.objects.create(username='legacy_author')
+        legacy, built, plain = [
+            Post.objects.create(author=author, text=text, image=image,
+                                image_variants=variants,
+                                thumbnails_ready=True)
+            for text, image, variants in [
+                ('Старый', 'posts/old.png', ''),
+                ('Новый', 'posts/new.png', '{"WEBP": [320]}'),
+                ('Без картинки', '', '')]]
+
+        posts = self.migrate().get_model('posts', 'Post').objects
+        self.assertFalse(posts.get(pk=legacy.pk).thumbnails_ready)
+        self.assertTrue(posts.get(pk=built.pk).thumbnails_ready)
+        self.assertTrue(posts.get(pk=plain.pk).thumbnails_ready)
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=1)
+class TimelineMigrationTest(MigrationTestCase):
+    migrate_from = ('posts', '0012_auto_20220120_1855')
+    migrate_to = ('posts', '0013_timelineentry')
+
+    def test_timelines_are_filled(self):
+        User = self.old_apps.get_model('auth', 'User')
+        Post = self.old_apps.get_model('posts', 'Post')
+        Follow = self.old_apps.get_model('posts', 'Follow')
+        reader, fan, author, star = [
+            User.objects.create(username=f'legacy_{name}')
+            for name in ['reader', 'fan', 'author', 'star']]
+        post = Post.objects.create(author=author, text='Обычный')
+        Post.objects.create(author=star, text='Звёздный')
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=reader, author=star)
+        Follow.objects.create(user=fan, author=star)
+
+        entries = self.migrate().get_model('posts', 'TimelineEntry').objects
+        # посты знаменитости читаются при запросе и не раскладываются
+        self.assertEqual(list(entries.values_list('user_id', 'post_id')),
+                         [(reader.pk, post.pk)])
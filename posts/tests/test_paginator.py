@@ -1,6 +1,13 @@
+import base64
+import json
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
 from posts.models import Group, Post, User
+from posts.paginators import CursorPaginator
 
 
 class PaginatorViewsTest(TestCase):
@@ -22,3 +29,83 @@ class PaginatorViewsTest(TestCase):
                 'group': cls.group
             })
         Post.objects.bulk_create(posts)
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='cursor_user')
+        cls.group = Group.objects.create(
+            title='Cursor',
+            slug='cursor',
+            description='Много букв'
+        )
+        Post.objects.bulk_create([Post(author=cls.user,
+                                       group=cls.group,
+                                       text=str(i)) for i in range(25)])
+        cls.expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def test_cursor_pages_cover_all_posts(self):
+        """Переход по курсорам проходит все посты без повторов."""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page()
+        collected = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            collected.extend(page)
+        self.assertEqual(collected, self.expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(second.has_previous())
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertTrue(back.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        page = paginator.get_page('not-a-cursor')
+        self.assertEqual(list(page), self.expected[:10])
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Значения ключа неверного типа не доходят до запроса."""
+        for values in [['n', 'garbage', 5], ['n', '2020-01-01', 'x'],
+                       ['p', None, 1], ['n', [], {}]]:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()).decode()
+            with self.subTest(values=values):
+                response = self.client.get(reverse('posts:index'),
+                                           {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['page']),
+                                 self.expected[:10])
+
+    def test_index_next_link_uses_cursor(self):
+        """Ссылка «Следующая» на главной ведёт на курсорную страницу."""
+        response = self.client.get(reverse('posts:index'))
+        next_cursor = str(response.context['page'].next_cursor)
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': next_cursor})
+        self.assertEqual(list(response.context['page']),
+                         self.expected[10:20])
+
+    def test_index_does_not_count_posts(self):
+        """У главной нет счётчика постов: она листается курсором и не
+        считает таблицу ни при промахе, ни при попадании в кэш."""
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('posts:index'))
+            self.assertFalse([query['sql'] for query in queries
+                              if 'COUNT(' in query['sql']])
+        self.assertContains(response, 'cursor=')
+        self.assertNotContains(response, '?page=2')
+
+    def test_index_numbered_page_on_request(self):
+        response = self.client.get(reverse('posts:index'), {'page': 2})
+        self.assertEqual(list(response.context['page']),
+                         self.expected[10:20])
+        self.assertContains(response, '?page=3')
@@ -0,0 +1,85 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts import suggestions
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов страниц не зависит от числа постов на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='budget_reader')
+        cls.group = Group.objects.create(
+            title='Test',
+            slug='budget',
+            description='Много букв'
+        )
+        authors = [User.objects.create(username=f'budget_author_{i}')
+                   for i in range(3)]
+        for i in range(settings.POSTS_PER_PAGE + 2):
+            author = authors[i % len(authors)]
+            post = Post.objects.create(author=author, group=cls.group,
+                                       text=f'Пост {i}')
+            Comment.objects.create(post=post, author=cls.user,
+                                   text='Комментарий')
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+        cls.author = authors[0]
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_views_stay_within_query_budget(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+            reverse('posts:post_view',
+                    args=[self.post.author.username, self.post.id]),
+            reverse('posts:search') + '?q=Пост',
+        ]
+        for url in urls:
+            budget = resolve(urlsplit(url).path).func.query_budget
+            with self.subTest(url=url), \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    '\n'.join(query['sql'] for query in queries))
+
+    def test_listing_queries_do_not_grow_with_page_size(self):
+        """Число комментариев и время последнего берутся из самого
+        поста, без запроса на карточку."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+        ]
+
+        def queries(url, per_page):
+            cache.clear()
+            suggestions.reset()
+            with override_settings(POSTS_PER_PAGE=per_page), \
+                    CaptureQueriesContext(connection) as captured:
+                response = self.authorized_client.get(url)
+            self.assertContains(response, 'Комментариев: 1, последний')
+            return len(captured)
+
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(queries(url, 1), queries(url, 4))
@@ -0,0 +1,47 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from posts.management.commands.audit_query_plans import (is_full_scan,
+                                                         is_unbounded_scan)
+from posts.models import Post
+
+
+class QueryPlanAuditTest(TestCase):
+    def test_listing_queries_use_indexes(self):
+        """Запросы страниц-лент не сканируют таблицы и не сортируют
+        во временном B-дереве."""
+        out = StringIO()
+        call_command('audit_query_plans', stdout=out, stderr=out)
+        self.assertIn('полных сканирований и сортировок нет', out.getvalue())
+        self.assertFalse(Post.objects.exists(),
+                         'Аудит должен откатывать временные данные')
+
+
+class PlanDetailTest(SimpleTestCase):
+    tables = {'posts_post'}
+
+    def test_full_scan_in_both_detail_formats(self):
+        for detail in ['SCAN posts_post', 'SCAN TABLE posts_post']:
+            with self.subTest(detail=detail):
+                self.assertTrue(is_full_scan(detail, self.tables))
+        self.assertFalse(is_full_scan(
+            'SCAN TABLE posts_post USING INDEX post_pub_date_idx',
+            self.tables))
+        self.assertFalse(is_full_scan('SCAN SUBQUERY 1', self.tables))
+
+    def test_index_scan_needs_limit(self):
+        """Проход по всему индексу — такой же полный просмотр ленты, как
+        `COUNT(*)` по таблице постов."""
+        detail = 'SCAN TABLE posts_post USING COVERING INDEX post_group_idx'
+        self.assertTrue(is_unbounded_scan(
+            'SELECT COUNT(*) AS "__count" FROM "posts_post"', detail,
+            self.tables))
+        self.assertFalse(is_unbounded_scan(
+            'SELECT "posts_post"."id" FROM "posts_post" ORDER BY '
+            '"posts_post"."pub_date" DESC LIMIT 11', detail, self.tables))
+        self.assertFalse(is_unbounded_scan(
+            'SELECT COUNT(*) AS "__count" FROM "posts_post"',
+            'SEARCH posts_post USING INDEX post_group_idx (group_id=?)',
+            self.tables))
@@ -0,0 +1,84 @@
+from django.contrib.admin.sites import site
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Comment, Group, Post, User
+
+SEARCH_URL = reverse('posts:search')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='search_user')
+        cls.other = User.objects.create(username='search_other')
+        cls.group = Group.objects.create(
+            title='Коты',
+            slug='cats',
+            description='Много букв'
+        )
+        cls.cat_post = Post.objects.create(
+            author=cls.user, group=cls.group,
+            text='Рыжий кот спит на подоконнике')
+        cls.dog_post = Post.objects.create(
+            author=cls.other, text='Собака гуляет во дворе')
+        cls.comment = Comment.objects.create(
+            post=cls.dog_post, author=cls.user, text='А у меня кот <b>')
+
+    def setUp(self):
+        self.client = Client()
+
+    def hits(self, **params):
+        response = self.client.get(SEARCH_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page'])
+
+    def test_finds_posts_and_comments(self):
+        """Ищутся и посты, и комментарии, сниппет подсвечен и экранирован."""
+        hits = self.hits(q='кот')
+        self.assertEqual({hit.post for hit in hits},
+                         {self.cat_post, self.dog_post})
+        comment_hit = next(hit for hit in hits if hit.is_comment)
+        self.assertIn('<mark>кот</mark>', comment_hit.snippet)
+        self.assertIn('&lt;b&gt;', comment_hit.snippet)
+
+    def test_filters_by_group_and_author(self):
+        self.assertEqual(
+            [hit.post for hit in self.hits(q='кот', group='cats')],
+            [self.cat_post])
+        self.assertEqual(
+            [hit.post for hit in self.hits(q='кот', author='search_other')],
+            [self.dog_post])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении."""
+        self.cat_post.text = 'Рыжий пёс'
+        self.cat_post.save()
+        self.assertEqual([hit.post for hit in self.hits(q='кот')],
+                         [self.dog_post])
+        self.comment.delete()
+        self.assertEqual(self.hits(q='кот'), [])
+
+    def test_cursor_pagination(self):
+        for i in range(3):
+            Post.objects.create(author=self.user, text=f'кот номер {i}')
+        paginator = search.SearchPaginator('кот', 2)
+        page = paginator.get_page()
+        collected = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            collected.extend(page)
+        self.assertEqual(len(collected), 5)
+        self.assertEqual(len({hit.rowid for hit in collected}), 5)
+
+    def test_syntax_in_query_is_ignored(self):
+        self.assertEqual(self.hits(q='"'), [])
+        self.assertEqual(len(self.hits(q='кот OR NEAR(')), 0)
+
+    def test_admin_uses_index(self):
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, _ = site._registry[Post].get_search_results(
+            request, Post.objects.all(), 'подоконнике')
+        self.assertEqual(list(queryset), [self.cat_post])
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts import counters, images, thumbnails
+from posts.models import Post, StoredImage, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png(color=(0, 0, 200)):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color=color).save(buffer, 'png')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='storage_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create(self, content, name='meme.png'):
+        return Post.objects.create(
+            author=self.user, text='Мем',
+            image=SimpleUploadedFile(name, content))
+
+    def references(self, name):
+        return StoredImage.objects.get(name=name).references
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create(png(), 'first.png')
+        second = self.create(png(), 'second.PNG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+        self.assertEqual(self.references(first.image.name), 2)
+
+    def test_references_follow_edits_and_deletes(self):
+        post = self.create(png())
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('other.png', png((9, 9, 9)))
+        post.save()
+        self.assertEqual(self.references(old_name), 0)
+        self.assertEqual(self.references(post.image.name), 1)
+
+        edited = Post.objects.get(pk=post.pk)
+        edited.text = 'Только текст'
+        edited.save()
+        self.assertEqual(self.references(post.image.name), 1)
+
+        edited.delete()
+        self.assertEqual(self.references(post.image.name), 0)
+
+    def test_recount_restores_references(self):
+        post = self.create(png())
+        StoredImage.objects.all().delete()
+        counters.recount()
+        self.assertEqual(self.references(post.image.name), 1)
+
+    def test_duplicate_reuses_thumbnails(self):
+        first = self.create(png())
+        thumbnails.generate(first.pk)
+        second = self.create(png())
+        with mock.patch.object(images, 'build_variants') as build:
+            thumbnails.generate(second.pk)
+        build.assert_not_called()
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertTrue(second.thumbnails_ready)
+        self.assertEqual(second.image_variants, first.image_variants)
@@ -0,0 +1,174 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import suggestions
+from posts.models import Follow, User
+
+# 1 и 2 читают 10, 11 и 12; 10 и 11 читают 20, 10 ещё и 21;
+# 12 читает 1
+EDGES = [(1, 10), (1, 11), (1, 12), (2, 10), (2, 11), (2, 12),
+         (10, 20), (10, 21), (11, 20), (12, 1), (3, 20)]
+
+
+class FollowGraphTest(SimpleTestCase):
+    def graph(self, edges=EDGES):
+        users, authors = zip(*edges)
+        return suggestions.FollowGraph(users, authors)
+
+    def test_ranks_by_overlap_then_followers(self):
+        graph = self.graph()
+        self.assertEqual(len(graph), len(EDGES))
+        self.assertEqual(graph.suggest(1, 10), [(20, 2), (21, 1)])
+        self.assertEqual(graph.suggest(1, 1), [(20, 2)])
+        self.assertEqual(graph.suggest(99, 10), [])
+
+    def test_deltas(self):
+        graph = self.graph()
+        graph.add(12, 21)
+        graph.add(12, 30)
+        graph.remove(10, 20)
+        graph.remove(11, 20)
+        self.assertEqual(graph.suggest(1, 10), [(21, 2), (30, 1)])
+        graph.add(1, 21)
+        self.assertEqual(graph.followees(1), {10, 11, 12, 21})
+        self.assertEqual(graph.suggest(1, 10), [(30, 1)])
+
+        compacted = graph.compacted()
+        self.assertEqual(compacted.pending(), 0)
+        self.assertEqual(compacted.suggest(1, 10), [(30, 1)])
+        self.assertEqual(compacted.followees(10), {21})
+
+    def test_duplicate_edges_are_merged(self):
+        graph = self.graph(EDGES + [(1, 10), (10, 20)])
+        self.assertEqual(len(graph), len(EDGES))
+        # подписка, которая уже есть в CSR, не становится дельтой
+        graph.add(1, 10)
+        self.assertEqual(graph.pending(), 0)
+        self.assertEqual(graph.suggest(1, 10), [(20, 2), (21, 1)])
+
+    def test_saved_graph(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.npz')
+            self.graph().save(path)
+            graph = suggestions.FollowGraph.open(path)
+        self.assertEqual(len(graph), len(EDGES))
+        self.assertEqual(graph.suggest(1, 10), [(20, 2), (21, 1)])
+
+
+class SuggestionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='fof_reader')
+        cls.friend = User.objects.create(username='fof_friend')
+        cls.other_friend = User.objects.create(username='fof_other_friend')
+        cls.star = User.objects.create(username='fof_star')
+        cls.niche = User.objects.create(username='fof_niche')
+        for user, author in [(cls.reader, cls.friend),
+                             (cls.reader, cls.other_friend),
+                             (cls.friend, cls.star),
+                             (cls.other_friend, cls.star),
+                             (cls.friend, cls.niche)]:
+            Follow.objects.create(user=user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        suggestions.reset()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.graph_path = os.path.join(directory.name, 'graph.npz')
+        settings = override_settings(SUGGESTIONS_GRAPH_PATH=self.graph_path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # как после запуска build_suggestions по cron
+        suggestions.build()
+
+    def test_no_suggestions_until_graph_is_built(self):
+        os.remove(self.graph_path)
+        suggestions.reset()
+        with self.assertLogs('posts.suggestions', 'WARNING'), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(suggestions.for_user(self.reader), [])
+        self.assertFalse([query['sql'] for query in queries
+                          if 'posts_follow' in query['sql']])
+        # пустой ответ не закэширован: подсказки появляются сразу
+        suggestions.build()
+        self.assertEqual(len(suggestions.for_user(self.reader)), 2)
+
+    def test_pages_show_suggestions(self):
+        for url in [reverse('posts:follow_index'),
+                    reverse('posts:profile', args=[self.star.username])]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.context['suggestions'], [
+                    {'username': 'fof_star', 'overlap': 2},
+                    {'username': 'fof_niche', 'overlap': 1},
+                ])
+                self.assertContains(response, 'Кого почитать')
+
+    def test_follow_updates_suggestions(self):
+        suggestions.for_user(self.reader)
+        self.client.get(reverse('posts:profile_follow',
+                                args=[self.star.username]))
+        self.assertEqual(suggestions.for_user(self.reader),
+                         [{'username': 'fof_niche', 'overlap': 1}])
+        Follow.objects.unfollow_many(self.reader, [self.star.username])
+        self.assertEqual(suggestions.for_user(self.reader)[0]['username'],
+                         'fof_star')
+
+    @override_settings(SUGGESTIONS_REFRESH_INTERVAL=-1)
+    def test_follows_from_other_processes_are_loaded(self):
+        suggestions.graph()
+        newcomer = User.objects.create(username='fof_newcomer')
+        # bulk_create не вызывает сигналов, как запись из другого процесса
+        Follow.objects.bulk_create([Follow(user=self.friend,
+                                           author=newcomer)])
+        self.assertIn({'username': 'fof_newcomer', 'overlap': 1},
+                      suggestions.for_user(self.reader))
+
+    @override_settings(SUGGESTIONS_REFRESH_INTERVAL=-1)
+    def test_graph_is_loaded_from_command_output(self):
+        out = StringIO()
+        call_command('build_suggestions', stdout=out)
+        self.assertIn('Подписок в графе: 5', out.getvalue())
+        # граф читается из файла, запрос только за новыми подписками
+        with self.assertNumQueries(1):
+            graph = suggestions.graph()
+        self.assertEqual(len(graph), 5)
+        # отписка другого процесса видна после следующего запуска команды
+        Follow.objects.filter(user=self.friend, author=self.niche).delete()
+        self.assertEqual(len(suggestions.graph()), 5)
+        suggestions.build()
+        os.utime(self.graph_path, (1, 1))
+        self.assertEqual(len(suggestions.graph()), 4)
+
+    def test_profile_etag_follows_suggestions(self):
+        url = reverse('posts:profile', args=[self.star.username])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # подписка друга меняет подсказки, но не области страницы
+        newcomer = User.objects.create(username='fof_newcomer')
+        Follow.objects.create(user=self.friend, author=newcomer)
+        cache.delete(suggestions.CACHE_KEY.format(
+            self.reader.pk,
+            suggestions.fragments.generation(f'follow:{self.reader.pk}')))
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_suggestions', '--users', '200', '--edges',
+                     '1000', '--queries', '20', '--deltas', '50',
+                     stdout=out)
+        self.assertIn('подсказки: медиана', out.getvalue())
@@ -0,0 +1,53 @@
+import importlib
+import os
+import sys
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.template import engines
+from django.test import SimpleTestCase, override_settings
+
+from yatube import preload
+
+
+def production_settings(**environ):
+    """Заново импортирует боевые настройки с заданным окружением."""
+    sys.modules.pop('yatube.settings_production', None)
+    with mock.patch.dict(os.environ, environ):
+        return importlib.import_module('yatube.settings_production')
+
+
+settings_production = production_settings(DJANGO_SECRET_KEY='test-key')
+
+
+class ProductionSettingsTest(SimpleTestCase):
+    def test_secret_key_is_required(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('DJANGO_SECRET_KEY', None)
+            with self.assertRaisesMessage(ImproperlyConfigured,
+                                          'DJANGO_SECRET_KEY'):
+                production_settings()
+        self.assertEqual(settings_production.SECRET_KEY, 'test-key')
+
+
+class TemplatesTest(SimpleTestCase):
+    def test_template_dirs_are_absolute(self):
+        for directory in settings.TEMPLATES[0]['DIRS']:
+            self.assertTrue(os.path.isabs(directory))
+
+    @override_settings(TEMPLATES=settings_production.TEMPLATES)
+    def test_preload_fills_cached_loader(self):
+        self.assertGreater(preload.templates(), 0)
+        loader, = engines['django'].engine.template_loaders
+        self.assertIn('posts/index.html', loader.get_template_cache)
+        self.assertIn('includes/post_card.html', loader.get_template_cache)
+
+    def test_bench_command_needs_no_database(self):
+        out = StringIO()
+        call_command('bench_templates', '--posts', '3', '--repeat', '2',
+                     stdout=out)
+        self.assertIn('posts/profile.html', out.getvalue())
+        self.assertIn('includes/post_card.html', out.getvalue())
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import images, thumbnails
+from posts.forms import PostForm
+from posts.models import Post, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_file(name='image.png', size=(100, 60)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color=(200, 0, 0)).save(buffer, 'png')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='thumb_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_upload_schedules_generation(self):
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post(reverse('posts:new_post'),
+                             {'text': 'С картинкой', 'image': image_file()})
+        post = Post.objects.get(text='С картинкой')
+        schedule.assert_called_once_with(post)
+        self.assertFalse(post.thumbnails_ready)
+
+    def test_edit_without_new_image_does_not_schedule(self):
+        post = Post.objects.create(author=self.user, text='Без картинки')
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post(
+                reverse('posts:post_edit', args=[self.user.username,
+                                                 post.pk]),
+                {'text': 'Новый текст'})
+        schedule.assert_not_called()
+
+    def test_original_shown_until_thumbnail_ready(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=image_file())
+        url = reverse('posts:post_view', args=[self.user.username, post.pk])
+        self.assertContains(self.client.get(url), post.image.url)
+
+        with mock.patch.object(images, 'build_variants',
+                               wraps=images.build_variants) as build:
+            thumbnails.generate(post.pk)
+        build.assert_called_once_with(post.image, force=False)
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnails_ready)
+        self.assertNotContains(self.client.get(url), post.image.url)
+
+    def test_replaced_image_is_not_marked_ready(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=image_file('old.png'))
+
+        def replace_image(*args, **kwargs):
+            Post.objects.filter(pk=post.pk).update(image='posts/new.png')
+            return {}
+
+        with mock.patch.object(images, 'build_variants',
+                               side_effect=replace_image):
+            thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertFalse(post.thumbnails_ready)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POST_IMAGE_FORMATS=['WEBP'],
+                   POST_IMAGE_WIDTHS=[320, 640, 960, 1920])
+class ImageVariantsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='variants_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_variants_are_not_upscaled(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=image_file(size=(700, 400)))
+        variants = images.build_variants(post.image)
+        self.assertEqual(variants, {'JPEG': [640], 'WEBP': [320, 640]})
+        name = images.variant_name(post.image.name, 640, 'WEBP')
+        with Image.open(os.path.join(MEDIA_ROOT, name)) as variant:
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(variant.size, (640, 226))
+
+    def test_tiny_image_gets_smallest_variant(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=image_file(size=(50, 50)))
+        self.assertEqual(images.build_variants(post.image),
+                         {'JPEG': [320], 'WEBP': [320]})
+
+    def test_transparent_fallback_is_flattened(self):
+        buffer = BytesIO()
+        Image.new('RGBA', (400, 200), color=(0, 0, 0, 0)).save(buffer, 'png')
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=SimpleUploadedFile(
+                                       'alpha.png', buffer.getvalue()))
+        images.build_variants(post.image)
+        name = images.variant_name(post.image.name, 320, 'JPEG')
+        with Image.open(os.path.join(MEDIA_ROOT, name)) as variant:
+            self.assertEqual(variant.format, 'JPEG')
+            self.assertEqual(variant.getpixel((0, 0)), (255, 255, 255))
+
+    def test_picture_lists_srcset(self):
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image=image_file(size=(1000, 400)))
+        thumbnails.generate(post.pk)
+        response = self.client.get(
+            reverse('posts:post_view', args=[self.user.username, post.pk]))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '-960.webp 960w')
+        self.assertNotContains(response, '1920w')
+        # запасной <img> — JPEG шириной с карточку, не в <source>
+        self.assertContains(response, '-960.jpg" width="960" height="339"')
+        self.assertNotContains(response, '.jpg 960w')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='metadata_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_form_stores_metadata(self):
+        upload = image_file(size=(120, 80))
+        content = upload.read()
+        upload.seek(0)
+        form = PostForm({'text': 'Пост'}, {'image': upload})
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (120, 80))
+        self.assertEqual(post.image_format, 'PNG')
+        self.assertEqual(post.image_size, len(content))
+        self.assertEqual(post.image_hash, hashlib.sha256(content).hexdigest())
+        # PNG не уменьшить при декодировании: заглушку строит фоновая задача
+        self.assertEqual(post.image_placeholder, '')
+        thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'))
+
+    def test_jpeg_placeholder_is_built_from_draft(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200)).save(buffer, 'jpeg')
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        with mock.patch.object(Image.Image, 'load',
+                               autospec=True,
+                               side_effect=Image.Image.load) as load:
+            metadata = images.describe(upload)
+        self.assertTrue(metadata['image_placeholder'].startswith(
+            'data:image/jpeg;base64,'))
+        # декодирована копия в 1/8 размера, а не 1600×1200
+        self.assertEqual(load.call_args_list[0][0][0].size, (200, 150))
+
+    def test_rotated_photo_reports_displayed_size(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[images.EXIF_ORIENTATION] = 6
+        Image.new('RGB', (120, 80)).save(buffer, 'jpeg', exif=exif)
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        metadata = images.describe(upload)
+        self.assertEqual(
+            (metadata['image_width'], metadata['image_height']), (80, 120))
+
+    def test_card_is_rendered_from_row(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image='posts/missing.png',
+            image_width=640, image_height=480,
+            image_placeholder='data:image/jpeg;base64,AAAA')
+        response = self.client.get(
+            reverse('posts:post_view', args=[self.user.username, post.pk]))
+        self.assertContains(response, 'width="640" height="480"')
+        self.assertContains(response, 'url(data:image/jpeg;base64,AAAA)')
@@ -0,0 +1,74 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='reader')
+        cls.author = User.objects.create(username='author')
+        cls.stranger = User.objects.create(username='stranger')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает только в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.stranger).exists())
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка дозаполняет ленту, отписка очищает её."""
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
+        follow.delete()
+        self.assertFalse(timeline.feed(self.reader).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_celebrity_posts_are_pulled_at_read(self):
+        """Посты знаменитостей не раскладываются, но видны в ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.stranger, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост звезды')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_crossing_celebrity_threshold(self):
+        """Список знаменитостей в кэше сбрасывается при пересечении
+        порога, а посты бывшей знаменитости раскладываются по лентам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        # список в кэше: автор пока не знаменитость
+        self.assertEqual(timeline.pulled_authors(self.reader), [])
+        fan = Follow.objects.create(user=self.stranger, author=self.author)
+        self.assertEqual(timeline.pulled_authors(self.reader),
+                         [self.author.pk])
+        post = Post.objects.create(author=self.author, text='Пост звезды')
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
+
+        fan.delete()
+        self.assertEqual(timeline.pulled_authors(self.reader), [])
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
+
+    def test_rebuild_timeline_command(self):
+        """Команда rebuild_timeline восстанавливает ленты из Follow."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timeline', stdout=StringIO())
+        self.assertEqual(list(timeline.feed(self.reader)), [post])
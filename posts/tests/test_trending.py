@@ -0,0 +1,174 @@
+import datetime as dt
+import math
+from array import array
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import trending
+from posts.models import Comment, Post, PostTrend, User
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='trend_author')
+        cls.reader = User.objects.create(username='trend_reader')
+        cls.quiet, cls.hot, cls.stale = [
+            Post.objects.create(author=cls.author, text=text)
+            for text in ['Тихий пост', 'Горячий пост', 'Старый пост']]
+
+    def setUp(self):
+        # просмотры, оставшиеся в памяти от других тестов
+        trending.flush_views()
+        cache.clear()
+        self.client = Client()
+
+    def comment(self, post, hours_ago=0):
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        if hours_ago:
+            Comment.objects.filter(pk=comment.pk).update(
+                created=comment.created - dt.timedelta(hours=hours_ago))
+        return comment
+
+    def test_logaddexp(self):
+        self.assertAlmostEqual(trending.logaddexp(math.log(2), math.log(3)),
+                               math.log(5))
+        self.assertAlmostEqual(trending.logaddexp(1e6, 1e6),
+                               1e6 + math.log(2))
+        self.assertIsNone(trending.logaddexp(None, None))
+
+    def test_comments_update_score(self):
+        self.comment(self.quiet)
+        key = PostTrend.objects.get(pk=self.quiet.pk).score
+        self.comment(self.quiet)
+        self.assertAlmostEqual(PostTrend.objects.get(pk=self.quiet.pk).score,
+                               key + math.log(2), places=6)
+        self.comment(self.hot)
+        self.comment(self.hot)
+        self.comment(self.hot)
+        self.assertEqual(trending.top_ids(), [self.hot.pk, self.quiet.pk])
+
+    def test_old_comments_decay(self):
+        for _ in range(3):
+            self.comment(self.stale, hours_ago=24)
+        self.comment(self.hot)
+        trending.recompute()
+        # три комментария суточной давности весят как 3/16 свежего
+        self.assertEqual(trending.top_ids(), [self.hot.pk, self.stale.pk])
+
+    def test_deleted_comment_is_recounted(self):
+        first = self.comment(self.hot)
+        self.comment(self.quiet)
+        self.comment(self.quiet)
+        trending.top_ids()
+        first.delete()
+        self.assertFalse(PostTrend.objects.filter(pk=self.hot.pk).exists())
+        self.assertEqual(trending.top_ids(), [self.quiet.pk])
+
+    def test_views_are_folded_by_recompute(self):
+        url = reverse('posts:post_view',
+                      args=[self.author.username, self.quiet.pk])
+        for _ in range(3):
+            self.client.get(url)
+        key = trending.VIEWS_KEY.format(self.quiet.pk)
+        # просмотры копятся в памяти процесса до сброса
+        self.assertIsNone(cache.get(key))
+        trending.flush_views()
+        self.assertEqual(cache.get(key), 3)
+        self.assertFalse(PostTrend.objects.exists())
+        self.assertEqual(trending.recompute(), 1)
+        self.assertEqual(cache.get(key), 0)
+        trend = PostTrend.objects.get(pk=self.quiet.pk)
+        self.assertIsNone(trend.comments_key)
+        self.assertEqual(trend.score, trend.views_key)
+        # повторный пересчёт не теряет уже учтённые просмотры
+        trending.recompute()
+        self.assertEqual(PostTrend.objects.get(pk=self.quiet.pk).views_key,
+                         trend.views_key)
+
+    @override_settings(TRENDING_VIEW_BATCH=5)
+    def test_views_are_flushed_in_batches(self):
+        with mock.patch.object(trending, 'cache', wraps=cache) as spy:
+            for _ in range(4):
+                trending.record_view(self.quiet)
+            spy.incr.assert_not_called()
+            trending.record_view(self.quiet)
+            trending.record_view(self.hot)
+        # пять просмотров — один перенос в кэш
+        spy.incr.assert_called_once_with(
+            trending.VIEWS_KEY.format(self.quiet.pk), 5)
+        self.assertEqual(cache.get(trending.VIEWS_KEY.format(self.quiet.pk)),
+                         5)
+        trending.flush_views()
+        self.assertEqual(cache.get(trending.VIEWS_KEY.format(self.hot.pk)),
+                         1)
+
+    def test_view_counters_are_read_in_chunks(self):
+        for post in [self.quiet, self.hot]:
+            trending.record_view(post)
+        trending.flush_views()
+        with mock.patch.object(trending, 'VIEWS_CHUNK', 1), \
+                mock.patch.object(trending, 'cache', wraps=cache) as spy:
+            self.assertEqual(trending.recompute(), 2)
+        self.assertEqual(
+            [len(call.args[0]) for call in spy.get_many.call_args_list],
+            [1, 1, 1])
+
+    def test_deleted_post_skips_comment_recount(self):
+        post = Post.objects.create(author=self.author, text='Удаляемый')
+        for _ in range(3):
+            self.comment(post)
+        self.assertEqual(trending.top_ids(), [post.pk])
+        with mock.patch.object(trending, 'recount_post') as recount:
+            post.delete()
+        recount.assert_not_called()
+        self.assertEqual(trending.top_ids(), [])
+        self.assertEqual(trending.deleting_posts(), set())
+
+    def test_window_drops_cold_posts(self):
+        self.comment(self.stale, hours_ago=24 * 4)
+        self.comment(self.hot)
+        self.assertEqual(trending.recompute(), 1)
+        self.assertEqual(trending.top_ids(), [self.hot.pk])
+
+    def test_page(self):
+        self.comment(self.quiet)
+        for _ in range(2):
+            self.comment(self.hot)
+        # порядок из кэша и посты одним запросом, без запросов на пост
+        trending.top_ids()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(response.context['posts'], [self.hot, self.quiet])
+        self.assertContains(response, 'Горячий пост')
+
+    def test_command(self):
+        self.comment(self.hot)
+        out = StringIO()
+        call_command('update_trending', stdout=out)
+        self.assertIn('Постов в популярном: 1', out.getvalue())
+
+
+class CommentKeysTest(TestCase):
+    def test_vectorized_matches_logaddexp(self):
+        now = timezone.now().timestamp()
+        post_ids = array('i', [3, 1, 3, 2, 3])
+        stamps = array('d', [now, now - 3600, now - 7200, now, now - 60])
+        vectorized = trending._comment_keys(post_ids, stamps)
+        weight = math.log(settings.TRENDING_COMMENT_WEIGHT)
+        plain = {}
+        for post_id, stamp in zip(post_ids, stamps):
+            plain[post_id] = trending.logaddexp(
+                plain.get(post_id), weight + trending.rate() * stamp)
+        self.assertEqual(vectorized.keys(), plain.keys())
+        for post_id, key in plain.items():
+            self.assertAlmostEqual(vectorized[post_id], key, places=6)
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails, uploads
+from posts.models import Post, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+NEW_POST_URL = reverse('posts:new_post')
+
+
+def jpeg_file(size=(120, 80), orientation=None, frames=1):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[uploads.EXIF_ORIENTATION] = orientation
+    images = [Image.new('RGB', size, color=(0, 120, 0))
+              for _ in range(frames)]
+    if frames > 1:
+        # несколько кадров — MPO, как у снимков камер и смартфонов
+        images[0].save(buffer, 'mpo', exif=exif, save_all=True,
+                       append_images=images[1:])
+    else:
+        images[0].save(buffer, 'jpeg', exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POST_IMAGE_MAX_BYTES=2 ** 20,
+                   POST_IMAGE_MAX_PIXELS=200 * 200)
+@mock.patch.object(thumbnails, 'schedule')
+class ImageUploadHandlerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='upload_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def post(self, upload):
+        with self.assertLogs('posts.uploads', 'INFO') as logs:
+            response = self.client.post(
+                NEW_POST_URL, {'text': 'Фото', 'image': upload})
+        self.assertIn('декодировано', logs.output[0])
+        return response
+
+    def test_rotates_and_strips_exif(self, schedule):
+        self.post(jpeg_file(orientation=6))
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (80, 120))
+            self.assertFalse(image.getexif())
+        self.assertEqual(post.image_size, post.image.size)
+
+    def test_mpo_is_reencoded_as_jpeg(self, schedule):
+        self.post(jpeg_file(orientation=6, frames=2))
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (80, 120))
+            self.assertFalse(image.getexif())
+
+    def test_rejects_oversized_file(self, schedule):
+        with override_settings(POST_IMAGE_MAX_BYTES=100):
+            response = self.post(jpeg_file())
+        self.assertIn('Файл больше 100',
+                      response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_by_declared_dimensions(self, schedule):
+        response = self.post(jpeg_file(size=(300, 300)))
+        self.assertIn('300x300', response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_non_image(self, schedule):
+        response = self.post(
+            SimpleUploadedFile('fake.jpg', b'not an image at all'))
+        self.assertFormError(response, 'form', 'image',
+                             'Загрузите правильное изображение.')
+
+    def test_csrf_is_still_checked(self, schedule):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(NEW_POST_URL,
+                               {'text': 'Фото', 'image': jpeg_file()})
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts import images
+from posts.models import Group, Post, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color=color).save(buffer, 'png')
+    return SimpleUploadedFile('image.png', buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POST_IMAGE_FORMATS=['WEBP'])
+@mock.patch.object(images, 'build_variants', wraps=images.build_variants)
+class WarmThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='warm_user')
+        cls.group = Group.objects.create(title='Фото', slug='photos',
+                                         description='Картинки')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {i}',
+                                group=cls.group if i % 2 else None,
+                                image=png((i * 40, 0, 0)))
+            for i in range(4)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def warm(self, *args):
+        out = StringIO()
+        call_command('warm_thumbnails', '--workers', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def ready(self):
+        return set(Post.objects.filter(thumbnails_ready=True).values_list(
+            'pk', flat=True))
+
+    def test_builds_missing_thumbnails_in_batches(self, build):
+        output = self.warm('--batch-size', '3')
+        self.assertEqual(self.ready(), {post.pk for post in self.posts})
+        self.assertIn('3/4 постов', output)
+        self.assertIn('Готово: 4 постов, ошибок: 0', output)
+        self.assertEqual(build.call_count, 4)
+
+        build.reset_mock()
+        self.assertIn('Готово: 0 постов', self.warm())
+        build.assert_not_called()
+
+    def test_group_filter(self, build):
+        self.warm('--group', self.group.slug)
+        self.assertEqual(self.ready(), {self.posts[1].pk, self.posts[3].pk})
+
+    def test_resumes_after_interruption(self, build):
+        build.side_effect = [{}, {}, KeyboardInterrupt]
+        with self.assertRaises(KeyboardInterrupt):
+            self.warm('--batch-size', '2')
+        build.side_effect = None
+        output = self.warm('--batch-size', '2')
+        self.assertIn(f'Продолжаем после поста {self.posts[1].pk}', output)
+        self.assertIn('Готово: 2 постов', output)
+        self.assertEqual(self.ready(), {post.pk for post in self.posts})
+
+    def test_backfills_posts_without_variants(self, build):
+        legacy = self.posts[0]
+        # так пост выглядел после миграции 0017: «готов», но без вариантов
+        # и метаданных
+        Post.objects.filter(pk=legacy.pk).update(
+            thumbnails_ready=True, image_variants='', image_width=None,
+            image_height=None, image_hash='')
+        Post.objects.exclude(pk=legacy.pk).update(
+            thumbnails_ready=True, image_variants='{"JPEG": [320]}')
+        self.assertIn('Готово: 1 постов', self.warm())
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.image_variants,
+                         '{"JPEG": [320], "WEBP": [320]}')
+        self.assertEqual((legacy.image_width, legacy.image_height), (40, 30))
+        self.assertEqual(len(legacy.image_hash), 64)
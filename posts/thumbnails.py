@@ -0,0 +1,94 @@
+"""Фоновая подготовка адаптивных вариантов картинок постов.
+
+Раньше превью строил `{% thumbnail %}` при первом показе поста, и этот
+запрос платил за декодирование, масштабирование и кодирование картинки.
+Теперь загрузка из формы ставит задачу в локальный пул потоков после
+фиксации транзакции, а шаблоны показывают оригинал, пока у поста не
+выставлен `thumbnails_ready`. Карточки собираются только из вариантов
+(см. images.py), поэтому превью sorl-thumbnail больше не строятся.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import fragments, images
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.POST_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate(post_id, force=False):
+    """Строит недостающие варианты для `srcset` и запасной JPEG, дополняет недостающие метаданные картинки и отмечает пост
+    готовым. С `force` варианты перекодируются заново."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    # одинаковые картинки хранятся одним файлом (см. storage.py), и его
+    # варианты уже могли построить для другого поста
+    twin = Post.objects.filter(
+        image=post.image.name, thumbnails_ready=True,
+        image_variants__contains=f'"{images.FALLBACK_FORMAT}"').exclude(
+        pk=post_id).values_list('image_variants', flat=True).first()
+    if twin is not None and not force:
+        variants = json.loads(twin)
+    else:
+        variants = images.build_variants(post.image, force=force)
+    # картинку могли заменить, пока строились варианты: тогда готовность
+    # отметит задача, поставленная для новой картинки
+    fields = {'thumbnails_ready': True,
+              'image_variants': images.dump_variants(variants)}
+    if post.image_width is None:
+        # картинки, загруженные до метаданных (миграция 0019)
+        post.image.open('rb')
+        try:
+            fields.update(images.describe(post.image))
+        finally:
+            post.image.close()
+    if not fields.get('image_placeholder', post.image_placeholder):
+        fields['image_placeholder'] = images.build_placeholder(post.image,
+                                                               variants)
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        **fields)
+    if updated:
+        fragments.bump(*fragments.post_scopes(post.author_id, post.group_id,
+                                              post.pk))
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось построить превью поста %s', post_id)
+    finally:
+        # у каждого потока пула своё соединение с базой
+        connection.close()
+
+
+def schedule(post):
+    """Ставит построение превью в очередь после фиксации транзакции.
+
+    При `POST_THUMBNAIL_WORKERS = 0` превью строятся сразу в том же
+    потоке (удобно для тестов и management-команд).
+    """
+    post_id = post.pk
+    if settings.POST_THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: _get_executor().submit(_run, post_id))
+    else:
+        transaction.on_commit(lambda: generate(post_id))
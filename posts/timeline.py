@@ -0,0 +1,209 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается по лентам подписчиков автора в момент
+публикации. Посты «знаменитостей» (авторов, у которых подписчиков больше
+`TIMELINE_FANOUT_LIMIT`) не раскладываются, а подмешиваются в ленту при
+чтении, чтобы одна публикация не превращалась в миллион вставок. Когда
+автор опускается ниже порога, его последние посты раскладываются по
+лентам подписчиков (`followers_changed`).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Q, Subquery
+
+from . import fragments
+from .models import Follow, Post, TimelineEntry, User, UserCounters
+
+PULLED_AUTHORS_KEY = 'timeline:pulled:{}:{}'
+# поколение меняется, когда автор пересекает TIMELINE_FANOUT_LIMIT: тогда
+# устаревают кэшированные списки знаменитостей всех читателей разом
+CELEBRITIES_SCOPE = 'celebrities'
+# лента сортируется по колонкам TimelineEntry, чтобы чтение шло по индексу
+# (user, -pub_date, -post) без сортировки во временном B-дереве
+FEED_ORDERING = ('-feed_date', '-feed_post')
+
+
+def is_celebrity(author_id):
+    """Проверяет, читается ли лента автора при запросе, а не при записи."""
+    return UserCounters.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT).exists()
+
+
+def _pulled_key(user_id):
+    return PULLED_AUTHORS_KEY.format(
+        fragments.generation(CELEBRITIES_SCOPE), user_id)
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_many(post_ids):
+    """`fan_out` для пачки постов, вставленных без сигналов (импорт)."""
+    posts = Post.objects.filter(pk__in=list(post_ids)).exclude(
+        author__counters__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('author_id', 'id', 'pub_date')
+    by_author = defaultdict(list)
+    for author_id, post_id, pub_date in posts:
+        by_author[author_id].append((post_id, pub_date))
+    for author_id, author_posts in by_author.items():
+        follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for user_id in follower_ids.iterator()
+             for post_id, pub_date in author_posts],
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def backfill(user_id, author_id):
+    """Дозаполняет ленту пользователя постами автора после подписки."""
+    cache.delete(_pulled_key(user_id))
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts[:settings.TIMELINE_BACKFILL_LIMIT]],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_many(user_id, author_ids):
+    """`backfill` для пачки новых подписок: границы дат считаются одним
+    запросом, посты всех авторов выбираются вторым, вставка — одна."""
+    cache.delete(_pulled_key(user_id))
+    # дата самого старого из TIMELINE_BACKFILL_LIMIT последних постов
+    # автора; у авторов с меньшим числом постов берутся все
+    oldest = Post.objects.filter(author_id=OuterRef('pk')).order_by(
+        '-pub_date').values('pub_date')[
+        settings.TIMELINE_BACKFILL_LIMIT - 1:settings.TIMELINE_BACKFILL_LIMIT]
+    authors = User.objects.filter(pk__in=author_ids).exclude(
+        counters__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).annotate(oldest=Subquery(oldest)).values_list('pk', 'oldest')
+    condition = Q()
+    for author_id, oldest in authors:
+        if oldest is None:
+            condition |= Q(author_id=author_id)
+        else:
+            condition |= Q(author_id=author_id, pub_date__gte=oldest)
+    if not condition:
+        return
+    posts = Post.objects.filter(condition).values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех его
+    подписчиков (посты, написанные, пока автор был знаменитостью, в ленты
+    не попадали)."""
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')[
+        :settings.TIMELINE_BACKFILL_LIMIT])
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True)
+    for user_id in follower_ids.iterator():
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in posts],
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def followers_changed(author_ids, followed):
+    """Вызывается после подписки (`followed`) или отписки с уже
+    сдвинутыми счётчиками: если авторы пересекли порог знаменитости,
+    сбрасывает списки знаменитостей в кэше, а опустившихся ниже порога
+    раскладывает по лентам."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    crossed = list(UserCounters.objects.filter(
+        user_id__in=author_ids,
+        followers_count=limit + 1 if followed else limit).values_list(
+        'user_id', flat=True))
+    if not crossed:
+        return
+    fragments.bump(CELEBRITIES_SCOPE)
+    if not followed:
+        for author_id in crossed:
+            backfill_followers(author_id)
+
+
+def rebuild():
+    """Заново собирает все ленты из подписок; возвращает число
+    обработанных подписок."""
+    TimelineEntry.objects.all().delete()
+    total = 0
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id)
+        total += 1
+    return total
+
+
+def prune(user_id, *author_ids):
+    """Убирает из ленты пользователя посты авторов после отписки."""
+    cache.delete(_pulled_key(user_id))
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id__in=author_ids).delete()
+
+
+def pulled_authors(user):
+    """Знаменитости среди подписок пользователя, их посты читаются
+    напрямую из `Post`."""
+    key = _pulled_key(user.pk)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(Follow.objects.filter(
+            user=user,
+            author__counters__followers_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT)).values_list(
+            'author_id', flat=True))
+        cache.set(key, author_ids, settings.TIMELINE_CACHE_TIMEOUT)
+    return author_ids
+
+
+def feed_size(user):
+    """Число постов в ленте без подсчёта по соединению с `Post`; None,
+    если в ленту подмешиваются знаменитости и число заранее неизвестно."""
+    if pulled_authors(user):
+        return None
+    return TimelineEntry.objects.filter(user=user).count()
+
+
+def feed(user):
+    """Посты ленты подписок пользователя, сортировать по `FEED_ORDERING`."""
+    author_ids = pulled_authors(user)
+    if not author_ids:
+        return Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_post=F('timeline_entries__post_id'),
+        )
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=entries) | Q(author_id__in=author_ids)).annotate(
+        feed_date=F('pub_date'), feed_post=F('id'))
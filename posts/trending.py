@@ -0,0 +1,273 @@
+"""Лента популярных постов `/trending/`.
+
+Счёт поста — сумма весов его комментариев и просмотров, затухающих с
+периодом полураспада `TRENDING_HALF_LIFE`. В `PostTrend` хранится ключ
+`ln Σ w·e^(λ·t)`: новый комментарий прибавляется к нему сразу
+(`record_comment`), просмотры копятся в памяти процесса, пачками
+переносятся в счётчики кэша (`flush_views`) и вливаются
+периодическим пересчётом (`recompute`, `manage.py update_trending`),
+который заодно точно пересчитывает вклад комментариев за окно
+`TRENDING_WINDOW` и убирает остывшие посты.
+
+Лучшие `TRENDING_TOP_K` постов лежат в кэше отсортированным списком
+ограниченной длины, поэтому лента читается за O(K).
+"""
+import bisect
+import datetime as dt
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Comment, Post, PostTrend
+
+TOP_KEY = 'trending:top'
+VIEWS_KEY = 'trending:views:{}'
+# попыток обновить ключ, прежде чем оставить его пересчёту
+ATTEMPTS = 5
+# ключей просмотров в одном `get_many`: у SQLiteCache это один запрос
+# `IN (...)`, и число его параметров ограничено
+VIEWS_CHUNK = 500
+
+# просмотры, ещё не перенесённые в кэш: id поста -> число
+_views = Counter()
+_views_lock = threading.Lock()
+_views_flushed = time.monotonic()
+# посты, которые удаляются в этом потоке (см. signals.untrend_comment)
+_deleting = threading.local()
+
+
+def rate():
+    """λ: за период полураспада вклад события уменьшается вдвое."""
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def event_key(weight, moment):
+    return math.log(weight) + rate() * moment.timestamp()
+
+
+def logaddexp(a, b):
+    """ln(e^a + e^b) без переполнения; None — пустая сумма."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def window_start(now=None):
+    return (now or timezone.now()) - dt.timedelta(
+        seconds=settings.TRENDING_WINDOW)
+
+
+def record_view(post):
+    """Просмотр недавнего поста: счётчик в памяти процесса, без записи в
+    кэш и базу. В кэш счётчики переносятся раз в
+    `TRENDING_VIEW_FLUSH` секунд или `TRENDING_VIEW_BATCH` просмотров."""
+    if post.pub_date < window_start():
+        return
+    with _views_lock:
+        _views[post.pk] += 1
+        due = (sum(_views.values()) >= settings.TRENDING_VIEW_BATCH
+               or time.monotonic() - _views_flushed
+               >= settings.TRENDING_VIEW_FLUSH)
+    if due:
+        flush_views()
+
+
+def flush_views():
+    """Переносит накопленные процессом просмотры в счётчики кэша: одна
+    запись на пост, а не на каждый просмотр. Несброшенные просмотры
+    процесса при его остановке теряются (не больше пачки)."""
+    global _views_flushed
+    with _views_lock:
+        pending = dict(_views)
+        _views.clear()
+        _views_flushed = time.monotonic()
+    for post_id, count in pending.items():
+        key = VIEWS_KEY.format(post_id)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, settings.TRENDING_WINDOW):
+                cache.incr(key, count)
+
+
+def deleting_posts():
+    """id постов, удаление которых идёт в текущем потоке."""
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+def record_comment(comment):
+    """Прибавляет новый комментарий к ключу поста.
+
+    Запись сравнивает ключ с прочитанным (compare-and-swap), поэтому
+    параллельные комментарии к одному посту не теряются.
+    """
+    added = event_key(settings.TRENDING_COMMENT_WEIGHT, comment.created)
+    for _ in range(ATTEMPTS):
+        trend = PostTrend.objects.filter(pk=comment.post_id).values_list(
+            'comments_key', 'views_key').first()
+        if trend is None:
+            try:
+                with transaction.atomic():
+                    PostTrend.objects.create(post_id=comment.post_id,
+                                             comments_key=added,
+                                             score=added)
+            except IntegrityError:
+                continue
+            remember(comment.post_id, added)
+            return
+        comments_key, views_key = trend
+        new_key = logaddexp(comments_key, added)
+        score = logaddexp(new_key, views_key)
+        if PostTrend.objects.filter(
+                pk=comment.post_id, comments_key=comments_key).update(
+                comments_key=new_key, score=score):
+            remember(comment.post_id, score)
+            return
+
+
+def recount_post(post_id):
+    """Точный вклад комментариев одного поста (после удаления
+    комментария)."""
+    stamps = Comment.objects.filter(
+        post_id=post_id, created__gte=window_start()).values_list(
+        'created', flat=True)
+    comments_key = None
+    for created in stamps:
+        comments_key = logaddexp(
+            comments_key,
+            event_key(settings.TRENDING_COMMENT_WEIGHT, created))
+    views_key = PostTrend.objects.filter(pk=post_id).values_list(
+        'views_key', flat=True).first()
+    score = logaddexp(comments_key, views_key)
+    if score is None:
+        PostTrend.objects.filter(pk=post_id).delete()
+        forget(post_id)
+        return
+    if PostTrend.objects.filter(pk=post_id).update(
+            comments_key=comments_key, score=score):
+        forget(post_id)
+        remember(post_id, score)
+
+
+def remember(post_id, score):
+    """Обновляет пост в кэшированном списке лучших; список хранит пары
+    (-счёт, id) по возрастанию и не длиннее `TRENDING_TOP_K`."""
+    top = cache.get(TOP_KEY)
+    if top is None:
+        return
+    top = [item for item in top if item[1] != post_id]
+    limit = settings.TRENDING_TOP_K
+    if len(top) >= limit and -score >= top[-1][0]:
+        return
+    bisect.insort(top, (-score, post_id))
+    cache.set(TOP_KEY, top[:limit], None)
+
+
+def forget(post_id):
+    top = cache.get(TOP_KEY)
+    if top is not None:
+        cache.set(TOP_KEY, [item for item in top if item[1] != post_id],
+                  None)
+
+
+def top_ids():
+    """id лучших постов; при пустом кэше — один запрос по индексу."""
+    top = cache.get(TOP_KEY)
+    if top is None:
+        top = [(-score, post_id) for post_id, score in
+               PostTrend.objects.order_by('-score').values_list(
+                   'post_id', 'score')[:settings.TRENDING_TOP_K]]
+        cache.set(TOP_KEY, top, None)
+    return [post_id for _, post_id in top]
+
+
+def _comment_keys(post_ids, stamps):
+    """Ключи комментариев по постам одним проходом по массивам."""
+    if not post_ids:
+        return {}
+    weight = settings.TRENDING_COMMENT_WEIGHT
+    exponents = rate() * np.frombuffer(stamps, dtype=np.float64)
+    # сдвиг на максимум: экспоненты от «секунд с 1970 года» иначе
+    # переполнились бы
+    shift = exponents.max()
+    posts, index = np.unique(np.frombuffer(post_ids, dtype=np.int32),
+                             return_inverse=True)
+    sums = np.bincount(index, weights=np.exp(exponents - shift))
+    keys = np.log(weight * sums) + shift
+    return dict(zip(posts.tolist(), keys.tolist()))
+
+
+def recompute(now=None):
+    """Пересчитывает ключи всех постов с активностью за окно, вливает
+    накопленные просмотры, убирает остывшие посты и заново строит
+    список лучших. Возвращает число постов в трендах."""
+    now = now or timezone.now()
+    start = window_start(now)
+    flush_views()
+    post_ids, stamps = array('i'), array('d')
+    rows = Comment.objects.filter(created__gte=start).values_list(
+        'post_id', 'created').iterator(chunk_size=2000)
+    for post_id, created in rows:
+        post_ids.append(post_id)
+        stamps.append(created.timestamp())
+    comment_keys = _comment_keys(post_ids, stamps)
+
+    # просмотры дешевле события с весом 1 в начале окна уже не влияют
+    cutoff = rate() * start.timestamp()
+    view_keys = {
+        post_id: key for post_id, key in PostTrend.objects.exclude(
+            views_key=None).values_list('post_id', 'views_key')
+        if key >= cutoff
+    }
+    recent = Post.objects.filter(pub_date__gte=start).values_list(
+        'pk', flat=True).iterator(chunk_size=2000)
+    pending = {}
+    while True:
+        keys = [VIEWS_KEY.format(post_id)
+                for post_id in islice(recent, VIEWS_CHUNK)]
+        if not keys:
+            break
+        pending.update(cache.get_many(keys))
+    now_key = rate() * now.timestamp()
+    for key, count in pending.items():
+        if count:
+            post_id = int(key.rsplit(':', 1)[1])
+            view_keys[post_id] = logaddexp(
+                view_keys.get(post_id),
+                math.log(settings.TRENDING_VIEW_WEIGHT * count) + now_key)
+
+    trends = [
+        PostTrend(post_id=post_id,
+                  comments_key=comment_keys.get(post_id),
+                  views_key=view_keys.get(post_id),
+                  score=logaddexp(comment_keys.get(post_id),
+                                  view_keys.get(post_id)))
+        for post_id in comment_keys.keys() | view_keys.keys()
+    ]
+    with transaction.atomic():
+        PostTrend.objects.all().delete()
+        PostTrend.objects.bulk_create(trends, batch_size=500)
+    for key, count in pending.items():
+        try:
+            # вычитаем, а не удаляем: просмотры во время пересчёта
+            # останутся до следующего раза
+            cache.decr(key, count)
+        except ValueError:
+            pass
+    top = sorted((-trend.score, trend.post_id) for trend in trends)
+    cache.set(TOP_KEY, top[:settings.TRENDING_TOP_K], None)
+    return len(trends)
@@ -0,0 +1,150 @@
+"""Потоковая проверка загружаемых картинок постов.
+
+Стандартные обработчики держат файлы до 2,5 МБ в памяти, а
+`forms.ImageField` ещё раз копирует их в `BytesIO`. `ImageUploadHandler`
+пишет загрузку чанками во временный файл и прерывает запись, как только
+превышен `POST_IMAGE_MAX_BYTES`. Когда файл получен, он проверяется по
+заголовку: размеры больше `POST_IMAGE_MAX_PIXELS` и «бомбы
+декомпрессии» отклоняются до декодирования. Затем за один проход
+картинка поворачивается по EXIF Orientation и пересохраняется без EXIF.
+Память на загрузку ограничена размером чанка и декодированной
+картинкой не больше `POST_IMAGE_MAX_PIXELS`.
+"""
+import logging
+import time
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+# параметры пересохранения без EXIF; форматы без EXIF не трогаем
+REENCODE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+    'TIFF': {},
+}
+# форматы, которые пересохраняются в другой: MPO (снимки камер и
+# смартфонов) — это JPEG с дополнительными кадрами, сохраняем первый
+REENCODE_AS = {'MPO': 'JPEG'}
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def inspect(path):
+    """Открывает картинку, читая только заголовок, и проверяет
+    объявленный в нём размер."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            image = Image.open(path)
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError):
+            raise UploadRejected('Картинка слишком большая.')
+        except Exception:
+            raise UploadRejected('Загрузите правильное изображение.')
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        image.close()
+        raise UploadRejected(
+            f'Картинка {width}x{height} больше допустимых '
+            f'{settings.POST_IMAGE_MAX_PIXELS:,} пикселей.')
+    return image
+
+
+def strip_metadata(image, file):
+    """Поворачивает картинку по EXIF и перезаписывает `file` без EXIF.
+
+    Возвращает число байт декодированной картинки (0, если EXIF нет и
+    файл оставлен как есть).
+    """
+    image_format = REENCODE_AS.get(image.format, image.format)
+    if image_format not in REENCODE_OPTIONS or not image.getexif():
+        return 0
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        image.load()
+    decoded = image.width * image.height * len(image.getbands())
+    normalized = ImageOps.exif_transpose(image)
+    # exif_transpose оставляет EXIF без Orientation; удаляем целиком
+    normalized.info.pop('exif', None)
+    file.seek(0)
+    file.truncate()
+    options = dict(REENCODE_OPTIONS[image_format])
+    if image.info.get('icc_profile'):
+        # без цветового профиля фото с широким охватом выцветают
+        options['icc_profile'] = image.info['icc_profile']
+    normalized.save(file, image_format, **options)
+    file.flush()
+    return decoded
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Обработчик загрузок для `new_post` и `post_edit`.
+
+    Отклонённые файлы не попадают в `request.FILES`, а причина
+    записывается в `request.upload_errors[имя поля]` (словарь создаёт
+    декоратор `image_uploads`), откуда её забирает `PostForm`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.rejected = None
+        self.started = time.perf_counter()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejected:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.rejected = (
+                'Файл больше '
+                f'{filesizeformat(settings.POST_IMAGE_MAX_BYTES)}.')
+            # остаток тела запроса читается, но уже никуда не пишется
+            self.file.close()
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.rejected:
+            return self.reject(self.rejected)
+        upload = super().file_complete(file_size)
+        decoded = 0
+        try:
+            image = inspect(upload.temporary_file_path())
+            try:
+                decoded = strip_metadata(image, upload.file)
+            finally:
+                image.close()
+        except UploadRejected as error:
+            upload.close()
+            return self.reject(str(error))
+        except Exception:
+            upload.close()
+            return self.reject('Загрузите правильное изображение.')
+        upload.size = upload.file.tell() if decoded else file_size
+        upload.file.seek(0)
+        self.report(upload.size, decoded)
+        return upload
+
+    def reject(self, message):
+        self.request.upload_errors[self.field_name] = message
+        self.report(0, 0, rejected=message)
+        # None: файл не передаётся следующим обработчикам
+        return None
+
+    def report(self, size, decoded, rejected=None):
+        logger.info(
+            'upload %s: %s байт получено, %s байт сохранено, декодировано '
+            '%s байт, %.1f мс%s',
+            self.file_name, self.received, size, decoded,
+            (time.perf_counter() - self.started) * 1000,
+            f', отклонено: {rejected}' if rejected else '')
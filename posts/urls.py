@@ -7,15 +7,25 @@ app_name = "posts"
 urlpatterns = [
     path("", views.index, name="index"),
     path("group/<slug:slug>/", views.group_posts, name="group"),
+    path("group/<slug:slug>/export/", views.group_export,
+         name="group_export"),
     path("new/", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("follow/batch/", views.follow_batch, name="follow_batch"),
+    path("search/", views.search, name="search"),
+    path("trending/", views.trending, name="trending"),
     path("<str:username>/", views.profile, name="profile"),
+    path("<str:username>/export/", views.profile_export,
+         name="profile_export"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post_view"),
     path(
         "<str:username>/<int:post_id>/edit/",
         views.post_edit,
         name="post_edit"),
 
+    path("<str:username>/<int:post_id>/comments/",
+         views.post_comments,
+         name="post_comments"),
     path("<str:username>/<int:post_id>/comment/",
          views.add_comment,
          name="add_comment"),
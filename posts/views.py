@@ -1,89 +1,168 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.functional import lazy
+from django.views.decorators.http import require_POST
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from . import (counters, export, fragments, search as post_search,
+               suggestions, thumbnails, timeline, trending as post_trending)
+from .decorators import image_uploads, query_budget
+from .forms import CommentForm, PostForm, SearchForm
+from .models import Comment, Follow, Group, Post, User
+from .paginators import NEXT, CursorPaginator, paginate
 
+# новые комментарии сверху, как в `Comment.Meta.ordering`; ключ курсора
+# совпадает с индексом comment_post_created_idx
+COMMENT_ORDERING = ('-created', '-id')
 
+
+def _suggestions_signature(request):
+    if not request.user.is_authenticated:
+        return ''
+    return suggestions.signature(request.user)
+
+
+@query_budget(4)
+@fragments.conditional(lambda request: ['global'])
 def index(request):
-    post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'posts/index.html', {'page': page,
-                                                'paginator': paginator,
-                                                'post_list': post_list,
-                                                })
+    post_list = Post.objects.listing().order_by('-pub_date', '-id')
+    paginator, page = paginate(request, post_list)
+    return render(request, 'posts/index.html', {
+        'page': page,
+        'paginator': paginator,
+        'post_list': post_list,
+        **fragments.context(request, 'global'),
+    })
 
 
+@query_budget(5)
+@fragments.conditional(fragments.group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group.all().order_by('-pub_date')
-    post_list = posts
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.group.listing()
+    paginator, page = paginate(request, posts, count=group.posts_count)
 
-    return render(request, 'posts/index.html', {'page': page,
-                                                'paginator': paginator,
-                                                'group': group,
-                                                }
-                  )
+    return render(request, 'posts/index.html', {
+        'page': page,
+        'paginator': paginator,
+        'group': group,
+        **fragments.context(request, f'group:{group.pk}'),
+    })
 
 
 @login_required
+@image_uploads
 def new_post(request):
     if request.method == 'POST':
-        form = PostForm(request.POST, files=request.FILES)
+        form = PostForm(request.POST, files=request.FILES,
+                        upload_errors=request.upload_errors)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            if post.image:
+                thumbnails.schedule(post)
             return redirect(reverse('posts:index'))
         return render(request, 'posts/new_post.html', {'form': form})
     form = PostForm()
     return render(request, 'posts/new_post.html', {'form': form})
 
 
+# +2 на подсказки при промахе кэша: имена авторов и догрузка новых
+# подписок в граф
+@query_budget(8)
+@fragments.conditional(fragments.profile_scopes,
+                       _suggestions_signature)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
     post = Post.objects.filter(author__username=username).all()
-    posts = author.posts.all().order_by('-pub_date')
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'posts/profile.html', {'author': author,
-                                                  'post': post,
-                                                  'page': page,
-                                                  'paginator': paginator
-                                                  })
+    posts = author.posts.listing()
+    paginator, page = paginate(request, posts,
+                               count=counters.for_user(author).posts_count)
+    return render(request, 'posts/profile.html', {
+        'author': author,
+        'post': post,
+        'page': page,
+        'paginator': paginator,
+        'suggestions': (suggestions.for_user(request.user)
+                        if request.user.is_authenticated else []),
+        **fragments.context(request, f'author:{author.pk}'),
+    })
 
 
+@query_budget(6)
+@fragments.conditional(fragments.post_page_scopes)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
-    count = post.author.posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.listing(),
+                             id=post_id, author__username=username)
+    count = counters.for_user(post.author).posts_count
+    post_trending.record_view(post)
+    # первая порция комментариев; остальные подгружает post_comments
+    comments = post.comments.select_related('author').order_by(
+        *COMMENT_ORDERING)[:settings.COMMENTS_PER_PAGE]
+    comments_more = None
+    if post.comments_count > settings.COMMENTS_PER_PAGE:
+        encoder = CursorPaginator(None, settings.COMMENTS_PER_PAGE,
+                                  COMMENT_ORDERING)
+        # ссылка строится после вывода комментариев из уже полученных строк
+        comments_more = lazy(lambda: _comments_url(
+            username, post_id,
+            encoder.encode_cursor(comments[len(comments) - 1], NEXT)),
+            str)()
     form = CommentForm(request.POST or None)
     return render(request, 'posts/post.html', {'post': post,
                                                'author': post.author,
                                                'count': count,
                                                'comments': comments,
+                                               'comments_more': comments_more,
                                                'form': form,
                                                })
 
 
+def _comments_url(username, post_id, cursor):
+    return (reverse('posts:post_comments', args=[username, post_id])
+            + f'?cursor={cursor}')
+
+
+@query_budget(4)
+@fragments.conditional(fragments.post_page_scopes)
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев поста — HTML-фрагмент для
+    подгрузки на странице поста"""
+    if request._fragment_scopes is None:
+        raise Http404
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE, COMMENT_ORDERING)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'includes/comment_list.html', {
+        'comments': page,
+        'comments_more': (_comments_url(username, post_id, page.next_cursor)
+                          if page.has_next() else None),
+    })
+
+
 @login_required
+@image_uploads
 def post_edit(request, username, post_id):
     item = get_object_or_404(Post, author__username=username, id=post_id)
     if request.user != item.author:
         redirect(reverse(
             'posts:post_view', args=[username, post_id]))
-    form = PostForm(request.POST or None, instance=item)
+    form = PostForm(request.POST or None, files=request.FILES or None,
+                    instance=item, upload_errors=request.upload_errors)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            post.thumbnails_ready = False
+            post.image_variants = ''
+        post.save()
+        if image_changed and post.image:
+            thumbnails.schedule(post)
         return redirect(reverse(
             'posts:post_view', args=[username, post_id]))
     return render(request,
@@ -91,6 +170,39 @@ def post_edit(request, username, post_id):
                   {'form': form, 'item': item})
 
 
+@query_budget(6)
+def search(request):
+    """Полнотекстовый поиск по постам и комментариям"""
+    form = SearchForm(request.GET or None)
+    page = None
+    if form.is_valid():
+        paginator = post_search.SearchPaginator(
+            form.cleaned_data['q'],
+            settings.POSTS_PER_PAGE,
+            group=form.cleaned_data['group'],
+            author=form.cleaned_data['author'],
+        )
+        page = paginator.get_page(request.GET.get('cursor'))
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    return render(request, 'posts/search.html', {
+        'form': form,
+        'page': page,
+        'query_string': query.urlencode() + '&' if query else '',
+    })
+
+
+@query_budget(3)
+def trending(request):
+    """Популярные посты: порядок берётся из кэша, посты — одним
+    запросом"""
+    ids = post_trending.top_ids()
+    found = Post.objects.listing().in_bulk(ids)
+    return render(request, 'posts/trending.html', {
+        'posts': [found[post_id] for post_id in ids if post_id in found],
+    })
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -120,12 +232,15 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@query_budget(7)
+@fragments.conditional(
+    lambda request: ['global', f'follow:{request.user.pk}'],
+    _suggestions_signature)
 def follow_index(request):
     """Страница с постами авторов на которые подписан пользователь"""
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = timeline.feed(request.user).listing()
+    paginator, page = paginate(request, posts, timeline.FEED_ORDERING,
+                               count=timeline.feed_size(request.user))
     return render(
         request,
         'posts/follow.html',
@@ -133,6 +248,9 @@ def follow_index(request):
             'post': posts,
             'page': page,
             'paginator': paginator,
+            'suggestions': suggestions.for_user(request.user),
+            **fragments.context(request, 'global',
+                                f'follow:{request.user.pk}'),
         }
     )
 
@@ -154,3 +272,50 @@ def profile_unfollow(request, username):
     currently_user = request.user
     Follow.objects.filter(user=currently_user, author=author).delete()
     return redirect('posts:profile', username=username)
+
+
+@login_required
+@require_POST
+def follow_batch(request):
+    """Подписка и отписка списком: `follow=имя&follow=имя&unfollow=имя`"""
+    to_follow = request.POST.getlist('follow')
+    to_unfollow = request.POST.getlist('unfollow')
+    if len(to_follow) + len(to_unfollow) > settings.FOLLOW_BATCH_LIMIT:
+        return JsonResponse(
+            {'detail': f'Не больше {settings.FOLLOW_BATCH_LIMIT} авторов'},
+            status=400, json_dumps_params={'ensure_ascii': False})
+    followed = Follow.objects.follow_many(request.user, to_follow)
+    unfollowed = Follow.objects.unfollow_many(request.user, to_unfollow)
+    return JsonResponse({'followed': followed, 'unfollowed': unfollowed})
+
+
+def _export(request, posts, filename):
+    data_format = request.GET.get('format')
+    if data_format not in export.FORMATS:
+        data_format = 'jsonl'
+    rows = export.records(posts, images=bool(request.GET.get('images')),
+                          image_url=lambda name: request.build_absolute_uri(
+                              Post._meta.get_field('image').storage.url(name)))
+    response = StreamingHttpResponse(export.render(rows, data_format),
+                                     content_type=export.FORMATS[data_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{data_format}"')
+    return response
+
+
+@login_required
+def profile_export(request, username):
+    """Выгрузка постов автора с комментариями (автору и модераторам)"""
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    return _export(request, author.posts.all(), author.username)
+
+
+@login_required
+def group_export(request, slug):
+    """Выгрузка постов группы с комментариями (модераторам)"""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    group = get_object_or_404(Group, slug=slug)
+    return _export(request, group.group.all(), group.slug)
@@ -0,0 +1,337 @@
+"""Общий для всех процессов кэш в файле SQLite.
+
+`LocMemCache` живёт в памяти одного процесса: у N воркеров gunicorn
+получается N независимых кэшей, а сброс поколения фрагментов доходит
+только до одного из них. Этот бэкенд хранит записи в одном файле SQLite,
+который разделяют все процессы на машине, и не требует внешних сервисов.
+
+Каждая запись — отдельная транзакция, поэтому читатель никогда не видит
+частично записанное значение; `incr` выполняется внутри
+`BEGIN IMMEDIATE` и атомарен между процессами. Размер хранилища
+ограничен `MAX_ENTRIES` и `MAX_SIZE` (байты): число и размер записей
+поддерживают триггеры в таблице `stats`, и раз в `CULL_EVERY` записей
+процесс сверяется с ней и при превышении удаляет просроченные записи,
+затем давно не читанные. LRU приближённый: чтение не пишет в файл, а
+запоминает время в памяти потока (не чаще раза в `ACCESS_RESOLUTION`
+секунд на ключ); накопленное записывается вместе со следующей записью
+или пачкой по `ACCESS_BATCH` ключей.
+
+`clear()` удаляет только ключи своего префикса (`KEY_PREFIX` и, с
+`database_key`, своей базы), а не весь общий файл.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'KEY_FUNCTION': 'yatube.cache.database_key',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_SIZE': 256 * 2 ** 20},
+        }
+    }
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, '
+    'accessed REAL NOT NULL, size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS namespaces ('
+    'name TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS stats ('
+    'id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER NOT NULL, '
+    'size INTEGER NOT NULL)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN '
+    'UPDATE stats SET entries = entries + 1, size = size + new.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN '
+    'UPDATE stats SET entries = entries - 1, size = size - old.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_resize AFTER UPDATE OF size ON cache '
+    'BEGIN UPDATE stats SET size = size - old.size + new.size; END',
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+
+
+def database_key(key, key_prefix, version):
+    """KEY_FUNCTION, разделяющий кэш разных баз данных.
+
+    Файл кэша общий для всех процессов машины, в том числе для тестов с
+    их временной базой; содержимое кэша выводится из базы, поэтому в ключ
+    добавляется отпечаток её имени.
+    """
+    from django.db import connections
+    name = str(connections['default'].settings_dict['NAME'])
+    database = hashlib.md5(name.encode()).hexdigest()[:8]
+    return f'{key_prefix}:{database}:{version}:{key}'
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 2 ** 20))
+        self._access_resolution = float(options.get('ACCESS_RESOLUTION', 10))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._access_batch = int(options.get('ACCESS_BATCH', 100))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        """Соединение своё у каждого потока и каждого процесса (в том
+        числе после fork)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path,
+                                         timeout=self._busy_timeout,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with self._transaction(connection):
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                if connection.execute(
+                        'SELECT 1 FROM stats').fetchone() is None:
+                    # новый файл или созданный до появления stats:
+                    # полный подсчёт только один раз
+                    connection.execute(
+                        'INSERT INTO stats (id, entries, size) '
+                        'SELECT 1, COUNT(*), COALESCE(SUM(size), 0) '
+                        'FROM cache')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+            # ключ -> время чтения, ещё не записанное в файл
+            self._local.accessed = {}
+        return connection
+
+    @staticmethod
+    @contextmanager
+    def _transaction(connection):
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _flush_accesses(self):
+        """Записывает накопленные времена чтения; вызывается внутри
+        пишущей транзакции."""
+        accessed = self._local.accessed
+        if accessed:
+            self._connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(moment, key) for key, moment in accessed.items()])
+            accessed.clear()
+
+    def _write(self, sql, params=()):
+        return self._connection.execute(sql, params).rowcount
+
+    def _store(self, key, value, timeout, replace):
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        now = time.time()
+        connection = self._connection
+        with self._transaction(connection):
+            if not replace:
+                exists = connection.execute(
+                    f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+                    (key, now)).fetchone()
+                if exists:
+                    return False
+            self._flush_accesses()
+            # UPSERT, а не INSERT OR REPLACE: замена через REPLACE не
+            # вызывает триггер удаления, и stats бы разошлась
+            connection.execute(
+                'INSERT INTO cache (key, value, expires, accessed, size) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires, '
+                'accessed = excluded.accessed, size = excluded.size',
+                (key, pickled, self.get_backend_timeout(timeout), now,
+                 len(key) + len(pickled)))
+        self._maybe_cull()
+        return True
+
+    def _maybe_cull(self):
+        self._local.writes += 1
+        if self._local.writes % self._cull_every == 0:
+            self.cull()
+
+    def _stats(self):
+        return self._connection.execute(
+            'SELECT entries, size FROM stats').fetchone()
+
+    def _over_limit(self, entries, size):
+        return entries > self._max_entries or size > self._max_size
+
+    def cull(self):
+        """Если хранилище больше MAX_ENTRIES или MAX_SIZE, удаляет
+        просроченные записи, затем самые давно читанные."""
+        if not self._over_limit(*self._stats()):
+            return
+        connection = self._connection
+        with self._transaction(connection):
+            self._flush_accesses()
+            connection.execute('DELETE FROM cache WHERE expires <= ?',
+                               (time.time(),))
+            entries, size = self._stats()
+            while self._over_limit(entries, size):
+                batch = max(entries // max(self._cull_frequency, 1), 1)
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                    (batch,))
+                entries, size = self._stats()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._store(key, value, timeout, replace=False)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store(key, value, timeout, replace=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        row = self._connection.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? AND {ALIVE}',
+            (key, now)).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        pending = self._local.accessed
+        if now - pending.get(key, accessed) > self._access_resolution:
+            pending[key] = now
+            if len(pending) >= self._access_batch:
+                with self._transaction(self._connection):
+                    self._flush_accesses()
+        return pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        mapping = {self.make_key(key, version=version): key for key in keys}
+        for key in mapping:
+            self.validate_key(key)
+        if not mapping:
+            return {}
+        placeholders = ', '.join('?' * len(mapping))
+        rows = self._connection.execute(
+            f'SELECT key, value FROM cache '
+            f'WHERE key IN ({placeholders}) AND {ALIVE}',
+            (*mapping, time.time())).fetchall()
+        return {mapping[key]: pickle.loads(value) for key, value in rows}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        return bool(self._write(
+            f'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), now, key, now)))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._write(f'DELETE FROM cache WHERE key IN ({placeholders})',
+                        keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно между процессами: чтение и запись идут в одной
+        транзакции BEGIN IMMEDIATE."""
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection
+        with self._transaction(connection):
+            row = connection.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            pickled = pickle.dumps(value, self.pickle_protocol)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (pickled, len(key) + len(pickled), key))
+        return value
+
+    def _key_prefix(self):
+        """Общее начало всех ключей этого кэша: часть, которую
+        KEY_FUNCTION строит не из самого ключа и не из версии."""
+        return os.path.commonprefix([self.make_key('a', version=1),
+                                     self.make_key('b', version=2)])
+
+    def clear(self):
+        """Удаляет ключи только этого кэша: файл общий для всех процессов
+        и баз. Версии пространств имён остаются — они лишь растут."""
+        prefix = self._key_prefix()
+        if not prefix:
+            self._write('DELETE FROM cache')
+            return
+        # диапазон по первичному ключу вместо LIKE: идёт по индексу
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        self._write('DELETE FROM cache WHERE key >= ? AND key < ?',
+                    (prefix, upper))
+
+    def close(self, **kwargs):
+        # соединения живут всё время жизни потока: открывать файл и
+        # проверять схему на каждый запрос слишком дорого
+        pass
+
+    def namespace_version(self, namespace):
+        """Текущая версия пространства имён (начинается с 1)."""
+        row = self._connection.execute(
+            'SELECT version FROM namespaces WHERE name = ?',
+            (namespace,)).fetchone()
+        return 1 if row is None else row[0]
+
+    def incr_namespace(self, namespace):
+        """Делает недействительными все ключи пространства имён разом:
+        ключи из `namespaced_key` содержат его версию."""
+        connection = self._connection
+        with self._transaction(connection):
+            connection.execute(
+                'INSERT INTO namespaces (name, version) VALUES (?, 2) '
+                'ON CONFLICT(name) DO UPDATE SET version = version + 1',
+                (namespace,))
+            version = connection.execute(
+                'SELECT version FROM namespaces WHERE name = ?',
+                (namespace,)).fetchone()[0]
+        return version
+
+    def namespaced_key(self, namespace, key):
+        return f'{namespace}:{self.namespace_version(namespace)}:{key}'
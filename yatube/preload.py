@@ -0,0 +1,50 @@
+"""Предварительная компиляция шаблонов при старте процесса."""
+import logging
+import os
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+
+def _dirs(loaders):
+    for loader in loaders:
+        # кэширующий загрузчик оборачивает другие
+        nested = getattr(loader, 'loaders', None)
+        if nested is not None:
+            yield from _dirs(nested)
+        elif hasattr(loader, 'get_dirs'):
+            yield from loader.get_dirs()
+
+
+def template_names(engine):
+    """Имена всех .html-шаблонов, доступных загрузчикам движка."""
+    names = set()
+    for directory in _dirs(engine.template_loaders):
+        directory = str(directory)
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith('.html'):
+                    path = os.path.relpath(os.path.join(root, filename),
+                                           directory)
+                    names.add(path.replace(os.sep, '/'))
+    return sorted(names)
+
+
+def templates():
+    """Компилирует все шаблоны Django-движков; с кэширующим загрузчиком
+    они остаются в памяти процесса. Возвращает число шаблонов."""
+    total = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in template_names(backend.engine):
+            try:
+                backend.engine.get_template(name)
+            except TemplateSyntaxError as error:
+                # например, шаблон стороннего приложения без его тегов
+                logger.warning('Шаблон %s не скомпилирован: %s', name, error)
+            else:
+                total += 1
+    return total
@@ -62,7 +62,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': ['templates'],
+        # абсолютный путь: поиск шаблонов не зависит от рабочего каталога
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -79,6 +80,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+# компилировать все шаблоны при старте воркера (см. settings_production)
+TEMPLATES_PRELOAD = False
 
 
 # Database
@@ -116,12 +119,23 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# общий для всех воркеров кэш в файле SQLite (см. yatube/cache.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'KEY_FUNCTION': 'yatube.cache.database_key',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 2 ** 20,
+        },
     }
 }
 
+# фрагменты лент сбрасываются сигналами при изменении содержимого,
+# поэтому могут жить долго
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
@@ -161,6 +175,72 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 POSTS_PER_PAGE = 10
+# комментариев на странице поста и в каждой подгружаемой порции
+COMMENTS_PER_PAGE = 20
+# номера страниц (?page=N) доступны только для первых страниц ленты,
+# дальше навигация идёт по курсору (?cursor=...)
+PAGINATOR_MAX_PAGE = 10
+# наибольший ?limit= страницы JSON API
+API_MAX_PAGE_SIZE = 100
+
+# Лента подписок: у авторов с большим числом подписчиков посты не
+# раскладываются по лентам при публикации, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# сколько последних постов автора попадает в ленту сразу после подписки
+TIMELINE_BACKFILL_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_CACHE_TIMEOUT = 60 * 5
+# наибольшее число авторов в одном запросе /follow/batch/
+FOLLOW_BATCH_LIMIT = 100
+
+# Подсказки «кого почитать»: граф подписок в памяти процесса
+SUGGESTIONS_LIMIT = 5
+SUGGESTIONS_CACHE_TIMEOUT = 60 * 10
+# граф целиком строит `manage.py build_suggestions` (по cron) в этот
+# файл; отписки в других процессах видны после очередного запуска
+SUGGESTIONS_GRAPH_PATH = os.path.join(BASE_DIR, 'suggestions.npz')
+# как часто догружать новые подписки и проверять файл графа
+SUGGESTIONS_REFRESH_INTERVAL = 60
+# после стольких дельт они вливаются в CSR
+SUGGESTIONS_COMPACT_EDGES = 10000
+
+# Популярное: комментарии и просмотры, затухающие со временем;
+# просмотры вливаются в счёт командой update_trending (раз в несколько
+# минут по cron)
+TRENDING_HALF_LIFE = 60 * 60 * 6
+TRENDING_WINDOW = 60 * 60 * 24 * 3
+TRENDING_COMMENT_WEIGHT = 5.0
+TRENDING_VIEW_WEIGHT = 1.0
+TRENDING_TOP_K = 50
+# просмотры копятся в памяти процесса и переносятся в кэш пачкой
+TRENDING_VIEW_BATCH = 100
+TRENDING_VIEW_FLUSH = 10
+
+# Варианты картинок постов строятся в фоновом пуле потоков после загрузки.
+# Адаптивные варианты для <picture>/srcset: ширины, пропорция карточки и
+# форматы в порядке предпочтения (недоступные в Pillow пропускаются);
+# запасной <img> всегда JPEG
+POST_IMAGE_WIDTHS = [320, 640, 960, 1920]
+POST_IMAGE_RATIO = 339 / 960
+POST_IMAGE_FORMATS = ['AVIF', 'WEBP']
+# 0 — строить варианты синхронно после фиксации транзакции
+POST_THUMBNAIL_WORKERS = 2
+# ограничения загрузки картинок: проверяются по мере приёма файла и по
+# заголовку картинки, до её декодирования
+POST_IMAGE_MAX_BYTES = 10 * 2 ** 20
+POST_IMAGE_MAX_PIXELS = 40_000_000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # статистика загрузок (posts.uploads) и ошибки фоновых задач
+        'posts': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -0,0 +1,42 @@
+"""Настройки для боевого запуска:
+DJANGO_SETTINGS_MODULE=yatube.settings_production.
+
+Шаблоны читаются кэширующим загрузчиком (каждый файл компилируется один
+раз на процесс) и компилируются заранее при старте воркера, поэтому
+первый запрос к странице не платит за разбор шаблонов.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import ALLOWED_HOSTS, TEMPLATES
+
+DEBUG = False
+
+# ключ из settings.py лежит в репозитории: в бою без своего не стартуем
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured(
+        'Задайте DJANGO_SECRET_KEY для боевых настроек.')
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', ','.join(
+    ALLOWED_HOSTS)).split(',')
+
+# APP_DIRS нельзя сочетать с явным списком загрузчиков
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# вызывается из yatube/wsgi.py; с `gunicorn --preload` шаблоны
+# компилируются один раз в мастер-процессе до форка воркеров
+TEMPLATES_PRELOAD = True
@@ -31,6 +31,8 @@ urlpatterns = [
     #  если нужного шаблона для /auth не нашлось в файле users.urls —
     #  ищем совпадения в файле django.contrib.auth.urls
 
+    # JSON API только для чтения
+    path("api/v1/", include("posts.api_urls", namespace='api')),
     # импорт правил из приложения posts
     path("", include("posts.urls", namespace='posts')),
     # импорт правил из приложения admin